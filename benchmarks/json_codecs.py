@@ -0,0 +1,95 @@
+"""Compare the JSON codecs of epg_json on a real or generated XStream list.
+
+Usage:
+    python benchmarks/json_codecs.py [xstream.json] [--repeat N]
+    python benchmarks/json_codecs.py --generate 200000
+
+Without a file a synthetic get_vod_streams-style list is generated. Times
+per codec (best of N): load (parse the file bytes, as load_last_cache and
+the XStream fetch do), persist (compact write, as last_xstream.json and
+export_xstream) and the indented export (export_xstream?pretty=1). Checks
+that every codec loads the same data. The codec can be forced with
+EPG_JSON_CODEC=<name>.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from epg_json import JSON_CODEC, available_json_codecs, json_loads, write_json_file  # noqa: E402
+
+
+def generate_xstream(count):
+    return [{
+        'num': i + 1,
+        'name': f'DE: Film {i} – Über den Wolken ({1950 + i % 70})',
+        'stream_type': 'movie',
+        'stream_id': 100000 + i,
+        'stream_icon': f'http://example.com/images/{i}.jpg',
+        'rating': f'{i % 10}.{i % 7}',
+        'rating_5based': (i % 50) / 10,
+        'added': str(1700000000 + i),
+        'is_adult': 0,
+        'category_id': str(i % 300),
+        'category_ids': [i % 300],
+        'container_extension': 'mkv',
+        'custom_sid': None,
+        'direct_source': '',
+    } for i in range(count)]
+
+
+def best_of(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('path', nargs='?', help='XStream JSON list (e.g. data/epg_cache/last_xstream.json)')
+    ap.add_argument('--repeat', type=int, default=3, help='runs per codec and operation, best time counts')
+    ap.add_argument('--generate', type=int, default=200000, help='synthetic entries if no file is given')
+    args = ap.parse_args()
+
+    fd, out = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    path = args.path
+    tmp = None
+    try:
+        if not path:
+            fd, tmp = tempfile.mkstemp(suffix='.json')
+            os.close(fd)
+            write_json_file(tmp, generate_xstream(args.generate), codec='stdlib')
+            path = tmp
+        with open(path, 'rb') as f:
+            raw = f.read()
+        mb = len(raw) / (1024 * 1024)
+        print(f'{path}: {mb:.1f} MB JSON, default codec: {JSON_CODEC}')
+        reference = None
+        for codec in available_json_codecs():
+            data = json_loads(raw, codec)
+            load = best_of(args.repeat, lambda: json_loads(raw, codec))
+            persist = best_of(args.repeat, lambda: write_json_file(out, data, codec=codec))
+            pretty = best_of(args.repeat, lambda: write_json_file(out, data, indent=True, codec=codec))
+            same = ''
+            if reference is None:
+                reference = data
+            elif data != reference:
+                same = '  RESULT DIFFERS'
+            print(f'{codec:6s} load {load:6.2f}s ({mb / load:6.1f} MB/s)  persist {persist:6.2f}s  '
+                  f'export indented {pretty:6.2f}s  {len(data)} entries{same}')
+    finally:
+        os.remove(out)
+        if tmp:
+            os.remove(tmp)
+
+
+if __name__ == '__main__':
+    main()
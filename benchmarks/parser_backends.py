@@ -0,0 +1,90 @@
+"""Compare the XMLTV parser backends of epg_utils on a real or generated EPG file.
+
+Usage:
+    python benchmarks/parser_backends.py [EPG.xml[.gz]] [--repeat N]
+    python benchmarks/parser_backends.py --generate 1000x300
+
+Without a file a synthetic XMLTV (channels x programmes per channel) is
+generated into a temp file. Reports the best time and MB/s (decompressed
+XML) per backend and checks that all backends return the same result.
+The fastest backend can be forced with EPG_PARSER_BACKEND=<name>.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from epg_utils import PARSER_BACKEND, available_parser_backends, open_xml_file, parse_xmltv  # noqa: E402
+
+
+def generate_xmltv(path, channels, programmes):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="benchmark">\n')
+        for c in range(channels):
+            f.write(f'  <channel id="kanal{c}.de"><display-name lang="de">Kanal {c}</display-name>'
+                    f'<icon src="http://example.com/{c}.png"/></channel>\n')
+        for c in range(channels):
+            for p in range(programmes):
+                day, hour = divmod(p, 24)
+                f.write(f'  <programme start="202601{day + 1:02d}{hour:02d}0000 +0100" '
+                        f'stop="202601{day + 1:02d}{hour:02d}5900 +0100" channel="kanal{c}.de">'
+                        f'<title lang="de">Sendung {p}</title>'
+                        f'<desc lang="de">Beschreibung von Sendung {p} auf Kanal {c} &amp; mehr Text mit Umlauten äöü.</desc>'
+                        f'<category lang="de">Serie</category></programme>\n')
+        f.write('</tv>\n')
+
+
+def xml_size(path):
+    size = 0
+    with open_xml_file(path) as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                return size
+            size += len(chunk)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('path', nargs='?', help='XMLTV file (plain or gzip)')
+    ap.add_argument('--repeat', type=int, default=3, help='runs per backend, best time counts')
+    ap.add_argument('--generate', default='1000x300', help='synthetic size CHANNELSxPROGRAMMES if no file is given')
+    args = ap.parse_args()
+
+    path = args.path
+    tmp = None
+    if not path:
+        channels, programmes = (int(x) for x in args.generate.lower().split('x'))
+        fd, tmp = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+        generate_xmltv(tmp, channels, programmes)
+        path = tmp
+    try:
+        mb = xml_size(path) / (1024 * 1024)
+        print(f'{path}: {mb:.1f} MB XML, default backend: {PARSER_BACKEND}')
+        reference = None
+        for backend in available_parser_backends():
+            best = None
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                result = parse_xmltv(path, backend=backend)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            same = ''
+            if reference is None:
+                reference = result
+            elif (result['channels'], result['counts'], result['stats']) != \
+                    (reference['channels'], reference['counts'], reference['stats']):
+                same = '  RESULT DIFFERS'
+            print(f'{backend:6s} {best:7.2f}s {mb / best:7.1f} MB/s  '
+                  f'{result["stats"]["programmes"]} programmes{same}')
+    finally:
+        if tmp:
+            os.remove(tmp)
+
+
+if __name__ == '__main__':
+    main()
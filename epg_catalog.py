@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+from epg_utils import read_snapshot
+
+
+# -----------------------------
+# EPG cache catalog (SQLite)
+# -----------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    sha256 TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    source_url TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    stats TEXT,
+    created TEXT NOT NULL,
+    last_access REAL
+);
+CREATE INDEX IF NOT EXISTS idx_files_path ON files (path);
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256);
+CREATE INDEX IF NOT EXISTS idx_files_created ON files (created);
+CREATE TABLE IF NOT EXISTS sources (
+    key TEXT PRIMARY KEY,
+    url TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    sha256 TEXT,
+    is_gz INTEGER NOT NULL DEFAULT 0,
+    filename TEXT,
+    path TEXT,
+    updated TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sources_path ON sources (path);
+"""
+
+# Fetch state columns of `sources` besides key/url/updated
+SOURCE_FIELDS = ('etag', 'last_modified', 'sha256', 'is_gz', 'filename', 'path')
+
+# Query parameters whose values are not stored (XStream xmltv.php URLs carry credentials)
+SECRET_PARAMS = re.compile(r'(?i)([?&](?:password|pass|pwd|token|key)=)[^&#]*')
+
+
+def source_key(url: str) -> str:
+    """Catalog key for a source URL (hashed, so credentials in the URL are not stored)."""
+    return hashlib.sha256((url or '').encode('utf-8')).hexdigest()
+
+
+def redact_url(url: str):
+    """`url` with secret query parameter values replaced by '***', for display."""
+    return SECRET_PARAMS.sub(r'\1***', url) if url else url
+
+
+def _file_row(row) -> dict:
+    entry = dict(row)
+    entry['stats'] = json.loads(entry['stats']) if entry['stats'] else None
+    return entry
+
+
+class CacheCatalog:
+    """Catalog of the cached EPG files and per-URL fetch states in a SQLite database.
+
+    Every call opens its own connection (WAL journal, busy timeout), so
+    concurrent requests, jobs and processes can use it; read-modify-write
+    steps run in one IMMEDIATE transaction. Files are looked up by name,
+    path and content hash through indexes.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _write(self, fn):
+        """Run `fn(conn)` in an IMMEDIATE transaction (one writer at a time) and return its result."""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+        finally:
+            conn.close()
+
+    def _read(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    # Files
+
+    def add(self, filename: str, path: str, sha256: str = None, source_url: str = None,
+            etag: str = None, last_modified: str = None, stats: dict = None) -> str:
+        """Register a cached file. Returns the name it is cached under.
+
+        With `sha256` an entry already holding that content at `path` is
+        reused (its name is returned) instead of adding a second name for it.
+        """
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+
+        def add_entry(conn):
+            if sha256:
+                row = conn.execute('SELECT filename FROM files WHERE sha256 = ? AND path = ? LIMIT 1',
+                                   (sha256, path)).fetchone()
+                if row:
+                    return row['filename']
+            conn.execute(
+                'INSERT OR REPLACE INTO files (filename, path, sha256, size, source_url, etag, last_modified, '
+                'stats, created, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (filename, path, sha256, size, redact_url(source_url), etag, last_modified,
+                 json.dumps(stats, ensure_ascii=False) if stats else None,
+                 datetime.now().isoformat(), time.time()))
+            return filename
+
+        return self._write(add_entry)
+
+    def get(self, filename: str):
+        """Return the entry of a cached file (dict with all columns) or None."""
+        rows = self._read('SELECT * FROM files WHERE filename = ?', (filename,))
+        return _file_row(rows[0]) if rows else None
+
+    def list(self):
+        """Return all entries, newest first."""
+        return [_file_row(row) for row in self._read('SELECT * FROM files ORDER BY created DESC')]
+
+    def paths(self):
+        """Return the distinct paths of all cached files."""
+        return [row['path'] for row in self._read('SELECT DISTINCT path FROM files')]
+
+    def set_stats(self, filename: str, stats: dict):
+        self._write(lambda conn: conn.execute('UPDATE files SET stats = ? WHERE filename = ?',
+                                              (json.dumps(stats, ensure_ascii=False), filename)))
+
+    def touch(self, path: str):
+        """Record an access to the file(s) stored at `path`."""
+        self._write(lambda conn: conn.execute('UPDATE files SET last_access = ? WHERE path = ?',
+                                              (time.time(), path)))
+
+    def remove(self, filename: str):
+        """Remove an entry. Returns (entry, number of other entries sharing its path) or (None, 0)."""
+        def remove_entry(conn):
+            row = conn.execute('SELECT * FROM files WHERE filename = ?', (filename,)).fetchone()
+            if row is None:
+                return None, 0
+            conn.execute('DELETE FROM files WHERE filename = ?', (filename,))
+            shared = conn.execute('SELECT COUNT(*) FROM files WHERE path = ?', (row['path'],)).fetchone()[0]
+            return _file_row(row), shared
+
+        return self._write(remove_entry)
+
+    def remove_paths(self, paths) -> list:
+        """Drop the file entries and fetch states of the given paths. Returns the removed filenames."""
+        paths = list(paths)
+
+        def remove_entries(conn):
+            removed = []
+            for path in paths:
+                removed.extend(row['filename'] for row in
+                               conn.execute('SELECT filename FROM files WHERE path = ?', (path,)))
+                conn.execute('DELETE FROM files WHERE path = ?', (path,))
+                conn.execute('DELETE FROM sources WHERE path = ?', (path,))
+            return removed
+
+        return self._write(remove_entries)
+
+    # Fetch states
+
+    def get_source(self, url: str) -> dict:
+        """Return the stored fetch state (etag, last_modified, sha256, is_gz, filename, path) of a URL."""
+        rows = self._read('SELECT * FROM sources WHERE key = ?', (source_key(url),))
+        if not rows:
+            return {}
+        state = dict(rows[0])
+        state['is_gz'] = bool(state['is_gz'])
+        return state
+
+    def set_source(self, url: str, state: dict):
+        """Store the fetch state of a URL (not rewritten if unchanged)."""
+        values = tuple(state.get(field) for field in SOURCE_FIELDS)
+
+        def store(conn):
+            row = conn.execute(f"SELECT {', '.join(SOURCE_FIELDS)} FROM sources WHERE key = ?",
+                               (source_key(url),)).fetchone()
+            if row and tuple(row) == tuple(int(v) if isinstance(v, bool) else v for v in values):
+                return
+            conn.execute(
+                f"INSERT OR REPLACE INTO sources (key, url, {', '.join(SOURCE_FIELDS)}, updated) "
+                f"VALUES (?, ?, {', '.join('?' * len(SOURCE_FIELDS))}, ?)",
+                (source_key(url), redact_url(url)) + values + (datetime.now().isoformat(),))
+
+        self._write(store)
+
+    # Migration
+
+    def import_metadata(self, metadata_file: str) -> int:
+        """Take over the entries of an old metadata.json and rename it to `*.migrated`.
+
+        Parse stats come from the files' snapshots. Returns the number of
+        imported files; existing catalog entries win.
+        """
+        if not os.path.exists(metadata_file):
+            return 0
+        try:
+            with open(metadata_file, 'r', encoding='utf-8') as f:
+                metadata = json.load(f) or {}
+        except (OSError, ValueError):
+            metadata = {}
+        files = metadata.get('files') or {}
+        sources = metadata.get('sources') or {}
+
+        def import_entries(conn):
+            for filename, info in files.items():
+                path = info.get('path') or ''
+                snapshot = read_snapshot(path) or {}
+                conn.execute(
+                    'INSERT OR IGNORE INTO files (filename, path, sha256, size, stats, created, last_access) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (filename, path, info.get('sha256') or snapshot.get('xml_sha256'), info.get('size', 0),
+                     json.dumps(snapshot['stats'], ensure_ascii=False) if snapshot.get('stats') else None,
+                     info.get('created') or datetime.now().isoformat(), None))
+            for key, state in sources.items():
+                conn.execute(
+                    f"INSERT OR IGNORE INTO sources (key, {', '.join(SOURCE_FIELDS)}, updated) "
+                    f"VALUES (?, {', '.join('?' * len(SOURCE_FIELDS))}, ?)",
+                    (key,) + tuple(int(bool(state.get(f))) if f == 'is_gz' else state.get(f) for f in SOURCE_FIELDS)
+                    + (state.get('updated'),))
+
+        self._write(import_entries)
+        os.replace(metadata_file, metadata_file + '.migrated')
+        return len(files)
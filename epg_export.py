@@ -0,0 +1,84 @@
+import copy
+import zlib
+import xml.etree.ElementTree as ET
+
+from epg_merge import iter_top_level, serialize_element
+
+
+# -----------------------------
+# Filtered XMLTV export (streamed)
+# -----------------------------
+
+EXPORT_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="EpgChecker export">\n'
+EXPORT_FOOTER = b'</tv>\n'
+EXPORT_BUFFER = 64 * 1024  # Output is yielded in pieces of about this size
+
+
+def _channel_key(value) -> str:
+    return (value or '').strip().lower()
+
+
+def _rename_channel(elem, channel_id, name):
+    elem.set('id', channel_id)
+    if name is None:
+        return
+    names = elem.findall('display-name')
+    if not names:
+        names = [ET.Element('display-name')]
+        elem.insert(0, names[0])
+    names[0].text = name
+    names[0].attrib.pop('lang', None)
+    # The other display-names are the source's names for the channel
+    for extra in names[1:]:
+        elem.remove(extra)
+
+
+def iter_filtered_xmltv(path: str, targets: dict):
+    """Yield a new XMLTV document (UTF-8 bytes) with only the channels in `targets`.
+
+    `targets` maps source channel id (lower) -> list of (channel_id,
+    display_name) to write it as; None keeps the source's id or names. A
+    source channel listed several times is written once per target, each
+    with its own copy of the programmes. `path` (plain or gzip) is read
+    element by element, so memory use does not depend on its size.
+    """
+    buf = [EXPORT_HEADER]
+    size = len(EXPORT_HEADER)
+    for elem in iter_top_level(path):
+        if elem.tag == 'channel':
+            wanted = targets.get(_channel_key(elem.get('id')))
+        elif elem.tag == 'programme':
+            wanted = targets.get(_channel_key(elem.get('channel')))
+        else:
+            continue
+        if not wanted:
+            continue
+        source_id = elem.get('id') if elem.tag == 'channel' else elem.get('channel')
+        for channel_id, name in wanted:
+            channel_id = channel_id if channel_id is not None else source_id
+            if elem.tag == 'channel':
+                # Each target renames its own copy of the channel element
+                target = copy.deepcopy(elem) if len(wanted) > 1 else elem
+                _rename_channel(target, channel_id, name)
+                data = serialize_element(target)
+            else:
+                elem.set('channel', channel_id)
+                data = serialize_element(elem)
+            buf.append(data)
+            size += len(data)
+        if size >= EXPORT_BUFFER:
+            yield b''.join(buf)
+            buf = []
+            size = 0
+    buf.append(EXPORT_FOOTER)
+    yield b''.join(buf)
+
+
+def gzip_chunks(chunks, level: int = 6):
+    """Compress a stream of byte chunks into a gzip stream on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,78 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# -----------------------------
+# Pre-serialized JSON responses
+# -----------------------------
+
+GZIP_MIN_SIZE = 1024  # Smaller bodies are not worth compressing
+GZIP_LEVEL = 6
+
+
+class CachedBody:
+    """One serialized response: identity and gzip bytes, strong ETag (hash of the identity body)."""
+
+    __slots__ = ('body', 'gzip', 'etag', 'size')
+
+    def __init__(self, body: bytes, level: int = GZIP_LEVEL):
+        self.body = body
+        self.gzip = gzip.compress(body, level) if len(body) >= GZIP_MIN_SIZE else None
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.size = len(body) + (len(self.gzip) if self.gzip else 0)
+
+    def variant(self, accepts_gzip: bool):
+        """(bytes, ETag, content coding or None) to send; the gzip form has its own ETag."""
+        if accepts_gzip and self.gzip is not None:
+            return self.gzip, self.etag + '-gz', 'gzip'
+        return self.body, self.etag, None
+
+
+class JsonResponseCache:
+    """Serialized JSON responses per (key, state version), least recently used dropped first.
+
+    `get(key, version, build)` serializes the object of `build()` with
+    `dumps` only if that key has no body for this version yet; any state
+    change bumps the version, so stale bodies are never served. `build()`
+    returns `(version, obj)`: the body is stored under the version it was
+    actually built from. Bounded by `max_bytes`.
+    """
+
+    def __init__(self, dumps, max_bytes: int = 64 * 1024 * 1024):
+        self.dumps = dumps
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (version, CachedBody)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, version: int, build) -> CachedBody:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] == version:
+                self._entries.move_to_end(key)
+                return cached[1]
+        # Serialized outside the lock; at worst two requests build the same body
+        version, obj = build()
+        data = self.dumps(obj)
+        entry = CachedBody(data.encode('utf-8') if isinstance(data, str) else data)
+        with self._lock:
+            old = self._entries.get(key)
+            if old and old[0] > version:
+                return entry  # A newer body was stored meanwhile
+            if old:
+                del self._entries[key]
+                self._size -= old[1].size
+            if entry.size <= self.max_bytes:
+                self._entries[key] = (version, entry)
+                self._size += entry.size
+                while self._size > self.max_bytes:
+                    _, (_, dropped) = self._entries.popitem(last=False)
+                    self._size -= dropped.size
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -0,0 +1,281 @@
+import os
+import shutil
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+from epg_utils import parse_xmltv_time, iter_file_chunks, open_xml_file
+from epg_parallel import use_parallel, plan_ranges, run_ranges, iter_range, PARSE_WORKERS
+
+
+# -----------------------------
+# On-disk programme index (SQLite)
+# -----------------------------
+
+BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS programmes (
+    channel TEXT NOT NULL,
+    start_ts INTEGER,
+    stop_ts INTEGER,
+    start TEXT,
+    stop TEXT,
+    title TEXT,
+    desc TEXT
+);
+"""
+
+# Created after the bulk insert, which is much faster than maintaining it row by row
+INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_programmes_channel_start ON programmes (channel, start_ts)"
+
+
+class _ProgrammeCollector:
+    """ET.XMLParser target callbacks turning <programme> elements into index rows.
+
+    With `channels` (set of channel ids, lower) only programmes of those are collected.
+    """
+
+    def __init__(self, on_batch, channels=None):
+        self.on_batch = on_batch
+        self.channels = channels
+        self.rows = []
+        self.total = 0
+        self._prog = None  # [channel, start_ts, stop_ts, start, stop, title, desc]
+        self._field = None  # 5 = title, 6 = desc
+        self._text = None
+
+    def start(self, tag, attrib):
+        if tag == 'programme':
+            channel = (attrib.get('channel', '') or '').strip().lower()
+            if self.channels is not None and channel not in self.channels:
+                self._prog = None
+                return
+            start = attrib.get('start', '')
+            stop = attrib.get('stop', '')
+            self._prog = [channel, parse_xmltv_time(start), parse_xmltv_time(stop), start, stop, None, None]
+        elif self._prog is not None and tag in ('title', 'desc'):
+            field = 5 if tag == 'title' else 6
+            # Keep the first title/desc only (XMLTV allows one per language)
+            if self._prog[field] is None:
+                self._field = field
+                self._text = []
+
+    def data(self, text):
+        if self._text is not None:
+            self._text.append(text)
+
+    def end(self, tag):
+        if self._field is not None and tag in ('title', 'desc'):
+            self._prog[self._field] = ''.join(self._text).strip()
+            self._field = None
+            self._text = None
+        elif tag == 'programme' and self._prog is not None:
+            prog = self._prog
+            self._prog = None
+            if not prog[0]:
+                return
+            prog[5] = prog[5] or ''
+            prog[6] = prog[6] or ''
+            self.rows.append(prog)
+            self.total += 1
+            if len(self.rows) >= BATCH_SIZE:
+                self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.on_batch(self.rows)
+            self.rows = []
+
+
+def _collect_programmes(chunks, insert, channels=None):
+    """Parse XMLTV chunks and pass programme rows to `insert(rows)` in batches; returns the count."""
+    collector = _ProgrammeCollector(insert, channels)
+    parser = ET.XMLParser(target=SimpleNamespace(
+        start=collector.start, data=collector.data, end=collector.end))
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    collector.flush()
+    return collector.total
+
+
+def _index_range(path, start, end, head, tail, index, part_prefix, channels=None):
+    """Process pool worker: index one byte range of an XMLTV file into its own database."""
+    part_path = f'{part_prefix}{index}'
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    conn = sqlite3.connect(part_path)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.executescript(SCHEMA)
+        total = _collect_programmes(
+            iter_range(path, start, end, head, tail),
+            lambda rows: conn.executemany('INSERT INTO programmes VALUES (?, ?, ?, ?, ?, ?, ?)', rows),
+            channels)
+        conn.commit()
+    finally:
+        conn.close()
+    return total
+
+
+class ProgrammeIndex:
+    """Persistent programme index keyed by channel id and start time.
+
+    The index is tied to an identity string (the loaded EPG's content hash).
+    It is built into a temporary database and moved into place atomically, so
+    readers keep using the previous index until the new one is complete.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._building = None  # identity currently being built
+
+    def _connect(self, path=None):
+        conn = sqlite3.connect(path or self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def identity(self):
+        """Return the identity of the current index, or None if there is none."""
+        if not os.path.exists(self.db_path):
+            return None
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'identity'").fetchone()
+                return row['value'] if row else None
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+
+    def is_current(self, identity: str) -> bool:
+        return bool(identity) and self.identity() == identity
+
+    def build(self, xml_path: str, identity: str, progress=None, channels=None, base: str = None) -> bool:
+        """Index all programmes of `xml_path` (plain or gzip) under `identity`.
+
+        If the current index has identity `base` and `channels` (channel ids,
+        lower) lists every channel whose programmes differ from it, only those
+        are re-indexed on a copy of the current index.
+        `progress(programmes)` is called after every inserted batch, if given.
+        Returns False if the index is already current or another build for the
+        same identity is running, True after a successful build.
+        """
+        with self._lock:
+            if self._building == identity or self.is_current(identity):
+                return False
+            self._building = identity
+        tmp_path = f'{self.db_path}.{identity[:16]}.building'
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            incremental = channels is not None and self.is_current(base)
+            if incremental:
+                channels = set(channels)
+                shutil.copyfile(self.db_path, tmp_path)
+            else:
+                channels = None
+            conn = self._connect(tmp_path)
+            try:
+                conn.execute('PRAGMA journal_mode = OFF')
+                conn.execute('PRAGMA synchronous = OFF')
+                if incremental:
+                    conn.executemany('DELETE FROM programmes WHERE channel = ?', [(c,) for c in channels])
+                else:
+                    conn.executescript(SCHEMA)
+
+                total = None
+                if use_parallel(xml_path):
+                    total = self._build_parallel(conn, xml_path, tmp_path, progress, channels)
+                if total is None:
+                    total = self._build_sequential(conn, xml_path, progress, channels)
+                if incremental:
+                    total = conn.execute('SELECT COUNT(*) FROM programmes').fetchone()[0]
+                conn.execute(INDEX_SQL)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('identity', ?)", (identity,))
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('programmes', ?)", (str(total),))
+                conn.commit()
+            finally:
+                conn.close()
+            os.replace(tmp_path, self.db_path)
+            return True
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            with self._lock:
+                self._building = None
+
+    def _build_sequential(self, conn, xml_path, progress, channels=None):
+        inserted = 0
+
+        def insert(rows):
+            nonlocal inserted
+            conn.executemany('INSERT INTO programmes VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            inserted += len(rows)
+            if progress:
+                progress(inserted)
+
+        with open_xml_file(xml_path) as f:
+            return _collect_programmes(iter_file_chunks(f), insert, channels)
+
+    def _build_parallel(self, conn, xml_path, tmp_path, progress, channels=None):
+        """Index byte ranges on a process pool, then copy the part databases in range order.
+
+        Returns None (nothing inserted) if the file cannot be split or a range fails.
+        """
+        ranges = plan_ranges(xml_path, PARSE_WORKERS)
+        if not ranges:
+            return None
+        part_paths = [f'{tmp_path}.part{i}' for i in range(len(ranges))]
+        try:
+            try:
+                run_ranges(_index_range, xml_path, ranges, f'{tmp_path}.part', channels, workers=PARSE_WORKERS)
+            except Exception:
+                return None
+            total = 0
+            for part_path in part_paths:
+                conn.execute('ATTACH DATABASE ? AS part', (part_path,))
+                total += conn.execute('INSERT INTO programmes SELECT * FROM part.programmes').rowcount
+                conn.commit()
+                conn.execute('DETACH DATABASE part')
+                if progress:
+                    progress(total)
+            return total
+        finally:
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+    def query(self, channel: str, start_ts=None, end_ts=None, offset: int = 0, limit: int = 20):
+        """Return (total, programmes) for a channel id, optionally within [start_ts, end_ts).
+
+        A programme matches the window if it overlaps it. Programmes are ordered
+        by start time; `offset`/`limit` page through the matches.
+        """
+        where = ['channel = ?']
+        params = [(channel or '').strip().lower()]
+        if start_ts is not None:
+            where.append('stop_ts > ?')
+            params.append(start_ts)
+        if end_ts is not None:
+            where.append('start_ts < ?')
+            params.append(end_ts)
+        clause = ' AND '.join(where)
+        conn = self._connect()
+        try:
+            total = conn.execute(f'SELECT COUNT(*) FROM programmes WHERE {clause}', params).fetchone()[0]
+            rows = conn.execute(
+                f'SELECT start, stop, title, desc FROM programmes WHERE {clause} '
+                'ORDER BY start_ts LIMIT ? OFFSET ?',
+                params + [limit, offset]).fetchall()
+        finally:
+            conn.close()
+        return total, [dict(row) for row in rows]
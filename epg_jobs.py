@@ -0,0 +1,175 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+# -----------------------------
+# Background jobs
+# -----------------------------
+
+class JobError(Exception):
+    """Expected job failure with a user-facing message and HTTP-like status."""
+
+    def __init__(self, message: str, status: int = 500):
+        super().__init__(message)
+        self.status = status
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when cancellation was requested."""
+
+
+class Job:
+    """Progress record of a long-running load.
+
+    Job functions report through `update()`; readers poll `to_dict()`.
+    """
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = 'queued'  # queued | running | done | error | cancelled
+        self.phase = 'queued'
+        self.bytes_processed = 0
+        self.bytes_total = None
+        self.programmes = 0
+        self.items_processed = 0
+        self.items_total = None
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._phase_started = self.created
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        """Set progress fields; a new `phase` restarts the ETA clock."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        with self._lock:
+            if 'phase' in fields:
+                self._enter_phase(fields['phase'])
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    def set_phase(self, phase: str):
+        """Enter `phase` without the cancellation check of `update`, for steps that must run to the end."""
+        with self._lock:
+            self._enter_phase(phase)
+            self.phase = phase
+
+    def _enter_phase(self, phase: str):
+        if phase != self.phase:
+            self._phase_started = time.time()
+            self.bytes_processed = 0
+            self.bytes_total = None
+            self.items_processed = 0
+            self.items_total = None
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def eta(self):
+        """Seconds left in the current phase, estimated from byte (or item) throughput, or None."""
+        if self.bytes_total and self.bytes_processed:
+            done, total = self.bytes_processed, self.bytes_total
+        else:
+            done, total = self.items_processed, self.items_total
+        if not total or not done or self.status != 'running':
+            return None
+        elapsed = time.time() - self._phase_started
+        remaining = max(0, total - done)
+        return round(elapsed * remaining / done, 1)
+
+    def to_dict(self, include_result: bool = True):
+        with self._lock:
+            data = {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'phase': self.phase,
+                'bytes_processed': self.bytes_processed,
+                'bytes_total': self.bytes_total,
+                'programmes': self.programmes,
+                'items_processed': self.items_processed,
+                'items_total': self.items_total,
+                'message': self.message,
+                'eta_seconds': self.eta(),
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+                'error': self.error,
+            }
+            if include_result:
+                data['result'] = self.result
+        return data
+
+
+class JobManager:
+    """Runs job functions `fn(job, *args)` on a small worker pool and keeps recent jobs."""
+
+    def __init__(self, max_workers: int = 2, keep: int = 50, logger=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='epg-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._keep = keep
+        self._logger = logger
+
+    def submit(self, kind: str, fn, *args) -> Job:
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created, reverse=True)
+
+    def _run(self, job: Job, fn, args):
+        if job.cancelled:
+            job.status, job.phase, job.finished = 'cancelled', 'cancelled', time.time()
+            return
+        job.started = time.time()
+        job.status = 'running'
+        try:
+            job.result = fn(job, *args)
+            job.status = 'done'
+            job.phase = 'done'
+        except JobCancelled:
+            job.status = 'cancelled'
+            job.phase = 'cancelled'
+        except JobError as e:
+            job.status = 'error'
+            job.error = str(e)
+            job.error_status = e.status
+        except Exception as e:
+            if self._logger:
+                self._logger.exception(f"Job {job.kind} {job.id} failed")
+            job.status = 'error'
+            job.error = str(e)
+            job.error_status = 500
+        finally:
+            job.finished = time.time()
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.finished]
+        if len(self._jobs) <= self._keep or not finished:
+            return
+        finished.sort(key=lambda j: j.finished)
+        for job in finished[:len(self._jobs) - self._keep]:
+            del self._jobs[job.id]
@@ -0,0 +1,142 @@
+import json
+import os
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# -----------------------------
+# JSON codecs
+# -----------------------------
+
+# Preference order of the JSON codecs. XStream lists (get_vod_streams,
+# get_series) reach 100+ MB; orjson parses and writes them several times
+# faster than the stdlib. benchmarks/json_codecs.py compares them.
+JSON_CODECS = ('orjson', 'ujson', 'stdlib')
+
+
+def available_json_codecs():
+    """Return the JSON codecs usable in this environment, in preference order."""
+    usable = {'orjson': orjson is not None, 'ujson': ujson is not None, 'stdlib': True}
+    return [name for name in JSON_CODECS if usable[name]]
+
+
+def select_json_codec(name: str = None) -> str:
+    """Pick the JSON codec: `name` or $EPG_JSON_CODEC if usable, else the best available one."""
+    available = available_json_codecs()
+    name = (name or os.environ.get('EPG_JSON_CODEC') or 'auto').strip().lower()
+    return name if name in available else available[0]
+
+
+JSON_CODEC = select_json_codec()
+
+
+def json_default(obj):
+    """Encode values outside plain JSON (dates, decimals, dataclasses...) like Flask's default provider."""
+    return DefaultJSONProvider.default(obj)
+
+
+def json_dumps(obj, indent: bool = False, sort_keys: bool = False, codec: str = None, default=json_default) -> bytes:
+    """Serialize `obj` to UTF-8 JSON bytes, compact unless `indent` (2 spaces).
+
+    Output matches `json.dumps(obj, ensure_ascii=False)` in content
+    (non-string keys become strings). Values a fast codec cannot encode
+    (e.g. integers beyond 64 bit) fall back to the stdlib.
+    """
+    codec = codec or JSON_CODEC
+    if codec == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except TypeError:
+            pass
+    elif codec == 'ujson':
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, indent=2 if indent else 0,
+                               sort_keys=sort_keys, default=default).encode('utf-8')
+        except (TypeError, OverflowError, ValueError):
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None, sort_keys=sort_keys,
+                      separators=None if indent else (',', ':'), default=default).encode('utf-8')
+
+
+def json_loads(data, codec: str = None):
+    """Parse JSON from bytes or str.
+
+    Input a fast codec rejects is parsed again by the stdlib, so invalid
+    JSON always raises `json.JSONDecodeError` and lenient stdlib input
+    (NaN, huge integers, UTF-16) still loads.
+    """
+    codec = codec or JSON_CODEC
+    if codec == 'orjson':
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass
+    elif codec == 'ujson':
+        try:
+            return ujson.loads(data)
+        except (ValueError, OverflowError):
+            pass
+    return json.loads(data)
+
+
+def write_json_file(path: str, obj, indent: bool = False, codec: str = None):
+    """Write `obj` as JSON to `path`.
+
+    The fast codecs serialize into one buffer; the stdlib codec encodes
+    and writes piece by piece, so no full copy of the document is built.
+    """
+    codec = codec or JSON_CODEC
+    if codec == 'stdlib':
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2 if indent else None,
+                      separators=None if indent else (',', ':'), default=json_default)
+        return
+    data = json_dumps(obj, indent=indent, codec=codec)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_json_file(path: str, codec: str = None):
+    """Parse the JSON file at `path`."""
+    with open(path, 'rb') as f:
+        return json_loads(f.read(), codec)
+
+
+class CodecJSONProvider(JSONProvider):
+    """Flask JSON provider on the selected codec (`app.json`, used by jsonify and request.json).
+
+    Responses are compact, also in debug mode; set `compact = False` to
+    indent them. Keys keep their insertion order unless `sort_keys`.
+    """
+
+    compact = True
+    sort_keys = False
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs) -> str:
+        return json_dumps(obj, indent=bool(kwargs.get('indent')) or not self.compact,
+                          sort_keys=kwargs.get('sort_keys', self.sort_keys)).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return json_loads(s)
+
+    def response(self, *args, **kwargs):
+        # Bytes straight into the response, no str round trip for large lists
+        obj = self._prepare_response_obj(args, kwargs)
+        body = json_dumps(obj, indent=not self.compact, sort_keys=self.sort_keys)
+        return self._app.response_class(body, mimetype=self.mimetype)
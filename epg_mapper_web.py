@@ -2,34 +2,58 @@ from flask import Flask, render_template, request, jsonify, Response, send_file
 import xml.etree.ElementTree as ET
 import requests
 import json
-import io
 import gzip
+import zlib
 import os
-from difflib import SequenceMatcher
 from datetime import datetime
 import subprocess
 import threading
 import tempfile
 import time
 import shutil
+import operator
 
 # Local utilities
 from epg_utils import (
     sanitize_filename,
     detect_gzip_bytes,
-    parse_xml_channels,
-    build_epg_program_counts,
-    load_cache_metadata as utils_load_cache_metadata,
-    save_cache_metadata as utils_save_cache_metadata,
-    add_to_cache as utils_add_to_cache,
+    parse_xmltv_time,
+    parse_xmltv,
+    fast_count_programmes,
+    cross_check_counts,
+    diff_fingerprints,
+    coverage_summary,
+    ingest_epg_stream,
+    iter_file_chunks,
+    CHUNK_SIZE,
+    PARSER_BACKEND,
+    open_xml_file,
+    file_sha256,
+    write_snapshot,
+    load_snapshot,
+    remove_snapshot,
 )
-
-# Manual EPG ID Mapping (lowercase source -> lowercase target)
+from epg_index import ProgrammeIndex
+from epg_jobs import JobManager, JobError, JobCancelled
+from epg_scheduler import Scheduler, parse_window, format_window
+from epg_merge import merge_xmltv
+from epg_export import iter_filtered_xmltv, gzip_chunks
+from epg_store import EpgStore
+from epg_catalog import CacheCatalog
+from epg_match import MatchCache, match_exact
+from epg_mapping import EpgIdMapper
+from epg_search import ChannelSearchIndex
+from epg_http import JsonResponseCache
+from epg_json import JSON_CODEC, CodecJSONProvider, json_dumps, json_loads, read_json_file, write_json_file
+from concurrent.futures import ThreadPoolExecutor
+
+# Built-in EPG ID mapping (lowercase source -> lowercase target); rules in EPG_ID_MAPPING_FILE extend it
 EPG_ID_MAPPING = {
     'ard.de': 'daserste.de',
 }
 
 app = Flask(__name__)
+app.json = CodecJSONProvider(app)
 
 # Config laden
 CONFIG_FILE = 'config.json'
@@ -49,7 +73,11 @@ def load_config():
             "server": {"host": "0.0.0.0", "port": 8081},
             "xstream": {"url": "", "username": "", "password": ""},
             "xml_epg": {"url": ""},
-            "history": {"xstream_urls": [], "xml_urls": [], "max_history": 10}
+            "history": {"xstream_urls": [], "xml_urls": [], "max_history": 10},
+            "epg_sources": [],
+            "scheduler": {"enabled": False},
+            "validation": {"min_horizon_hours": 24, "max_gap_minutes": 120},
+            "cache": {"max_mb": 2048, "max_age_days": 30}
         }
         save_config(default_config)
         return default_config
@@ -63,60 +91,410 @@ xml_channels = []
 xstream_channels = []
 program_list = []  # List of entries: [{'number': '1', 'xstream': {...} or None, 'xml': {...} or None, 'id': unique_id}, ...]
 next_entry_id = 1  # Counter for unique IDs
-last_xml_content = None  # Store the most recently loaded raw XML content (decompressed)
+last_xml_path = None  # Path of the most recently loaded XML on disk (decompressed)
 last_xstream_data = None  # Store the most recently loaded raw XStream list
-last_xml_raw = None  # Store the most recently loaded raw XML bytes (original)
+last_xml_raw_path = None  # Path of the most recently loaded XML in its original form (gz or plain)
+last_xml_sha256 = None  # Content hash of the loaded (decompressed) XML, identity for derived indexes
 last_xml_is_gz = False  # Whether the last loaded XML was gzipped
 last_xml_source_name = None  # Source filename or URL basename for last XML
 last_xstream_source_name = None  # Source filename for last XStream load/upload
 last_bulk_epg_path = None  # Last saved bulk EPG file path
+last_merge_inputs = None  # (content hashes of the sources, merged hash) of the last source merge
 epg_program_counts = {}  # channel_id -> programme count
+epg_counts_source = None  # Identity (sha256, else path) of the XML epg_program_counts were counted from
+epg_stats = {}  # Stats of the loaded EPG (channels, programmes, first_start, last_stop)
+epg_fingerprints = {}  # channel_id -> [programmes, first_start_ts, last_stop_ts, hash] of the loaded EPG
+epg_coverage = {}  # channel_id -> [[day, covered seconds, largest gap], ...] of the loaded EPG
+epg_delta = None  # Channel delta between the previous and the loaded EPG, see publish_epg_ingest()
 hls_processes = {}  # stream_id -> {'proc': subprocess.Popen, 'dir': path, 'started': time}
 
 # Cache paths
 DATA_DIR = os.path.abspath('data')
 HLS_TEMP_DIR = os.path.join(DATA_DIR, 'hls_temp')
 EPG_CACHE_DIR = os.path.join(DATA_DIR, 'epg_cache')
-CACHE_METADATA_FILE = os.path.join(EPG_CACHE_DIR, 'metadata.json')
+CACHE_METADATA_FILE = os.path.join(EPG_CACHE_DIR, 'metadata.json')  # catalog of older versions, imported once
+CACHE_CATALOG_FILE = os.path.join(EPG_CACHE_DIR, 'catalog.sqlite')
 LAST_XSTREAM_FILE = os.path.join(EPG_CACHE_DIR, 'last_xstream.json')
+XSTREAM_EXPORT_FILE = os.path.join(EPG_CACHE_DIR, 'xstream_export.json')  # last_xstream_data as served by export_xstream
+XSTREAM_EXPORT_PRETTY_FILE = os.path.join(EPG_CACHE_DIR, 'xstream_export_pretty.json')  # same, indented (?pretty=1)
 LAST_EPG_FILE = os.path.join(EPG_CACHE_DIR, 'last_epg.xml')  # always decompressed UTF-8
-LAST_EPG_RAW_FILE = os.path.join(EPG_CACHE_DIR, 'last_epg_raw.xml.gz')
+LAST_EPG_RAW_FILE = os.path.join(EPG_CACHE_DIR, 'last_epg_raw.xml.gz')  # hardlink to the store blob of a gzip feed
+EPG_INDEX_FILE = os.path.join(EPG_CACHE_DIR, 'programmes.sqlite')
+MATCH_CACHE_FILE = os.path.join(EPG_CACHE_DIR, 'match_cache.json.z')  # auto-match scores of the last run
+EPG_ID_MAPPING_FILE = os.path.join(DATA_DIR, 'epg_id_mapping.json')  # mapping rules, reloaded when changed
 
 # Create directories if they don't exist
 os.makedirs(HLS_TEMP_DIR, exist_ok=True)
 os.makedirs(EPG_CACHE_DIR, exist_ok=True)
 
 hls_temp_base = HLS_TEMP_DIR
+epg_store = EpgStore(EPG_CACHE_DIR)
+cache_catalog = CacheCatalog(CACHE_CATALOG_FILE)
+if os.path.exists(CACHE_METADATA_FILE):
+    app.logger.info(f"EPG cache: {cache_catalog.import_metadata(CACHE_METADATA_FILE)} entries imported from metadata.json")
+programme_index = ProgrammeIndex(EPG_INDEX_FILE)
+jobs = JobManager(max_workers=2, logger=app.logger)
+epg_load_lock = threading.Lock()  # Serializes loads writing LAST_EPG_FILE
+state_lock = threading.RLock()  # Held while channel lists, program list or EPG state are swapped (never mutated in place)
+programme_index_job = None  # (identity, Job) of the last programme index build
+auto_match_job = None  # Job of the last auto-match run
+match_cache = MatchCache(MATCH_CACHE_FILE)
+epg_id_mapper = EpgIdMapper(EPG_ID_MAPPING_FILE, EPG_ID_MAPPING, logger=app.logger)
+xstream_epg_keys = None  # (mapping version, XStream channel objects, resolved keys), see resolved_xstream_keys()
+channel_search = {}  # 'xstream'/'xml' -> ChannelSearchIndex of the current list, see channel_search_index()
+xstream_export_lock = threading.Lock()
+xstream_export_source = {}  # export file -> last_xstream_data object it was written from
+scheduler = None  # Scheduler for periodic refreshes, see start_scheduler()
+MAX_PARALLEL_SOURCES = 4  # Concurrent downloads when loading several EPG sources
+INDEX_DELTA_MAX_SHARE = 0.5  # Re-index only changed channels if at most this share changed
+MAX_EPG_PROGRAMS_LIMIT = 500  # Largest page of get_epg_programs
+state_version = 0  # Bumped (under state_lock) after every swap of the channel lists/EPG; cached responses are per version
+state_version_lock = threading.Lock()
+json_cache = JsonResponseCache(json_dumps)
+last_cache_load = None  # (file stamps, XStream list, XML list, loaded flags) after the last load_last_cache
+
+
+def bump_state_version():
+    """Mark the app state as changed, so cached JSON responses are rebuilt.
+
+    Called at the end of each swap of the channel lists or EPG state, while
+    state_lock is still held.
+    """
+    global state_version
+    with state_version_lock:
+        state_version += 1
+
+
+def cached_json_response(key: str, build):
+    """JSON response of `build()` serialized once per state version, gzip if accepted, with a strong ETag.
+
+    `build()` runs under state_lock, so the body always matches the version
+    it is cached under. A matching If-None-Match gets 304 Not Modified.
+    """
+    def snapshot():
+        with state_lock:
+            return state_version, build()
+
+    entry = json_cache.get(key, state_version, snapshot)
+    body, etag, encoding = entry.variant(request.accept_encodings['gzip'] > 0)
+    response = Response(status=304) if request.if_none_match.contains(etag) else Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    if encoding and response.status_code == 200:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def touch_cached(path):
+    """Record an access to a cached EPG file (LRU clock of the store and catalog)."""
+    epg_store.touch(path)
+    cache_catalog.touch(path)
+
+def get_xml_path():
+    """Return the path of the loaded XML on disk (plain or gzip), or None."""
+    if last_xml_path and os.path.exists(last_xml_path):
+        return last_xml_path
+    return None
 
 
-def load_cache_metadata():
-    return utils_load_cache_metadata(EPG_CACHE_DIR)
+def parse_time_arg(value):
+    """Parse a time query arg (epoch seconds, XMLTV timestamp or ISO 8601) to epoch seconds."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    if value.isdigit() and len(value) <= 10:
+        return int(value)
+    ts = parse_xmltv_time(value)
+    if ts is not None:
+        return ts
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise ValueError(f'Ungültige Zeitangabe: {value}')
+
+
+def build_programme_index(job=None):
+    """Build the programme index for the loaded EPG now. Returns False if nothing was built."""
+    xml_path = get_xml_path()
+    identity = last_xml_sha256
+    if not xml_path or not identity or programme_index.is_current(identity):
+        return False
+    progress = None
+    if job:
+        job.update(phase='index', programmes=0)
+        progress = lambda programmes: job.update(programmes=programmes)
+    # Unchanged channels can be kept from the index of the previous EPG
+    channels = base = None
+    delta = epg_delta
+    if delta and delta['to'] == identity:
+        changed = delta['added'] + delta['removed'] + delta['changed']
+        if len(changed) <= INDEX_DELTA_MAX_SHARE * max(len(epg_fingerprints), 1):
+            channels, base = changed, delta['from']
+    started = time.time()
+    built = programme_index.build(xml_path, identity, progress=progress, channels=channels, base=base)
+    if built:
+        scope = f"{len(channels)} changed channels" if channels is not None else "all channels"
+        app.logger.info(f"Programme index built for {identity[:12]} ({scope}) in {time.time() - started:.1f}s")
+    return built
+
+
+def run_build_programme_index(job):
+    """Job: build the programme index for the loaded EPG."""
+    built = build_programme_index(job)
+    return {'success': True, 'built': bool(built), 'identity': last_xml_sha256}
+
+
+def submit_programme_index():
+    """Start the programme index build for the loaded EPG as a job.
+
+    Load jobs call this after publishing, so they finish (and counts are
+    usable) without waiting for the index. Returns the job id, the id of a
+    build already running for the same EPG, or None if the index is current.
+    """
+    global programme_index_job
+    identity = last_xml_sha256
+    if not get_xml_path() or not identity or programme_index.is_current(identity):
+        return None
+    if programme_index_job and not programme_index_job[1].finished and programme_index_job[0] == identity:
+        return programme_index_job[1].id
+    job = jobs.submit('programme_index', run_build_programme_index)
+    programme_index_job = (identity, job)
+    return job.id
 
-def save_cache_metadata(metadata):
-    utils_save_cache_metadata(EPG_CACHE_DIR, metadata)
 
-def add_to_cache(filename, file_path):
-    utils_add_to_cache(EPG_CACHE_DIR, filename, file_path)
+def save_epg_snapshots(result, xml_path=LAST_EPG_FILE):
+    """Write the parse snapshot of freshly written EPG XML (store blobs get theirs on commit)."""
+    if result.get('error'):
+        return
+    write_snapshot(xml_path, result, result['sha256'])
 
-def build_epg_program_counts_logged(xml_text: str):
-    counts = build_epg_program_counts(xml_text)
-    if not counts:
-        app.logger.error("EPG parse returned no counts (possible parse error)")
-    return counts
 
+def restore_last_epg(path, result):
+    """Make last_epg.xml hold the (decompressed) content of `path` without parsing it again.
 
-def get_xml_text_from_memory():
-    """Return XML text from last loaded/bulk content, decoding gz if needed."""
-    if last_xml_content:
-        return last_xml_content
-    if last_xml_raw:
-        try:
-            if last_xml_is_gz:
-                return gzip.decompress(last_xml_raw).decode('utf-8')
-            return last_xml_raw.decode('utf-8')
-        except Exception as e:
-            app.logger.error(f"Failed to decode stored XML raw: {str(e)}")
-    return None
+    Returns False if last_epg.xml already holds that content.
+    """
+    current = load_snapshot(LAST_EPG_FILE) if os.path.exists(LAST_EPG_FILE) else None
+    if current and current.get('sha256') == result.get('sha256'):
+        return False
+    tmp = LAST_EPG_FILE + '.part'
+    with open_xml_file(path) as src, open(tmp, 'wb') as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    os.replace(tmp, LAST_EPG_FILE)
+    write_snapshot(LAST_EPG_FILE, result, result['sha256'])
+    return True
+
+
+def ingest_into_store(chunks, reference=None, to_last_epg=True, progress=None):
+    """Stream an EPG into the cache store and (with to_last_epg) last_epg.xml.
+
+    `reference` is the store blob the content is expected to equal (the
+    previous download of the URL, the loaded EPG); while the stream matches
+    it nothing is written. Afterwards last_epg.xml holds the content in
+    every case. Returns (result, blob_path).
+    """
+    if not epg_store.contains(reference):
+        # Only blobs are safe references: an identical stream leaves the sink without data
+        reference = None
+    sink = epg_store.sink()
+    result = ingest_epg_stream(chunks, LAST_EPG_FILE if to_last_epg else None, progress=progress,
+                               sinks=[sink], reference=reference)
+    if to_last_epg:
+        if result['identical']:
+            restore_last_epg(sink.path, result)
+        else:
+            save_epg_snapshots(result)
+    return result, sink.path
+
+
+def link_last_raw(result, blob_path):
+    """Point LAST_EPG_RAW_FILE at the blob of a gzip feed (kept for restarts), or remove it."""
+    try:
+        if result['is_gz'] and blob_path:
+            epg_store.link(blob_path, LAST_EPG_RAW_FILE)
+        elif os.path.exists(LAST_EPG_RAW_FILE):
+            os.remove(LAST_EPG_RAW_FILE)
+    except Exception as e:
+        app.logger.warning(f"Failed to persist LAST_EPG_RAW_FILE: {str(e)}")
+
+
+def loaded_blob_path():
+    """Store blob holding the loaded EPG, or None."""
+    return epg_store.blob_path(last_xml_sha256) if last_xml_sha256 else None
+
+
+def enforce_cache_limits(*protect):
+    """Evict cached EPG files beyond the configured age and size limits (config section 'cache').
+
+    The loaded EPG and the paths in `protect` are never evicted; catalog
+    entries and fetch states of evicted files are dropped.
+    """
+    cache_cfg = load_config().get('cache') or {}
+    max_bytes = int(float(cache_cfg.get('max_mb', 2048)) * 1024 * 1024)
+    max_age_days = float(cache_cfg.get('max_age_days', 30))
+    if not max_bytes and not max_age_days:
+        return []
+    removed = epg_store.evict(max_bytes, max_age_days,
+                              protect=(last_xml_path, last_xml_raw_path, loaded_blob_path()) + protect,
+                              extra=cache_catalog.paths())
+    if removed:
+        names = cache_catalog.remove_paths(removed)
+        app.logger.info(f"EPG cache: evicted {len(removed)} files ({', '.join(names) or 'ohne Katalogeintrag'})")
+    return removed
+
+
+def fetch_epg_source(url, cache_prefix, headers=None, timeout=60, job=None, progress=None, to_last_epg=True):
+    """Fetch an EPG URL conditionally and stream it into the cache store.
+
+    Sends If-None-Match / If-Modified-Since when an earlier fetch of the same
+    URL is still cached with a valid parse snapshot. Returns
+    (result, cache_filename, cache_path, status) where status is 'fetched'
+    (new content), 'not_modified' (HTTP 304, snapshot reused) or 'unchanged'
+    (200 with the content of the earlier fetch, nothing written). cache_path
+    is the store blob. Afterwards last_epg.xml holds the content in every
+    case, unless to_last_epg is False (only the store is written then). With
+    `job`, download progress is reported to it; otherwise to
+    `progress(raw_bytes, programmes)`.
+    """
+    state = cache_catalog.get_source(url)
+    prev_path = state.get('path')
+    prev = load_snapshot(prev_path) if prev_path and os.path.exists(prev_path) else None
+    req_headers = dict(headers or {})
+    if prev:
+        if state.get('etag'):
+            req_headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            req_headers['If-Modified-Since'] = state['last_modified']
+
+    with requests.get(url, timeout=timeout, headers=req_headers, stream=True) as resp:
+        if resp.status_code == 304 and prev:
+            # Blob snapshots describe the content; whether this URL serves gzip is kept in the state
+            result = dict(prev, is_gz=state.get('is_gz', prev['is_gz']))
+            status = 'not_modified'
+        else:
+            resp.raise_for_status()
+            if job:
+                # Content-Length counts encoded bytes; only usable without Content-Encoding
+                length = resp.headers.get('Content-Length')
+                bytes_total = int(length) if length and length.isdigit() and not resp.headers.get('Content-Encoding') else None
+                job.update(phase='download', bytes_total=bytes_total, programmes=0)
+                progress = lambda raw_bytes, programmes: job.update(bytes_processed=raw_bytes, programmes=programmes)
+            # Decompressed bytes -> store blob + last_epg.xml + parser; no writes while equal to the last fetch
+            result, cache_path = ingest_into_store(resp.iter_content(CHUNK_SIZE), prev_path if prev else None,
+                                                   to_last_epg, progress)
+            status = 'unchanged' if prev and result['sha256'] == prev.get('sha256') else 'fetched'
+        # 304 responses often omit the validators; keep the stored ones then
+        etag = resp.headers.get('ETag') or state.get('etag')
+        last_modified = resp.headers.get('Last-Modified') or state.get('last_modified')
+
+    if status == 'not_modified':
+        cache_filename, cache_path = state.get('filename'), prev_path
+        touch_cached(cache_path)
+        if to_last_epg:
+            restore_last_epg(cache_path, result)
+    elif cache_path == prev_path:
+        cache_filename = state.get('filename')
+        cache_catalog.touch(cache_path)
+    else:
+        ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+        cache_filename = cache_catalog.add(f"{cache_prefix}_{ts}.xml.gz", cache_path, result['sha256'],
+                                           source_url=url, etag=etag, last_modified=last_modified,
+                                           stats=result.get('stats'))
+    app.logger.info(f"EPG source fetch: {status} ({cache_filename})")
+    if to_last_epg:
+        link_last_raw(result, cache_path)
+
+    cache_catalog.set_source(url, {
+        'etag': etag,
+        'last_modified': last_modified,
+        'sha256': result.get('sha256'),
+        'is_gz': result['is_gz'],
+        'filename': cache_filename,
+        'path': cache_path,
+    })
+    return result, cache_filename, cache_path, status
+
+
+def publish_epg_ingest(result, source_name, raw_path, xml_path=LAST_EPG_FILE, index=True, protect=()):
+    """Swap a finished ingest or snapshot result into the in-memory EPG state.
+
+    With index=False the caller starts the programme index build itself
+    (load jobs do that to report the index job id in their result).
+    `protect` are further cached files the following eviction must keep
+    (the source files of a merge).
+    """
+    global last_xml_path, last_xml_raw_path, last_xml_is_gz, last_xml_source_name, last_xml_sha256, epg_delta
+    global xml_channels, epg_program_counts, epg_counts_source, epg_fingerprints, epg_coverage, epg_stats
+    if result.get('error'):
+        app.logger.error(f"EPG parse error, keeping partial result: {result['error']}")
+    fingerprints = result.get('fingerprints', {})
+    if last_xml_sha256 and last_xml_sha256 != result['sha256'] and epg_fingerprints:
+        epg_delta = {'from': last_xml_sha256, 'to': result['sha256'], 'source': source_name,
+                     'created': time.time(), **diff_fingerprints(epg_fingerprints, fingerprints)}
+        app.logger.info(f"EPG delta: {len(epg_delta['added'])} added, {len(epg_delta['removed'])} removed, "
+                        f"{len(epg_delta['changed'])} changed ({len(epg_delta['shrunk'])} shrunk), "
+                        f"{epg_delta['unchanged']} unchanged")
+    elif last_xml_sha256 != result['sha256']:
+        epg_delta = None
+    if epg_store.contains(raw_path) and not result['is_gz']:
+        # Store blobs are gzip: the original form of a plain feed is the decompressed XML
+        raw_path = None if epg_store.contains(xml_path) else xml_path
+    # New objects swapped in as a whole: readers keep iterating the previous ones
+    with state_lock:
+        last_xml_path = xml_path
+        last_xml_raw_path = raw_path
+        last_xml_is_gz = result['is_gz']
+        last_xml_source_name = source_name
+        last_xml_sha256 = result['sha256']
+        xml_channels = list(result['channels'])
+        epg_program_counts = dict(result['counts'])
+        epg_counts_source = result['sha256'] or xml_path
+        epg_fingerprints = dict(fingerprints)
+        epg_coverage = dict(result.get('coverage', {}))
+        epg_stats = dict(result['stats'])
+        bump_state_version()
+    if index:
+        submit_programme_index()
+    try:
+        enforce_cache_limits(*protect)
+    except Exception as e:
+        app.logger.warning(f"EPG cache eviction failed: {str(e)}")
+
+
+def clear_xml_channels():
+    """Drop the XML channel list only (the rest of the EPG state stays)."""
+    global xml_channels
+    with state_lock:
+        xml_channels = []
+        bump_state_version()
+
+
+def clear_epg_state():
+    """Forget the loaded EPG and remove the persisted LAST_EPG files."""
+    global last_xml_path, last_xml_raw_path, last_xml_is_gz, last_xml_source_name, last_xml_sha256, epg_delta
+    global xml_channels, epg_program_counts, epg_counts_source, epg_fingerprints, epg_coverage, epg_stats
+    with state_lock:
+        xml_channels = []
+        epg_program_counts = {}
+        epg_counts_source = None
+        epg_fingerprints = {}
+        epg_coverage = {}
+        epg_delta = None
+        epg_stats = {}
+        last_xml_path = None
+        last_xml_raw_path = None
+        last_xml_is_gz = False
+        last_xml_source_name = None
+        last_xml_sha256 = None
+        bump_state_version()
+    try:
+        if os.path.exists(LAST_EPG_FILE):
+            os.remove(LAST_EPG_FILE)
+        if os.path.exists(LAST_EPG_RAW_FILE):
+            os.remove(LAST_EPG_RAW_FILE)
+    except Exception as e:
+        app.logger.warning(f"Failed to clean old EPG files: {str(e)}")
 
 @app.route('/')
 def index():
@@ -169,66 +547,23 @@ def add_history():
 
 @app.route('/api/upload_xml', methods=['POST'])
 def upload_xml():
-    global xml_channels, last_xml_raw, last_xml_is_gz, last_xml_source_name, last_xml_content, epg_program_counts
-    
     if 'file' not in request.files:
         return jsonify({'error': 'Keine Datei hochgeladen'}), 400
     
     file = request.files['file']
     
     try:
-        # Prüfe ob Datei komprimiert ist
-        file_content = file.read()
-        is_gzipped = detect_gzip_bytes(file_content)
-        # Store original raw content and metadata
-        last_xml_raw = file_content
-        last_xml_is_gz = is_gzipped
-        last_xml_source_name = file.filename or 'uploaded_epg.xml'
-        
-        if is_gzipped:
-            try:
-                content = gzip.decompress(file_content).decode('utf-8')
-                app.logger.info("File decompressed from GZ format")
-            except Exception as e:
-                app.logger.warning(f"GZ decompression failed (fallback to plain): {str(e)}")
-                # Fallback: Versuche als normale Datei
-                try:
-                    content = file_content.decode('utf-8')
-                    app.logger.info("Fallback: Reading as plain text")
-                except:
-                    return jsonify({'error': f'Fehler beim Lesen der Datei: {str(e)}'}), 500
-        else:
-            content = file_content.decode('utf-8')
-            app.logger.info("Reading as plain XML file")
-        
-        # Store raw (decompressed) XML for saving
-        try:
-            globals()['last_xml_content'] = content
-        except Exception as e:
-            app.logger.error(f"Failed to store last_xml_content: {str(e)}")
-
-        # Parse channels via utils
-        parsed = parse_xml_channels(content)
-        xml_channels.clear()
-        xml_channels.extend(parsed)
-        epg_program_counts.clear()
-        epg_program_counts.update(build_epg_program_counts(content))
-
-        # Persist decompressed XML as last_epg.xml
-        try:
-            with open(LAST_EPG_FILE, 'w', encoding='utf-8') as f:
-                f.write(content)
-        except Exception as e:
-            app.logger.warning(f"Failed to persist LAST_EPG_FILE: {str(e)}")
-        
-        # Save uploaded file to cache
+        # Stream upload into the cache store + last_epg.xml while parsing
         ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-        original_name = os.path.splitext(file.filename or 'uploaded_epg.xml')[0]
-        cache_filename = f"{original_name}_{ts}.xml"
-        cache_path = os.path.join(EPG_CACHE_DIR, cache_filename)
-        with open(cache_path, 'wb') as f:
-            f.write(file_content)
-        add_to_cache(cache_filename, cache_path)
+        original_name = os.path.splitext(sanitize_filename(file.filename or 'uploaded_epg.xml'))[0]
+        with epg_load_lock:
+            # Uploading the loaded EPG again writes nothing
+            result, cache_path = ingest_into_store(iter_file_chunks(file.stream), loaded_blob_path())
+            app.logger.info(f"Uploaded EPG ingested (gz={result['is_gz']}, {result['xml_size']} bytes XML)")
+            link_last_raw(result, cache_path)
+            cache_catalog.add(f"{original_name}_{ts}.xml.gz", cache_path, result['sha256'],
+                              stats=result.get('stats'))
+            publish_epg_ingest(result, file.filename or 'uploaded_epg.xml', cache_path)
         
         return jsonify({
             'success': True,
@@ -241,8 +576,6 @@ def upload_xml():
 
 @app.route('/api/load_xml_url', methods=['POST'])
 def load_xml_url():
-    global xml_channels, last_xml_content, last_xml_raw, last_xml_is_gz, last_xml_source_name
-    
     data = request.json
     url = data.get('url', '').strip()
     
@@ -253,70 +586,17 @@ def load_xml_url():
         # Note: This makes a request to a user-provided URL, which is the intended functionality
         # for loading XML EPG data. Users should only provide trusted URLs.
         # Consider implementing URL allowlist or additional validation in production environments.
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        # Prüfe ob Content GZ-komprimiert ist
-        content_encoding = response.headers.get('content-encoding', '').lower()
-        is_gzipped = (content_encoding == 'gzip' or detect_gzip_bytes(response.content))
-        # Store original raw content and metadata
-        last_xml_raw = response.content
-        last_xml_is_gz = is_gzipped
-        try:
-            last_xml_source_name = os.path.basename(url) if url else None
-        except Exception:
-            last_xml_source_name = None
-        
-        if is_gzipped:
-            try:
-                content = gzip.decompress(response.content).decode('utf-8')
-                app.logger.info("URL content decompressed from GZ format")
-            except Exception as e:
-                app.logger.warning(f"GZ decompression failed (fallback to plain): {str(e)}")
-                # Fallback: Versuche als normale Datei
-                try:
-                    content = response.content.decode('utf-8')
-                    app.logger.info("Fallback: Reading as plain text")
-                except:
-                    return jsonify({'error': f'Fehler beim Lesen der Datei: {str(e)}'}), 500
-        else:
-            content = response.content.decode('utf-8')
-            app.logger.info("Reading as plain XML")
-        
-        # Store raw (decompressed) XML for saving
-        try:
-            last_xml_content = content
-        except Exception as e:
-            app.logger.error(f"Failed to store last_xml_content: {str(e)}")
-
-        # Parse channels via utils
-        parsed = parse_xml_channels(content)
-        xml_channels.clear()
-        xml_channels.extend(parsed)
-        epg_program_counts.clear()
-        epg_program_counts.update(build_epg_program_counts(content))
-
-        # Persist decompressed XML as last_epg.xml
-        try:
-            with open(LAST_EPG_FILE, 'w', encoding='utf-8') as f:
-                f.write(content)
-        except Exception as e:
-            app.logger.warning(f"Failed to persist LAST_EPG_FILE: {str(e)}")
-        
-        # Save URL-loaded file to cache
-        ts = datetime.now().strftime('%Y%m%d_%H%M%S')
         url_basename = os.path.basename(url) or 'xmltv.php'
-        original_name = os.path.splitext(url_basename)[0]
-        cache_filename = f"{original_name}_{ts}.xml"
-        cache_path = os.path.join(EPG_CACHE_DIR, cache_filename)
-        with open(cache_path, 'wb') as f:
-            f.write(response.content)
-        add_to_cache(cache_filename, cache_path)
+        original_name = os.path.splitext(sanitize_filename(url_basename))[0]
+        with epg_load_lock:
+            result, cache_filename, cache_path, fetch_status = fetch_epg_source(url, original_name, timeout=30)
+            publish_epg_ingest(result, os.path.basename(url) or None, cache_path)
         
         return jsonify({
             'success': True,
             'count': len(xml_channels),
-            'channels': xml_channels
+            'channels': xml_channels,
+            'fetch_status': fetch_status
         })
     
     except requests.exceptions.RequestException as e:
@@ -326,15 +606,19 @@ def load_xml_url():
 
 @app.route('/api/load_xstream', methods=['POST'])
 def load_xstream():
-    global xstream_channels, program_list, next_entry_id, last_xstream_data, last_xstream_source_name, xml_channels, epg_program_counts
+    global xstream_channels, program_list, next_entry_id, last_xstream_data, last_xstream_source_name, xml_channels
+    global epg_program_counts, epg_counts_source
     
     # Lösche alte Daten und Programmliste
-    xstream_channels.clear()
-    program_list.clear()
-    xml_channels.clear()
-    epg_program_counts.clear()
-    next_entry_id = 1
-    last_xstream_source_name = None
+    with state_lock:
+        xstream_channels = []
+        program_list = []
+        xml_channels = []
+        epg_program_counts = {}
+        epg_counts_source = None
+        next_entry_id = 1
+        last_xstream_source_name = None
+        bump_state_version()
     
     data = request.json
     url = data.get('url', '').strip().rstrip('/')
@@ -383,7 +667,7 @@ def load_xstream():
             return jsonify({'error': f'Server antwortete mit {content_type} statt JSON. Prüfe URL, Username und Password.'}), 500
         
         try:
-            data = response.json()
+            data = json_loads(response.content)
         except json.JSONDecodeError as je:
             app.logger.error(f"JSON decode failed. First 1000 chars: {response.text[:1000]}")
             return jsonify({'error': f'Kann JSON nicht parsen. Server-Antwort: {response.text[:200]}'}), 500
@@ -395,33 +679,18 @@ def load_xstream():
         
         app.logger.info(f"Successfully parsed {len(data)} channels")
         
-        # Keep raw data for saving
-        try:
+        # Keep raw data for saving; the complete raw channel data is the channel list
+        with state_lock:
             last_xstream_data = data
             last_xstream_source_name = None
-        except Exception as e:
-            app.logger.error(f"Failed to store last_xstream_data: {str(e)}")
-
-        xstream_channels = []
-        for ch in data:
-            # Store the complete raw channel data
-            xstream_channels.append(ch)
+            xstream_channels = list(data)
+            bump_state_version()
 
         # Persist XStream list as last_xstream.json
-        try:
-            with open(LAST_XSTREAM_FILE, 'w', encoding='utf-8') as f:
-                json.dump(xstream_channels, f, ensure_ascii=False)
-        except Exception as e:
-            app.logger.warning(f"Failed to persist LAST_XSTREAM_FILE: {str(e)}")
+        persist_xstream_list()
         
-        # Delete old EPG files (since we only loaded XStream, not EPG)
-        try:
-            if os.path.exists(LAST_EPG_FILE):
-                os.remove(LAST_EPG_FILE)
-            if os.path.exists(LAST_EPG_RAW_FILE):
-                os.remove(LAST_EPG_RAW_FILE)
-        except Exception as e:
-            app.logger.warning(f"Failed to clean old EPG files: {str(e)}")
+        # Forget old EPG state and files (since we only loaded XStream, not EPG)
+        clear_epg_state()
         
         return jsonify({
             'success': True,
@@ -440,147 +709,136 @@ def load_xstream():
         return jsonify({'error': f'Unerwarteter Fehler: {str(e)}'}), 500
 
 
+XSTREAM_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Connection': 'keep-alive'
+}
+
+EPG_DOWNLOAD_HEADERS = {
+    'User-Agent': XSTREAM_HEADERS['User-Agent'],
+    'Accept': '*/*',
+    'Accept-Encoding': 'gzip, deflate'
+}
+
+
 @app.route('/api/load_xstream_and_epg', methods=['POST'])
 def load_xstream_and_epg():
-    """Load XStream live streams and XMLTV EPG (single login) together and persist both."""
-    global xstream_channels, program_list, next_entry_id, last_xstream_data, last_xstream_source_name
-    global last_xml_raw, last_xml_content, last_xml_is_gz, last_xml_source_name, epg_program_counts, xml_channels
-    try:
-        data = request.get_json() or {}
-        url = (data.get('url') or '').strip().rstrip('/')
-        username = (data.get('username') or '').strip()
-        password = (data.get('password') or '').strip()
-        # Optional: custom XML URL to override default xmltv.php
-        custom_xml_url = (data.get('xml_url') or '').strip()
-        stream_type = (data.get('stream_type') or 'live').strip()
-
-        if not all([url, username, password]):
-            return jsonify({'success': False, 'error': 'Alle Felder müssen ausgefüllt sein'}), 400
-
-        # Normalize base URL
-        base_url = url.replace('/player_api.php', '')
+    """Load XStream live streams and XMLTV EPG (single login) together as a background job."""
+    data = request.get_json() or {}
+    url = (data.get('url') or '').strip().rstrip('/')
+    username = (data.get('username') or '').strip()
+    password = (data.get('password') or '').strip()
+    # Optional: custom XML URL to override default xmltv.php
+    custom_xml_url = (data.get('xml_url') or '').strip()
+    stream_type = (data.get('stream_type') or 'live').strip()
+
+    if not all([url, username, password]):
+        return jsonify({'success': False, 'error': 'Alle Felder müssen ausgefüllt sein'}), 400
+
+    job = jobs.submit('load_xstream_and_epg', run_load_xstream_and_epg,
+                      url, username, password, custom_xml_url, stream_type)
+    return jsonify({'success': True, 'job_id': job.id, 'job': job.to_dict()}), 202
 
-        # 1) Load XStream channels
-        action = 'get_live_streams'
+
+def fetch_xstream_list(base_url, username, password, stream_type='live'):
+    """Fetch and normalize an XStream stream list without touching the app state (raises JobError)."""
+    action = 'get_live_streams'
+    if stream_type == 'series':
+        action = 'get_series'
+    elif stream_type == 'vod':
+        action = 'get_vod_streams'
+
+    api_url = f"{base_url}/player_api.php?username={username}&password={password}&action={action}"
+    try:
+        response = requests.get(api_url, headers=XSTREAM_HEADERS, timeout=30)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        raise JobError(str(e))
+    # Parse JSON list
+    try:
+        data_list = json_loads(response.content)
+    except json.JSONDecodeError:
+        raise JobError('Kann XStream JSON nicht parsen')
+    if not isinstance(data_list, list):
+        raise JobError('Ungültige XStream API-Antwort (kein Array)')
+    for ch in data_list:
+        # Normalize fields for Series/VOD to match Live structure
         if stream_type == 'series':
-            action = 'get_series'
+            # Series usually have 'series_id' instead of 'stream_id'
+            if 'series_id' in ch and 'stream_id' not in ch:
+                ch['stream_id'] = ch['series_id']
         elif stream_type == 'vod':
-            action = 'get_vod_streams'
-            
-        api_url = f"{base_url}/player_api.php?username={username}&password={password}&action={action}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Connection': 'keep-alive'
-        }
-        response = requests.get(api_url, headers=headers, timeout=30)
-        response.raise_for_status()
-        # Parse JSON list
-        try:
-            data_list = response.json()
-        except json.JSONDecodeError:
-            return jsonify({'success': False, 'error': 'Kann XStream JSON nicht parsen'}), 500
-        if not isinstance(data_list, list):
-            return jsonify({'success': False, 'error': 'Ungültige XStream API-Antwort (kein Array)'}), 500
-        # Reset and store
-        xstream_channels.clear()
-        program_list.clear()
-        next_entry_id = 1
-        last_xstream_data = data_list
-        last_xstream_source_name = None
-        for ch in data_list:
-            # Normalize fields for Series/VOD to match Live structure
-            if stream_type == 'series':
-                # Series usually have 'series_id' instead of 'stream_id'
-                if 'series_id' in ch and 'stream_id' not in ch:
-                    ch['stream_id'] = ch['series_id']
-            elif stream_type == 'vod':
-                # VOD usually has 'stream_id' but let's ensure
-                pass
-            
-            # Add stream_type to channel object so frontend knows how to play it
-            ch['stream_type'] = stream_type
-                
-            xstream_channels.append(ch)
-        # Persist XStream list
-        try:
-            with open(LAST_XSTREAM_FILE, 'w', encoding='utf-8') as f:
-                json.dump(xstream_channels, f, ensure_ascii=False)
-        except Exception as e:
-            app.logger.warning(f"Failed to persist LAST_XSTREAM_FILE: {str(e)}")
+            # VOD usually has 'stream_id' but let's ensure
+            pass
 
-        # 2) Load EPG (xmltv.php or custom URL)
-        if custom_xml_url:
-            epg_url = custom_xml_url
-        else:
-            epg_url = f"{base_url}/xmltv.php?username={username}&password={password}"
-            
-        headers_epg = {
-            'User-Agent': headers['User-Agent'],
-            'Accept': '*/*',
-            'Accept-Encoding': 'gzip, deflate'
-        }
+        # Add stream_type to channel object so frontend knows how to play it
+        ch['stream_type'] = stream_type
+    return data_list
+
+
+def persist_xstream_list():
+    """Persist the XStream list as last_xstream.json for restarts."""
+    try:
+        write_json_file(LAST_XSTREAM_FILE, xstream_channels)
+    except Exception as e:
+        app.logger.warning(f"Failed to persist LAST_XSTREAM_FILE: {str(e)}")
+
+
+def run_load_xstream_and_epg(job, url, username, password, custom_xml_url, stream_type):
+    """Job: fetch the XStream list and the EPG, then swap both into the app state."""
+    global xstream_channels, program_list, next_entry_id, last_xstream_data, last_xstream_source_name
+    # Normalize base URL
+    base_url = url.replace('/player_api.php', '')
+
+    # 1) Load XStream channels
+    job.update(phase='xstream')
+    data_list = fetch_xstream_list(base_url, username, password, stream_type)
+
+    # 2) Load EPG (xmltv.php or custom URL)
+    if custom_xml_url:
+        epg_url = custom_xml_url
+    else:
+        epg_url = f"{base_url}/xmltv.php?username={username}&password={password}"
+
+    with epg_load_lock:
         try:
-            resp_epg = requests.get(epg_url, timeout=60, headers=headers_epg)
-            resp_epg.raise_for_status()
-            epg_bytes = resp_epg.content
-            is_gz = (resp_epg.headers.get('content-encoding', '').lower() == 'gzip' or detect_gzip_bytes(epg_bytes) or epg_url.endswith('.gz'))
-            last_xml_is_gz = is_gz
-            last_xml_raw = epg_bytes
-            last_xml_source_name = 'xmltv.php' if not custom_xml_url else 'custom_url'
-            if is_gz:
-                try:
-                    last_xml_content = gzip.decompress(epg_bytes).decode('utf-8')
-                except Exception:
-                    # Fallback if not actually gzipped
-                    last_xml_content = epg_bytes.decode('utf-8', errors='replace')
-            else:
-                last_xml_content = epg_bytes.decode('utf-8', errors='replace')
-            # Persist EPG (decompressed text; raw gz if applicable)
-            try:
-                with open(LAST_EPG_FILE, 'w', encoding='utf-8') as f:
-                    f.write(last_xml_content or '')
-                if is_gz:
-                    with open(LAST_EPG_RAW_FILE, 'wb') as f:
-                        f.write(epg_bytes)
-            except Exception as e:
-                app.logger.warning(f"Failed to persist LAST_EPG files: {str(e)}")
-            # Parse channels + build counts
-            parsed = parse_xml_channels(last_xml_content or '')
-            xml_channels.clear()
-            xml_channels.extend(parsed)
-            epg_program_counts.clear()
-            epg_program_counts.update(build_epg_program_counts(last_xml_content or ''))
+            result, _, cache_path, _ = fetch_epg_source(epg_url, 'epg_bulk', headers=EPG_DOWNLOAD_HEADERS, job=job)
+        except JobCancelled:
+            raise
         except Exception as epg_err:
-            # Graceful fallback: clear XML state and remove stale files
+            # Graceful fallback: proceed with XStream only
             app.logger.warning(f"EPG fetch failed, proceeding with XStream only: {str(epg_err)}")
-            xml_channels.clear()
-            epg_program_counts.clear()
-            last_xml_content = None
-            last_xml_raw = None
-            last_xml_is_gz = False
-            last_xml_source_name = None
-            try:
-                if os.path.exists(LAST_EPG_FILE):
-                    os.remove(LAST_EPG_FILE)
-                if os.path.exists(LAST_EPG_RAW_FILE):
-                    os.remove(LAST_EPG_RAW_FILE)
-            except Exception as e:
-                app.logger.warning(f"Failed to clean LAST_EPG files after EPG error: {str(e)}")
+            result = None
+
+        # Reset and store XStream list only once both downloads are done (not cancellable from here on)
+        job.set_phase('publish')
+        with state_lock:
+            xstream_channels = list(data_list)
+            program_list = []
+            next_entry_id = 1
+            last_xstream_data = data_list
+            last_xstream_source_name = None
+            bump_state_version()
+        persist_xstream_list()
 
-        return jsonify({
-            'success': True,
-            'xstream_count': len(xstream_channels),
-            'xml_count': len(xml_channels),
-            'channels_with_programs': len([k for k, v in epg_program_counts.items() if v > 0]),
-            'total_programmes': sum(epg_program_counts.values())
-        })
-    except requests.exceptions.RequestException as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
-    except Exception as e:
-        app.logger.error(f"Unexpected error in load_xstream_and_epg: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+        index_job_id = None
+        if result is None:
+            # Clear XML state and remove stale files
+            clear_epg_state()
+        else:
+            publish_epg_ingest(result, 'xmltv.php' if not custom_xml_url else 'custom_url', cache_path, index=False)
+            index_job_id = submit_programme_index()
+
+    return {
+        'success': True,
+        'xstream_count': len(xstream_channels),
+        'xml_count': len(xml_channels),
+        'channels_with_programs': len([k for k, v in epg_program_counts.items() if v > 0]),
+        'total_programmes': sum(epg_program_counts.values()),
+        'index_job_id': index_job_id
+    }
 
 @app.route('/api/save_xstream', methods=['POST'])
 def save_xstream():
@@ -604,8 +862,7 @@ def save_xstream():
             out_path = os.path.join(out_dir, safe)
         else:
             out_path = os.path.join(out_dir, f'xstream_channels_{ts}.json')
-        with open(out_path, 'w', encoding='utf-8') as f:
-            json.dump(last_xstream_data, f, ensure_ascii=False, indent=2)
+        write_json_file(out_path, last_xstream_data, indent=bool(req.get('pretty')))
         return jsonify({'success': True, 'path': out_path})
     except Exception as e:
         app.logger.error(f"Error saving XStream data: {str(e)}")
@@ -615,7 +872,8 @@ def save_xstream():
 def save_xml():
     try:
         # Save raw XML content or original bytes; also save parsed channels JSON for convenience
-        if not last_xml_content and not last_xml_raw:
+        xml_src = get_xml_path()
+        if not xml_src:
             return jsonify({'success': False, 'error': 'Keine XML Daten geladen'}), 400
         req = request.get_json(silent=True) or {}
         req_name = (req.get('filename') or '').strip()
@@ -641,24 +899,45 @@ def save_xml():
             else:
                 xml_path = os.path.join(out_dir, f'epg_{ts}.xml')
         # Write XML
-        if save_original and last_xml_raw is not None:
-            # Write original bytes (gz or plain)
-            with open(xml_path, 'wb') as f:
-                f.write(last_xml_raw)
+        if save_original and last_xml_raw_path and os.path.exists(last_xml_raw_path):
+            # Copy original bytes (gz or plain)
+            shutil.copyfile(last_xml_raw_path, xml_path)
         else:
-            with open(xml_path, 'w', encoding='utf-8') as f:
-                f.write(last_xml_content or '')
+            with open_xml_file(xml_src) as src, open(xml_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
         # Parsed channels
         channels_path = os.path.join(out_dir, f'xml_channels_{ts}.json')
-        with open(channels_path, 'w', encoding='utf-8') as f:
-            json.dump(xml_channels, f, ensure_ascii=False, indent=2)
+        write_json_file(channels_path, xml_channels, indent=True)
         return jsonify({'success': True, 'xml_path': xml_path, 'channels_path': channels_path})
     except Exception as e:
         app.logger.error(f"Error saving XML data: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def write_xstream_export(pretty: bool = False):
+    """Write last_xstream_data as JSON to XSTREAM_EXPORT_FILE, once per loaded list.
+
+    Compact by default; `pretty` writes an indented copy to
+    XSTREAM_EXPORT_PRETTY_FILE instead. Returns the path.
+    """
+    path = XSTREAM_EXPORT_PRETTY_FILE if pretty else XSTREAM_EXPORT_FILE
+    with xstream_export_lock:
+        data = last_xstream_data
+        if xstream_export_source.get(path) is data and os.path.exists(path):
+            return path
+        tmp_path = path + '.part'
+        write_json_file(tmp_path, data, indent=pretty)
+        # Downloads still reading the previous file keep their handle
+        os.replace(tmp_path, path)
+        xstream_export_source[path] = data
+    return path
+
+
 @app.route('/api/export_xstream', methods=['GET'])
 def export_xstream():
+    """Download the loaded XStream list as JSON, served from disk (Range requests supported).
+
+    Compact JSON; `pretty=1` sends it indented.
+    """
     try:
         if not last_xstream_data:
             return jsonify({'success': False, 'error': 'Keine XStream Daten geladen'}), 400
@@ -673,20 +952,24 @@ def export_xstream():
             fname = safe
         else:
             fname = last_xstream_source_name or f'xstream_channels_{ts}.json'
-        buf = io.BytesIO()
-        buf.write(json.dumps(last_xstream_data, ensure_ascii=False, indent=2).encode('utf-8'))
-        buf.seek(0)
-        return app.response_class(buf.read(), mimetype='application/json', headers={
-            'Content-Disposition': f'attachment; filename="{fname}"'
-        })
+        pretty = request.args.get('pretty', 'false').lower() in ['1', 'true', 'yes']
+        return send_file(write_xstream_export(pretty), mimetype='application/json', as_attachment=True,
+                         download_name=fname, conditional=True, max_age=0)
     except Exception as e:
         app.logger.error(f"Error exporting XStream data: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/export_xml', methods=['GET'])
 def export_xml():
+    """Download the loaded EPG (decompressed XML or, with original=1, the original bytes).
+
+    Files are sent from disk by send_file (sendfile where the server
+    supports it) with Content-Length and Range support. Only a gzip file
+    exported decompressed is streamed through a decompressing generator.
+    """
     try:
-        if not last_xml_content and not last_xml_raw:
+        xml_src = get_xml_path()
+        if not xml_src:
             return jsonify({'success': False, 'error': 'Keine XML Daten geladen'}), 400
         original = request.args.get('original', 'false').lower() in ['1', 'true', 'yes']
         req_name = request.args.get('filename', '').strip()
@@ -695,11 +978,13 @@ def export_xml():
             return base.replace('../', '').replace('..', '')
         ts = datetime.now().strftime('%Y%m%d_%H%M%S')
         # Decide content and filename
-        if original and last_xml_raw is not None:
-            content_bytes = last_xml_raw
+        if original and last_xml_raw_path and os.path.exists(last_xml_raw_path):
+            src_path = last_xml_raw_path
+            decompress = False
             default_name = last_xml_source_name or (f'epg_{ts}.xml.gz' if last_xml_is_gz else f'epg_{ts}.xml')
         else:
-            content_bytes = (last_xml_content or '').encode('utf-8')
+            src_path = xml_src
+            decompress = True
             default_name = f'epg_{ts}.xml'
         if req_name:
             safe = sanitize_name(req_name)
@@ -710,14 +995,89 @@ def export_xml():
             fname = safe
         else:
             fname = default_name
-        buf = io.BytesIO(content_bytes)
-        buf.seek(0)
         mime = 'application/gzip' if fname.lower().endswith('.gz') else 'application/xml'
-        return app.response_class(buf.read(), mimetype=mime, headers={
+        if decompress:
+            with open(src_path, 'rb') as f:
+                needs_decompress = detect_gzip_bytes(f.read(2))
+            if needs_decompress:
+                def generate():
+                    with open_xml_file(src_path) as f:
+                        yield from iter_file_chunks(f)
+                return Response(generate(), mimetype=mime, headers={
+                    'Content-Disposition': f'attachment; filename="{fname}"'
+                })
+        return send_file(src_path, mimetype=mime, as_attachment=True, download_name=fname,
+                         conditional=True, max_age=0)
+    except Exception as e:
+        app.logger.error(f"Error exporting XML data: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+def program_list_export_targets(rename: str = 'none'):
+    """Map source channel id (lower) -> [(channel_id, display_name)] for the program list export.
+
+    rename: 'none' keeps the XML ids and names; 'number' uses the program
+    number and 'xstream' the XStream epg_channel_id as id. Both take the
+    XStream channel name as display name where the entry has one.
+    Entries without XML channel use the (mapped) XStream epg_channel_id.
+    """
+    targets = {}
+    for entry in sorted(program_list, key=lambda x: (int(x['number']) if x['number'].isdigit() else 0, x['id'])):
+        xml_ch = entry.get('xml')
+        xstream_ch = entry.get('xstream') or {}
+        xstream_epg_id = (xstream_ch.get('epg_channel_id') or '').strip()
+        source = (xml_ch.get('id') or '').strip() if xml_ch else ''
+        if not source and xstream_epg_id:
+            source = epg_id_mapper.get(xstream_epg_id.lower(), xstream_epg_id)
+        if not source:
+            continue
+        channel_id = name = None
+        if rename == 'number':
+            channel_id = entry['number']
+        elif rename == 'xstream':
+            channel_id = xstream_epg_id or None
+        if rename != 'none':
+            name = xstream_ch.get('name') or None
+        wanted = targets.setdefault(source.lower(), [])
+        if (channel_id, name) not in wanted:
+            wanted.append((channel_id, name))
+    return targets
+
+
+@app.route('/api/export_program_xml', methods=['GET'])
+def export_program_xml():
+    """Stream an XMLTV document with only the channels of the program list.
+
+    Query params: rename ('none', 'number' or 'xstream', see
+    program_list_export_targets), gzip (1 = compress on the fly), filename.
+    The document is generated while it is sent; nothing is buffered in full.
+    """
+    try:
+        xml_src = get_xml_path()
+        if not xml_src:
+            return jsonify({'success': False, 'error': 'Keine XML Daten geladen'}), 400
+        rename = request.args.get('rename', 'none').strip().lower()
+        if rename not in ('none', 'number', 'xstream'):
+            return jsonify({'success': False, 'error': f'Ungültiger Wert für rename: {rename}'}), 400
+        compress = request.args.get('gzip', 'false').lower() in ['1', 'true', 'yes']
+        targets = program_list_export_targets(rename)
+        if not targets:
+            return jsonify({'success': False, 'error': 'Programmliste ist leer oder ohne EPG-Zuordnung'}), 400
+        ext = '.xml.gz' if compress else '.xml'
+        req_name = request.args.get('filename', '').strip()
+        if req_name:
+            safe = sanitize_filename(req_name)
+            fname = safe if safe.lower().endswith(ext) else safe + ext
+        else:
+            fname = f"programmliste_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+        chunks = iter_filtered_xmltv(xml_src, targets)
+        if compress:
+            chunks = gzip_chunks(chunks)
+        return Response(chunks, mimetype='application/gzip' if compress else 'application/xml', headers={
             'Content-Disposition': f'attachment; filename="{fname}"'
         })
     except Exception as e:
-        app.logger.error(f"Error exporting XML data: {str(e)}")
+        app.logger.error(f"Error exporting program list XML: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -1041,7 +1401,7 @@ def stop_hls_proxy():
 
 @app.route('/api/upload_xstream', methods=['POST'])
 def upload_xstream():
-    global xstream_channels, program_list, next_entry_id, last_xstream_data, last_xstream_source_name, xml_channels, epg_program_counts
+    global xstream_channels, program_list, next_entry_id, last_xstream_data, last_xstream_source_name
     if 'file' not in request.files:
         return jsonify({'error': 'Keine Datei hochgeladen'}), 400
     file = request.files['file']
@@ -1052,38 +1412,30 @@ def upload_xstream():
         is_gzipped = detect_gzip_bytes(file_content)
         if is_gzipped:
             try:
-                content_text = gzip.decompress(file_content).decode('utf-8')
+                content = gzip.decompress(file_content)
             except Exception as e:
                 return jsonify({'error': f'GZ Dekomprimierung fehlgeschlagen: {str(e)}'}), 500
         else:
-            content_text = file_content.decode('utf-8')
+            content = file_content
         try:
-            data = json.loads(content_text)
+            # Parsed from the UTF-8 bytes, no decoded copy of the document
+            data = json_loads(content)
         except json.JSONDecodeError as je:
             return jsonify({'error': f'Ungueltiges JSON: {str(je)}'}), 400
         if not isinstance(data, list):
             return jsonify({'error': 'Erwartet eine JSON-Liste von Channels'}), 400
 
         # Reset and store
-        xstream_channels.clear()
-        program_list.clear()
-        xml_channels.clear()
-        epg_program_counts.clear()
-        next_entry_id = 1
-        last_xstream_data = data
-        last_xstream_source_name = os.path.basename(filename)
-
-        for ch in data:
-            xstream_channels.append(ch)
+        with state_lock:
+            xstream_channels = list(data)
+            program_list = []
+            next_entry_id = 1
+            last_xstream_data = data
+            last_xstream_source_name = os.path.basename(filename)
+            bump_state_version()
 
-        # Delete old EPG files (since we only loaded XStream, not EPG)
-        try:
-            if os.path.exists(LAST_EPG_FILE):
-                os.remove(LAST_EPG_FILE)
-            if os.path.exists(LAST_EPG_RAW_FILE):
-                os.remove(LAST_EPG_RAW_FILE)
-        except Exception as e:
-            app.logger.warning(f"Failed to clean old EPG files: {str(e)}")
+        # Forget old EPG state and files (since we only loaded XStream, not EPG)
+        clear_epg_state()
 
         return jsonify({'success': True, 'count': len(xstream_channels), 'channels': xstream_channels})
     except Exception as e:
@@ -1091,171 +1443,518 @@ def upload_xstream():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/download_epg_bulk', methods=['POST'])
-def download_epg_bulk():
-    """Download XMLTV from XStream (single login) and cache for offline validation."""
-    global xml_channels, last_xml_raw, last_xml_content, last_xml_is_gz, last_xml_source_name, last_bulk_epg_path, epg_program_counts
-    try:
-        cfg = load_config()
-        base_url = (cfg.get('xstream', {}).get('url') or '').strip().rstrip('/')
-        user = (cfg.get('xstream', {}).get('username') or '').strip()
-        pwd = (cfg.get('xstream', {}).get('password') or '').strip()
-        if not (base_url and user and pwd):
-            return jsonify({'success': False, 'error': 'XStream Zugangsdaten in config fehlen'}), 400
+def xstream_credentials(cfg):
+    """Return (base_url, username, password) from the config's xstream section, or None if incomplete."""
+    base_url = (cfg.get('xstream', {}).get('url') or '').strip().rstrip('/')
+    user = (cfg.get('xstream', {}).get('username') or '').strip()
+    pwd = (cfg.get('xstream', {}).get('password') or '').strip()
+    if not (base_url and user and pwd):
+        return None
+    return base_url.replace('/player_api.php', ''), user, pwd
 
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': '*/*',
-            'Accept-Encoding': 'gzip, deflate'
-        }
 
-        # Use only XStream xmltv.php, no fallback
-        base_url = base_url.replace('/player_api.php', '')
-        epg_url = f"{base_url}/xmltv.php?username={user}&password={pwd}"
-        app.logger.info(f"Downloading bulk EPG from XStream: {epg_url}")
-        
+@app.route('/api/download_epg_bulk', methods=['POST'])
+def download_epg_bulk():
+    """Download XMLTV from XStream (single login) and cache it, as a background job."""
+    creds = xstream_credentials(load_config())
+    if not creds:
+        return jsonify({'success': False, 'error': 'XStream Zugangsdaten in config fehlen'}), 400
+
+    # Use only XStream xmltv.php, no fallback
+    base_url, user, pwd = creds
+    epg_url = f"{base_url}/xmltv.php?username={user}&password={pwd}"
+    job = jobs.submit('download_epg_bulk', run_download_epg_bulk, epg_url)
+    return jsonify({'success': True, 'job_id': job.id, 'job': job.to_dict()}), 202
+
+
+def run_download_epg_bulk(job, epg_url, source_name='xmltv.php'):
+    """Job: fetch the bulk EPG and publish it; the programme index follows as its own job."""
+    global last_bulk_epg_path
+    app.logger.info(f"Downloading bulk EPG from XStream: {epg_url}")
+    with epg_load_lock:
         try:
-            resp = requests.get(epg_url, timeout=60, headers=headers)
-            resp.raise_for_status()
+            result, filename, path, fetch_status = fetch_epg_source(epg_url, 'epg_bulk', headers=EPG_DOWNLOAD_HEADERS, job=job)
         except requests.exceptions.RequestException as e:
             app.logger.exception(f"Failed to fetch EPG from XStream {epg_url}")
-            return jsonify({'success': False, 'error': f'XStream EPG Download fehlgeschlagen: {str(e)}'}), 500
-
-        content = resp.content
-        is_gz = resp.headers.get('content-encoding', '').lower() == 'gzip' or detect_gzip_bytes(content)
-        last_xml_is_gz = is_gz
-        last_xml_raw = content
-        last_xml_source_name = 'xmltv.php'
-        # Decode
-        if is_gz:
+            raise JobError(f'XStream EPG Download fehlgeschlagen: {str(e)}')
+        except (OSError, zlib.error) as e:
+            app.logger.error(f"EPG stream processing failed: {str(e)}")
+            raise JobError(f'GZ-Dekomprimierung fehlgeschlagen: {str(e)}')
+        is_gz = result['is_gz']
+        last_bulk_epg_path = path
+        # Not cancellable past this point: last_epg.xml already holds the new content
+        job.set_phase('publish')
+        publish_epg_ingest(result, source_name, path, index=False)
+        index_job_id = submit_programme_index()
+    return {
+        'success': True,
+        'path': path,
+        'channels': xml_channels,
+        'channels_with_programs': len([k for k,v in epg_program_counts.items() if v>0]),
+        'total_programmes': sum(epg_program_counts.values()),
+        'is_gz': is_gz,
+        'fetch_status': fetch_status,
+        'index_job_id': index_job_id
+    }
+
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List recent background jobs (without their results)."""
+    return jsonify({'success': True, 'jobs': [job.to_dict(include_result=False) for job in jobs.list()]})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a background job: status, phase, progress, ETA and (when done) its result."""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job nicht gefunden'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Request cancellation; the job stops at its next progress update."""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job nicht gefunden'}), 404
+    job.cancel()
+    return jsonify({'success': True, 'job': job.to_dict(include_result=False)})
+
+
+def resolve_epg_sources(cfg):
+    """Return the enabled EPG sources of the config as [{'name','url','priority'}], highest priority first.
+
+    A source with "type": "xstream" stands for xmltv.php of the configured XStream login.
+    """
+    sources = []
+    for entry in cfg.get('epg_sources') or []:
+        if not entry.get('enabled', True):
+            continue
+        name = (entry.get('name') or '').strip()
+        url = (entry.get('url') or '').strip()
+        if entry.get('type') == 'xstream':
+            creds = xstream_credentials(cfg)
+            if not creds:
+                app.logger.warning(f"EPG source '{name}' skipped: XStream Zugangsdaten in config fehlen")
+                continue
+            base_url, user, pwd = creds
+            url = f"{base_url}/xmltv.php?username={user}&password={pwd}"
+        if not name or not url:
+            continue
+        sources.append({'name': name, 'url': url, 'priority': int(entry.get('priority', 0))})
+    # sorted() is stable: equal priorities keep their config order
+    return sorted(sources, key=lambda s: -s['priority'])
+
+
+def run_load_epg_sources(job):
+    """Job: fetch all configured EPG sources concurrently and publish their priority merge."""
+    global last_merge_inputs
+    sources = resolve_epg_sources(load_config())
+    if not sources:
+        raise JobError('Keine EPG-Quellen konfiguriert', 400)
+
+    job.update(phase='download', programmes=0)
+    progress_lock = threading.Lock()
+    progress_by_source = {}
+
+    def source_progress(name):
+        def progress(raw_bytes, programmes):
+            with progress_lock:
+                progress_by_source[name] = (raw_bytes, programmes)
+                job.update(bytes_processed=sum(p[0] for p in progress_by_source.values()),
+                           programmes=sum(p[1] for p in progress_by_source.values()))
+        return progress
+
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_SOURCES, len(sources))) as pool:
+        futures = [pool.submit(fetch_epg_source, s['url'], 'epg_src_' + sanitize_filename(s['name']),
+                               EPG_DOWNLOAD_HEADERS, 60, None, source_progress(s['name']), False)
+                   for s in sources]
+        loaded, report = [], []
+        for source, future in zip(sources, futures):
             try:
-                last_xml_content = gzip.decompress(content).decode('utf-8')
+                result, filename, path, fetch_status = future.result()
+            except JobCancelled:
+                raise
             except Exception as e:
-                app.logger.error(f"GZ decode failed: {str(e)}")
-                return jsonify({'success': False, 'error': f'GZ-Dekomprimierung fehlgeschlagen: {str(e)}'}), 500
+                app.logger.warning(f"EPG source '{source['name']}' failed: {str(e)}")
+                report.append({'name': source['name'], 'status': 'error', 'error': str(e)})
+                continue
+            if result.get('error'):
+                app.logger.error(f"EPG source '{source['name']}' parse error, keeping partial result: {result['error']}")
+            loaded.append({'name': source['name'], 'path': path, 'result': result})
+            report.append({'name': source['name'], 'status': fetch_status, 'priority': source['priority'],
+                           'filename': filename, 'error': result.get('error')})
+    if not loaded:
+        raise JobError('Keine EPG-Quelle konnte geladen werden: ' + '; '.join(
+            f"{r['name']}: {r['error']}" for r in report))
+
+    inputs = tuple((s['name'], s['result']['sha256']) for s in loaded)
+    with epg_load_lock:
+        job.update(phase='merge')
+        previous = load_snapshot(LAST_EPG_FILE) if last_merge_inputs and last_merge_inputs[0] == inputs else None
+        if previous and previous['sha256'] == last_merge_inputs[1]:
+            # Same source contents as the last merge and last_epg.xml still holds it: nothing to write
+            merged = dict(previous, sources=last_merge_inputs[2])
         else:
-            last_xml_content = content.decode('utf-8')
-        # Persist decompressed XML as last_epg.xml; also raw gz if available
-        try:
-            with open(LAST_EPG_FILE, 'w', encoding='utf-8') as f:
-                f.write(last_xml_content or '')
-            if is_gz:
-                with open(LAST_EPG_RAW_FILE, 'wb') as f:
-                    f.write(content)
-        except Exception as e:
-            app.logger.warning(f"Failed to persist LAST_EPG files: {str(e)}")
-        # Save to disk in cache directory
-        ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"epg_bulk_{ts}.xml.gz" if is_gz else f"epg_bulk_{ts}.xml"
-        path = os.path.join(EPG_CACHE_DIR, filename)
-        with open(path, 'wb') as f:
-            f.write(content)
-        last_bulk_epg_path = path
-        add_to_cache(filename, path)
-        # Build counts map and update global xml_channels
-        epg_program_counts.clear()
-        epg_program_counts.update(build_epg_program_counts_logged(last_xml_content))
-        xml_channels.clear()
-        xml_channels.extend(parse_xml_channels(last_xml_content))
-        return jsonify({
-            'success': True,
-            'path': path,
-            'channels': xml_channels,
-            'channels_with_programs': len([k for k,v in epg_program_counts.items() if v>0]),
-            'total_programmes': sum(epg_program_counts.values()),
-            'is_gz': is_gz
-        })
-    except Exception as e:
-        app.logger.exception(f"Error downloading bulk EPG: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+            merged = merge_xmltv(loaded, LAST_EPG_FILE)
+            merged['is_gz'] = False
+            save_epg_snapshots(merged)
+            last_merge_inputs = (inputs, merged['sha256'], merged['sources'])
+        if os.path.exists(LAST_EPG_RAW_FILE):
+            os.remove(LAST_EPG_RAW_FILE)
+        job.set_phase('publish')
+        # All source blobs of this run stay pinned, not only the merged EPG that becomes the loaded one
+        pinned = [s['path'] for s in loaded] + [epg_store.blob_path(s['result']['sha256']) for s in loaded]
+        publish_epg_ingest(merged, f'merge ({len(loaded)} Quellen)', LAST_EPG_FILE, index=False, protect=pinned)
+        index_job_id = submit_programme_index()
+
+    owned = {s['name']: s for s in merged['sources']}
+    for entry in report:
+        if entry['name'] in owned:
+            entry['channels'] = owned[entry['name']]['channels']
+            entry['programmes'] = owned[entry['name']]['programmes']
+    return {
+        'success': True,
+        'sources': report,
+        'xml_count': len(xml_channels),
+        'channels_with_programs': len([k for k, v in epg_program_counts.items() if v > 0]),
+        'total_programmes': sum(epg_program_counts.values()),
+        'index_job_id': index_job_id
+    }
+
+
+@app.route('/api/epg_sources', methods=['GET'])
+def list_epg_sources():
+    """List the registered EPG sources (config order) and the effective merge order."""
+    cfg = load_config()
+    return jsonify({
+        'success': True,
+        'sources': cfg.get('epg_sources') or [],
+        'merge_order': [s['name'] for s in resolve_epg_sources(cfg)]
+    })
+
+
+@app.route('/api/epg_sources', methods=['POST'])
+def save_epg_source():
+    """Add or update (by name) an EPG source: name, url or type 'xstream', priority, enabled."""
+    data = request.get_json() or {}
+    name = (data.get('name') or '').strip()
+    url = (data.get('url') or '').strip()
+    source_type = (data.get('type') or 'url').strip()
+    if not name or (source_type != 'xstream' and not url):
+        return jsonify({'success': False, 'error': 'Name und URL erforderlich'}), 400
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Priorität muss eine Zahl sein'}), 400
+    entry = {'name': name, 'type': source_type, 'url': url, 'priority': priority,
+             'enabled': bool(data.get('enabled', True))}
+    cfg = load_config()
+    sources = [s for s in cfg.get('epg_sources') or [] if s.get('name') != name]
+    sources.append(entry)
+    cfg['epg_sources'] = sources
+    save_config(cfg)
+    return jsonify({'success': True, 'source': entry})
+
+
+@app.route('/api/epg_sources/delete', methods=['POST'])
+def delete_epg_source():
+    """Remove a registered EPG source by name."""
+    data = request.get_json() or {}
+    name = (data.get('name') or '').strip()
+    cfg = load_config()
+    sources = cfg.get('epg_sources') or []
+    remaining = [s for s in sources if s.get('name') != name]
+    if len(remaining) == len(sources):
+        return jsonify({'success': False, 'error': 'Quelle nicht gefunden'}), 404
+    cfg['epg_sources'] = remaining
+    save_config(cfg)
+    return jsonify({'success': True})
+
+
+@app.route('/api/load_epg_sources', methods=['POST'])
+def load_epg_sources():
+    """Fetch all registered EPG sources concurrently and merge them, as a background job."""
+    if not resolve_epg_sources(load_config()):
+        return jsonify({'success': False, 'error': 'Keine EPG-Quellen konfiguriert'}), 400
+    job = jobs.submit('load_epg_sources', run_load_epg_sources)
+    return jsonify({'success': True, 'job_id': job.id, 'job': job.to_dict()}), 202
+
+
+def run_refresh_xstream(job, stream_type='live'):
+    """Job (scheduler): refresh the XStream list from the configured login, keeping the programme list."""
+    global xstream_channels, last_xstream_data, last_xstream_source_name
+    creds = xstream_credentials(load_config())
+    if not creds:
+        raise JobError('XStream Zugangsdaten in config fehlen', 400)
+    job.update(phase='xstream')
+    data_list = fetch_xstream_list(*creds, stream_type=stream_type)
+    job.set_phase('publish')
+    with state_lock:
+        xstream_channels = list(data_list)
+        last_xstream_data = data_list
+        last_xstream_source_name = None
+        bump_state_version()
+    persist_xstream_list()
+    return {'success': True, 'xstream_count': len(xstream_channels)}
+
+
+def submit_scheduled_epg_refresh(url=''):
+    """Start a bulk EPG refresh job for the scheduler (custom URL or xmltv.php of the configured login)."""
+    if url:
+        return jobs.submit('scheduled_epg', run_download_epg_bulk, url, 'custom_url')
+    creds = xstream_credentials(load_config())
+    if not creds:
+        raise JobError('XStream Zugangsdaten in config fehlen', 400)
+    base_url, user, pwd = creds
+    epg_url = f"{base_url}/xmltv.php?username={user}&password={pwd}"
+    return jobs.submit('scheduled_epg', run_download_epg_bulk, epg_url)
+
+
+def start_scheduler(config):
+    """Set up periodic refreshes from the config's scheduler section (no-op unless enabled)."""
+    global scheduler
+    sched_cfg = config.get('scheduler') or {}
+    if not sched_cfg.get('enabled'):
+        app.logger.info("Scheduler disabled")
+        return
+    try:
+        window = parse_window(sched_cfg.get('window', ''))
+    except ValueError as e:
+        app.logger.error(f"Scheduler not started: {str(e)}")
+        return
+    scheduler = Scheduler(
+        jitter=float(sched_cfg.get('jitter_minutes', 5)) * 60,
+        retry=float(sched_cfg.get('retry_minutes', 5)) * 60,
+        max_backoff=float(sched_cfg.get('max_backoff_minutes', 240)) * 60,
+        window=window,
+        logger=app.logger,
+    )
+    sources = sched_cfg.get('sources') or {}
+    xstream_cfg = sources.get('xstream') or {}
+    stream_type = xstream_cfg.get('stream_type', 'live')
+    scheduler.add_source('xstream', lambda: jobs.submit('scheduled_xstream', run_refresh_xstream, stream_type),
+                         float(xstream_cfg.get('interval_minutes', 720)) * 60, xstream_cfg.get('enabled', True))
+    epg_cfg = sources.get('epg') or {}
+    epg_url = (epg_cfg.get('url') or '').strip()
+    scheduler.add_source('epg', lambda: submit_scheduled_epg_refresh(epg_url),
+                         float(epg_cfg.get('interval_minutes', 720)) * 60, epg_cfg.get('enabled', True))
+    merge_cfg = sources.get('epg_sources') or {}
+    scheduler.add_source('epg_sources', lambda: jobs.submit('scheduled_epg_sources', run_load_epg_sources),
+                         float(merge_cfg.get('interval_minutes', 720)) * 60, merge_cfg.get('enabled', False))
+    scheduler.start()
+    app.logger.info(f"Scheduler started (window: {sched_cfg.get('window') or 'immer'})")
+
+
+@app.route('/api/scheduler/status', methods=['GET'])
+def scheduler_status():
+    """Last/next run, last error and failure count per scheduled source."""
+    if scheduler is None:
+        return jsonify({'success': True, 'enabled': False, 'sources': []})
+    return jsonify({
+        'success': True,
+        'enabled': True,
+        'window': format_window(scheduler.window),
+        'sources': scheduler.status()
+    })
+
+
+@app.route('/api/scheduler/run/<name>', methods=['POST'])
+def scheduler_run(name):
+    """Refresh a scheduled source now instead of waiting for its next run."""
+    if scheduler is None:
+        return jsonify({'success': False, 'error': 'Scheduler ist nicht aktiviert'}), 400
+    try:
+        job = scheduler.run_now(name)
+    except KeyError:
+        return jsonify({'success': False, 'error': f'Unbekannte Quelle: {name}'}), 404
+    if job is None:
+        source = next(s for s in scheduler.status() if s['name'] == name)
+        return jsonify({'success': False, 'error': source['last_error']}), 500
+    return jsonify({'success': True, 'job_id': job.id, 'job': job.to_dict()}), 202
 
 
 @app.route('/api/load_last_cache', methods=['GET'])
 def load_last_cache():
-    """Load last persisted XStream and EPG into memory after restart."""
-    global xstream_channels, xml_channels, last_xml_content, epg_program_counts, last_xml_raw, last_xml_is_gz, last_xml_source_name
+    """Load last persisted XStream and EPG into memory after restart.
+
+    Skipped if neither cache file changed and the channel lists are still
+    the ones this endpoint loaded last time; the response is then served
+    from the JSON response cache (304 with a matching If-None-Match).
+    Returns counts and stats; the UI pages the channels via get_channels.
+    `lists=1` adds the full `xstream` and `xml` lists.
+    """
+    global last_cache_load
+    with_lists = request.args.get('lists', 'false').lower() in ['1', 'true', 'yes']
+    stamps = (file_stamp(LAST_XSTREAM_FILE), file_stamp(LAST_EPG_FILE), last_xml_sha256)
+    cached = last_cache_load
+    if (cached is not None and cached[0] == stamps
+            and same_channels(cached[1], xstream_channels) and same_channels(cached[2], xml_channels)):
+        loaded = cached[3]
+    else:
+        loaded = reload_last_cache()
+        last_cache_load = ((file_stamp(LAST_XSTREAM_FILE), file_stamp(LAST_EPG_FILE), last_xml_sha256),
+                           list(xstream_channels), list(xml_channels), loaded)
+    return cached_json_response(f'load_last_cache?lists={int(with_lists)}', lambda: last_cache_body(loaded, with_lists))
+
+
+def file_stamp(path):
+    """(mtime_ns, size) of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def same_channels(a, b) -> bool:
+    """True if both lists hold exactly the same channel objects."""
+    return len(a) == len(b) and all(map(operator.is_, a, b))
+
+
+def reload_last_cache() -> dict:
+    """Read LAST_XSTREAM_FILE and LAST_EPG_FILE into the app state. Returns the loaded flags."""
+    global xstream_channels
     loaded = {'xstream': False, 'xml': False, 'pollution_detected': False}
     # Load XStream
     try:
         if os.path.exists(LAST_XSTREAM_FILE):
-            with open(LAST_XSTREAM_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f) or []
+            data = read_json_file(LAST_XSTREAM_FILE) or []
             if isinstance(data, list) and len(data) > 0:
-                xstream_channels.clear()
-                xstream_channels.extend(data)
+                with state_lock:
+                    xstream_channels = data
+                    bump_state_version()
                 loaded['xstream'] = True
                 app.logger.info(f"Loaded {len(xstream_channels)} XStream channels from cache")
     except Exception as e:
         app.logger.warning(f"Failed to load LAST_XSTREAM_FILE: {str(e)}")
-        xstream_channels.clear()
-    # Load EPG (decompressed text)
+        with state_lock:
+            xstream_channels = []
+            bump_state_version()
+    # Load EPG (parse snapshot if still valid, else one streaming pass over the XML)
     try:
         if os.path.exists(LAST_EPG_FILE):
-            with open(LAST_EPG_FILE, 'r', encoding='utf-8') as f:
-                content = f.read()
-            # Guard: check if content looks like XML EPG (has 'channel' and 'programme' tags)
-            if '<channel' not in content or '<programme' not in content:
+            result = load_snapshot(LAST_EPG_FILE)
+            if result is None:
+                result = parse_xmltv(LAST_EPG_FILE)
+                save_epg_snapshots(result)
+            # Guard: check if content looks like XML EPG (has channel and programme elements)
+            if not result['channels'] or not result['stats']['programmes']:
                 app.logger.warning(f"LAST_EPG_FILE does not look like valid XMLTV (missing channel/programme tags)")
-                xml_channels.clear()
+                clear_xml_channels()
                 loaded['pollution_detected'] = True
             else:
-                globals()['last_xml_content'] = content
-                parsed = parse_xml_channels(content or '')
-                xml_channels.clear()
-                xml_channels.extend(parsed)
-                epg_program_counts.clear()
-                epg_program_counts.update(build_epg_program_counts(content or ''))
-                globals()['last_xml_source_name'] = os.path.basename(LAST_EPG_FILE)
+                has_raw = os.path.exists(LAST_EPG_RAW_FILE)
+                result['is_gz'] = has_raw
+                publish_epg_ingest(result, os.path.basename(LAST_EPG_FILE), LAST_EPG_RAW_FILE if has_raw else LAST_EPG_FILE)
                 loaded['xml'] = True
                 app.logger.info(f"Loaded {len(xml_channels)} XML EPG channels from cache with {sum(epg_program_counts.values())} programmes")
         else:
-            xml_channels.clear()
+            clear_xml_channels()
     except Exception as e:
         app.logger.warning(f"Failed to load LAST_EPG_FILE: {str(e)}")
-        xml_channels.clear()
-    # Enrich XML channels with programme counts
-    enriched_xml = []
-    for ch in xml_channels:
-        c_id = ch.get('id', '')
-        count = epg_program_counts.get(c_id.lower(), 0)
-        new_ch = ch.copy()
-        new_ch['programmes'] = count
-        enriched_xml.append(new_ch)
+        clear_xml_channels()
+    return loaded
 
-    return jsonify({
+
+def last_cache_body(loaded: dict, with_lists: bool = False) -> dict:
+    """Response body of load_last_cache (the channel lists only with `with_lists`)."""
+    body = {
         'success': True,
         'loaded': loaded,
         'xstream_count': len(xstream_channels),
         'xml_count': len(xml_channels),
-        'xstream': xstream_channels,
-        'xml': enriched_xml,
-        'programme_counts_total': sum(epg_program_counts.values())
-    })
+        'programme_counts_total': sum(epg_program_counts.values()),
+        'epg_stats': epg_stats,
+        'parser_backend': PARSER_BACKEND
+    }
+    if with_lists:
+        # Enrich XML channels with programme counts
+        enriched_xml = []
+        for ch in xml_channels:
+            c_id = ch.get('id', '')
+            count = epg_program_counts.get(c_id.lower(), 0)
+            new_ch = ch.copy()
+            new_ch['programmes'] = count
+            enriched_xml.append(new_ch)
+        body['xstream'] = xstream_channels
+        body['xml'] = enriched_xml
+    return body
+
+
+def resolved_xstream_keys(channels):
+    """[(EPG key, mapped id or None)] of every channel of the XStream list `channels` after the mapping rules.
+
+    Computed once per XStream list and mapping version (the rules file is
+    checked for changes first), so requests only do dict lookups.
+    """
+    global xstream_epg_keys
+    epg_id_mapper.refresh()
+    cached = xstream_epg_keys
+    if cached and cached[0] == epg_id_mapper.version and same_channels(cached[1], channels):
+        return cached[2]
+    channels = list(channels)
+    keys = []
+    for ch in channels:
+        epg_key = (ch.get('epg_channel_id') or '').strip().lower()
+        mapped_id = epg_id_mapper.get(epg_key)
+        keys.append((mapped_id if mapped_id is not None else epg_key, mapped_id))
+    xstream_epg_keys = (epg_id_mapper.version, channels, keys)
+    return keys
+
+
+def publish_programme_counts(counts, source):
+    """Swap in programme counts of the XML `source` (sha256 or path), unless another EPG was loaded meanwhile."""
+    global epg_program_counts, epg_counts_source
+    with state_lock:
+        if (last_xml_sha256 or last_xml_path) != source:
+            return
+        epg_program_counts = counts
+        epg_counts_source = source
+        bump_state_version()
+
+
+def run_fastcount_check(job, xml_path, counts):
+    """Job (EPG_FASTCOUNT_CHECK): compare the byte-scan counts with a full parse and log the differences."""
+    job.update(phase='check')
+    diff = cross_check_counts(xml_path, counts)
+    if diff:
+        app.logger.warning(f"Fast count differs from full parse for {len(diff)} channels: {sorted(diff.items())[:10]}")
+    return {'success': True, 'differences': len(diff)}
 
 
 @app.route('/api/validate_epg_offline', methods=['POST'])
 def validate_epg_offline():
     """Validate XStream epg_channel_id against cached XML without new logins."""
-    global epg_program_counts
     try:
-        xml_text = get_xml_text_from_memory()
-        if not xml_text:
+        xml_path = get_xml_path()
+        if not xml_path:
             return jsonify({'success': False, 'error': 'Keine EPG XML geladen. Bitte Bulk-EPG laden oder XML hochladen.'}), 400
-        # Ensure counts map
-        if not epg_program_counts:
-            epg_program_counts = build_epg_program_counts(xml_text)
+        # Ensure counts of the loaded XML: byte scan of the programme tags, the full parse is not needed here
+        source = last_xml_sha256 or xml_path
+        if epg_counts_source != source:
+            started = time.time()
+            counts = fast_count_programmes(xml_path)
+            app.logger.info(f"Fast-counted {sum(counts.values())} programmes in {time.time() - started:.2f}s")
+            publish_programme_counts(counts, source)
+            if os.environ.get('EPG_FASTCOUNT_CHECK'):
+                jobs.submit('fastcount_check', run_fastcount_check, xml_path, counts)
+        validation_cfg = load_config().get('validation') or {}
+        min_horizon_hours = float(validation_cfg.get('min_horizon_hours', 24))
+        max_gap_minutes = float(validation_cfg.get('max_gap_minutes', 120))
+        now = int(time.time())
         results = []
-        for ch in xstream_channels:
+        # One consistent snapshot of the state; swaps by jobs meanwhile do not mix in
+        with state_lock:
+            channels, program_counts, fingerprints, coverage = (xstream_channels, epg_program_counts,
+                                                                epg_fingerprints, epg_coverage)
+        # Mapping rules applied once per XStream list, see resolved_xstream_keys()
+        for ch, (epg_key, mapped_id) in zip(channels, resolved_xstream_keys(channels)):
             epg_id_raw = ch.get('epg_channel_id') or ''
             epg_id = epg_id_raw.strip()
-            epg_key = epg_id.lower()
             
-            mapped_id = None
-            # Apply manual mapping
-            if epg_key in EPG_ID_MAPPING:
-                mapped_id = EPG_ID_MAPPING[epg_key]
-                epg_key = mapped_id
-                
             if not epg_id:
                 results.append({
                     'stream_id': ch.get('stream_id'),
@@ -1266,7 +1965,7 @@ def validate_epg_offline():
                     'programmes': 0
                 })
                 continue
-            if epg_key not in epg_program_counts:
+            if epg_key not in program_counts:
                 results.append({
                     'stream_id': ch.get('stream_id'),
                     'name': ch.get('name', ''),
@@ -1276,108 +1975,171 @@ def validate_epg_offline():
                     'programmes': 0
                 })
             else:
-                count = epg_program_counts.get(epg_key, 0)
-                status = 'ok' if count > 0 else 'no_programmes'
-                results.append({
+                count = program_counts.get(epg_key, 0)
+                entry = {
                     'stream_id': ch.get('stream_id'),
                     'name': ch.get('name', ''),
                     'epg_id': epg_id_raw,
                     'mapped_id': mapped_id,
-                    'status': status,
+                    'status': 'ok' if count > 0 else 'no_programmes',
                     'programmes': count
-                })
+                }
+                # Freshness from the parse-time coverage (not available after a fast count)
+                fingerprint = fingerprints.get(epg_key)
+                if count > 0 and epg_key in coverage and fingerprint and fingerprint[2] is not None:
+                    entry.update(coverage_summary(coverage[epg_key], fingerprint[2], now))
+                    if entry['last_stop'] <= now:
+                        entry['status'] = 'stale'
+                    elif entry['horizon_hours'] < min_horizon_hours:
+                        entry['status'] = 'short_horizon'
+                    elif entry['max_gap_minutes'] > max_gap_minutes:
+                        entry['status'] = 'gaps'
+                results.append(entry)
         return jsonify({'success': True, 'results': results})
     except Exception as e:
         app.logger.error(f"Error validating EPG offline: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/epg_delta', methods=['GET'])
+def get_epg_delta():
+    """Return what changed per channel between the previous and the currently loaded EPG.
+
+    Computed from the channel fingerprints when an EPG with new content is
+    published: added/removed channels, changed schedules and those whose
+    coverage shrank. `fingerprints=1` adds the current fingerprints of the
+    listed channels.
+    """
+    delta = epg_delta
+    if not delta:
+        return jsonify({'success': False, 'error': 'Kein EPG-Delta vorhanden (entsteht erst beim Laden einer geänderten EPG)'}), 404
+    response = {'success': True, 'delta': delta}
+    if request.args.get('fingerprints') in ('1', 'true'):
+        response['fingerprints'] = {key: epg_fingerprints.get(key)
+                                    for key in delta['added'] + delta['changed']}
+    return jsonify(response)
+
+
 @app.route('/api/get_epg_programs', methods=['GET'])
 def get_epg_programs():
-    """Return a small sample of programmes for a given EPG channel id from cached XML."""
+    """Return programmes for a given EPG channel id, optionally within a time window.
+
+    Query params: epg_id (required), limit (1..500, default 20), offset (>= 0, default 0),
+    start/end (epoch seconds, XMLTV timestamp or ISO 8601; overlap filter).
+    Served from the SQLite programme index; falls back to scanning the XML
+    while the index for the loaded EPG is still being built.
+    """
     try:
         epg_id = request.args.get('epg_id', '').strip()
-        limit = int(request.args.get('limit', '20'))
+        try:
+            limit = int(request.args.get('limit', '20'))
+            offset = int(request.args.get('offset', '0'))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Ungültige offset/limit Angabe'}), 400
+        if not 1 <= limit <= MAX_EPG_PROGRAMS_LIMIT or offset < 0:
+            return jsonify({'success': False, 'error': f'limit muss zwischen 1 und {MAX_EPG_PROGRAMS_LIMIT} liegen, '
+                                                       f'offset mindestens 0 sein'}), 400
         if not epg_id:
             return jsonify({'success': False, 'error': 'epg_id erforderlich'}), 400
-        xml_text = get_xml_text_from_memory()
-        if not xml_text:
+        try:
+            start_ts = parse_time_arg(request.args.get('start'))
+            end_ts = parse_time_arg(request.args.get('end'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        xml_path = get_xml_path()
+        if not xml_path:
             return jsonify({'success': False, 'error': 'Keine EPG XML geladen.'}), 400
-        programmes = []
-        epg_key = epg_id.lower()
+        # Apply mapping rules (client ids are not memoized)
+        epg_id_mapper.refresh()
+        epg_key = epg_id_mapper.resolve(epg_id.lower(), memo=False)
         
-        # Apply manual mapping
-        if epg_key in EPG_ID_MAPPING:
-            epg_key = EPG_ID_MAPPING[epg_key]
-            
-        found_count = 0
-        try:
-            for event, elem in ET.iterparse(io.StringIO(xml_text)):
-                if elem.tag == 'programme':
-                    ch_attr = (elem.get('channel', '') or '').strip()
-                    if ch_attr and ch_attr.lower() == epg_key:
-                        found_count += 1
-                        title_elem = elem.find('title')
-                        desc_elem = elem.find('desc')
-                        title_text = (title_elem.text or '').strip() if title_elem is not None else ''
-                        desc_text = (desc_elem.text or '').strip() if desc_elem is not None else ''
-                        # Add programme regardless of whether title is empty or not
-                        programmes.append({
-                            'start': elem.get('start', ''),
-                            'stop': elem.get('stop', ''),
-                            'title': title_text,
-                            'desc': desc_text
-                        })
-                        if len(programmes) >= limit:
-                            elem.clear()
-                            break
-                    # Clear element AFTER we've extracted what we need
-                    elem.clear()
-        except Exception as e:
-            app.logger.error(f"Error iterating programmes: {str(e)}")
+        if programme_index.is_current(last_xml_sha256):
+            found_count, programmes = programme_index.query(epg_key, start_ts, end_ts, offset, limit)
+            source = 'index'
+        else:
+            found_count, programmes = scan_epg_programs(xml_path, epg_key, start_ts, end_ts, offset, limit)
+            source = 'scan'
+            submit_programme_index()
         
-        app.logger.info(f"get_epg_programs: Found {found_count} total for {epg_id}, returning {len(programmes)} with limit {limit}")
+        app.logger.info(f"get_epg_programs: Found {found_count} total for {epg_id} ({source}), returning {len(programmes)} with limit {limit}")
         return jsonify({
             'success': True, 
             'epg_id': epg_id, 
             'programmes': programmes,
+            'total': found_count,
+            'offset': offset,
+            'source': source,
             'debug_total_found': found_count
         })
     except Exception as e:
         app.logger.error(f"Error in get_epg_programs: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+
+def scan_epg_programs(xml_path, epg_key, start_ts, end_ts, offset, limit):
+    """Linear scan fallback for get_epg_programs; stops once the page is full."""
+    programmes = []
+    found_count = 0
+    try:
+        with open_xml_file(xml_path) as xml_file:
+            for event, elem in ET.iterparse(xml_file):
+                if elem.tag == 'programme':
+                    ch_attr = (elem.get('channel', '') or '').strip()
+                    if ch_attr and ch_attr.lower() == epg_key:
+                        prog_start = parse_xmltv_time(elem.get('start', ''))
+                        prog_stop = parse_xmltv_time(elem.get('stop', ''))
+                        in_window = ((start_ts is None or (prog_stop is not None and prog_stop > start_ts)) and
+                                     (end_ts is None or (prog_start is not None and prog_start < end_ts)))
+                        if in_window:
+                            found_count += 1
+                            if found_count > offset:
+                                title_elem = elem.find('title')
+                                desc_elem = elem.find('desc')
+                                # Add programme regardless of whether title is empty or not
+                                programmes.append({
+                                    'start': elem.get('start', ''),
+                                    'stop': elem.get('stop', ''),
+                                    'title': (title_elem.text or '').strip() if title_elem is not None else '',
+                                    'desc': (desc_elem.text or '').strip() if desc_elem is not None else ''
+                                })
+                                if len(programmes) >= limit:
+                                    elem.clear()
+                                    break
+                    # Clear element AFTER we've extracted what we need
+                    elem.clear()
+    except Exception as e:
+        app.logger.error(f"Error iterating programmes: {str(e)}")
+    return found_count, programmes
+
 @app.route('/api/get_channels', methods=['GET'])
 def get_channels():
+    """Search the XStream and XML channel lists, one page at a time.
+
+    Query params: search (substring of the name, case-insensitive), list
+    ('xstream' or 'xml'; default both), offset (default 0), limit (default
+    all), sort ('name', 'programmes' for XML; '-' prefix for descending;
+    default list order). Returns the page per list and the total number of
+    matches ('xstream_total', 'xml_total').
+    """
     try:
         search = request.args.get('search', '').lower()
+        which = request.args.get('list', '')
+        sort = request.args.get('sort', '')
+        try:
+            offset = max(0, int(request.args.get('offset', '0')))
+            limit = request.args.get('limit')
+            limit = max(0, int(limit)) if limit not in (None, '') else None
+        except ValueError:
+            return jsonify({'xstream': [], 'xml': [], 'error': 'Ungültige offset/limit Angabe'}), 400
         
         # Pollution guard: if xml_channels contains stream_id or has XStream structure, clear it
         if xml_channels and any('stream_id' in ch for ch in xml_channels[:10]):
             app.logger.warning(f"Pollution detected in xml_channels: contains 'stream_id'. Clearing.")
-            xml_channels.clear()
+            clear_xml_channels()
         
-        filtered_xstream = [ch for ch in xstream_channels if search in ch.get('name', '').lower()] if search else xstream_channels
-        filtered_xml = [ch for ch in xml_channels if search in ch.get('name', '').lower()] if search else xml_channels
-        
-        # Enrich XML channels with programme counts
-        enriched_xml = []
-        for ch in (filtered_xml or []):
-            c_id = ch.get('id', '')
-            count = epg_program_counts.get(c_id.lower(), 0)
-            new_ch = ch.copy()
-            new_ch['programmes'] = count
-            enriched_xml.append(new_ch)
-        
-        return jsonify({
-            'xstream': filtered_xstream,
-            'xml': enriched_xml,
-            '_debug': {
-                'xstream_count': len(xstream_channels),
-                'xml_count': len(xml_channels),
-                'search': search
-            }
-        })
+        # Serialized once per state version and query
+        key = 'get_channels?' + '&'.join(f'{k}={v}' for k, v in sorted(request.args.items()))
+        return cached_json_response(key, lambda: channels_page(search, which, offset, limit, sort))
     except Exception as e:
         app.logger.error(f"Error in get_channels: {str(e)}")
         return jsonify({
@@ -1386,6 +2148,49 @@ def get_channels():
             'error': str(e)
         }), 500
 
+
+def channels_page(search: str, which: str, offset: int, limit, sort: str) -> dict:
+    """Response body of get_channels (built under state_lock, see cached_json_response)."""
+    result = {}
+    if which in ('', 'xstream'):
+        index = channel_search_index('xstream', xstream_channels)
+        total, page = index.page(search, offset, limit, sort if sort.lstrip('-') == 'name' else '')
+        result['xstream'] = page
+        result['xstream_total'] = total
+    if which in ('', 'xml'):
+        index = channel_search_index('xml', xml_channels)
+        xml_sort = sort.replace('programmes', 'value')
+        total, page = index.page(search, offset, limit, xml_sort,
+                                 value=lambda ch: epg_program_counts.get((ch.get('id') or '').lower(), 0),
+                                 version=state_version)
+        # Enrich the page's XML channels with programme counts
+        enriched_xml = []
+        for ch in page:
+            c_id = ch.get('id', '')
+            count = epg_program_counts.get(c_id.lower(), 0)
+            new_ch = ch.copy()
+            new_ch['programmes'] = count
+            enriched_xml.append(new_ch)
+        result['xml'] = enriched_xml
+        result['xml_total'] = total
+    
+    result['offset'] = offset
+    result['limit'] = limit
+    result['_debug'] = {
+        'xstream_count': len(xstream_channels),
+        'xml_count': len(xml_channels),
+        'search': search
+    }
+    return result
+
+
+def channel_search_index(kind: str, channels) -> ChannelSearchIndex:
+    """Search index of a channel list, rebuilt when the list's channels changed."""
+    index = channel_search.get(kind)
+    if index is None or not index.is_for(channels):
+        index = channel_search[kind] = ChannelSearchIndex(channels)
+    return index
+
 @app.route('/api/add_to_program_list', methods=['POST'])
 def add_to_program_list():
     global program_list, next_entry_id
@@ -1415,13 +2220,15 @@ def add_to_program_list():
         
         # Always append a new entry (multiple entries with same number are allowed)
         entry = {
-            'id': next_entry_id,
+            'id': None,  # Assigned under state_lock
             'number': number,
             'xstream': xstream_ch,
             'xml': xml_ch
         }
-        program_list.append(entry)
-        next_entry_id += 1
+        with state_lock:
+            entry['id'] = next_entry_id
+            program_list = program_list + [entry]
+            next_entry_id += 1
         
         return jsonify({'success': True})
     
@@ -1461,8 +2268,9 @@ def remove_from_program_list():
         if not entry_id:
             return jsonify({'success': False, 'error': 'ID erforderlich'}), 400
         
-        # Find and remove the entry by ID (modify in-place to persist)
-        program_list[:] = [entry for entry in program_list if entry['id'] != entry_id]
+        # Find and remove the entry by ID (new list swapped in)
+        with state_lock:
+            program_list = [entry for entry in program_list if entry['id'] != entry_id]
         
         return jsonify({'success': True})
     
@@ -1472,62 +2280,103 @@ def remove_from_program_list():
 
 @app.route('/api/auto_match', methods=['POST'])
 def auto_match():
+    """Start auto-matching as a background job (a running one is reused)."""
+    global auto_match_job
+    if not auto_match_job or auto_match_job.finished:
+        auto_match_job = jobs.submit('auto_match', run_auto_match)
+    return jsonify({'success': True, 'job_id': auto_match_job.id, 'job': auto_match_job.to_dict()}), 202
+
+
+def run_auto_match(job):
+    """Job: add the XML match of every XStream channel to the program list.
+
+    Matched by epg_channel_id, else by normalized name, else the best name
+    similarity above MATCH_THRESHOLD (memoized in match_cache, so re-runs
+    score only new or renamed channels). Channels already in the list from
+    an earlier auto-match get their entry replaced at the same position;
+    entries added by hand are left alone.
+    """
     global program_list, next_entry_id
+    xstream_list = list(xstream_channels)
+    xml_list = list(xml_channels)
+    # Exact epg_channel_id / normalized name first; only the rest goes through fuzzy scoring
+    epg_id_mapper.refresh()
+    found = match_exact(xstream_list, xml_list, epg_id_mapper)
+    leftover = [i for i, match in enumerate(found) if match is None]
+    job.update(phase='match', items_total=len(xstream_list), items_processed=len(xstream_list) - len(leftover))
+    fuzzy, rescored = match_cache.match([xstream_list[i].get('name', '') for i in leftover],
+                                        [xml_ch.get('name', '') for xml_ch in xml_list],
+                                        progress=lambda done, total: job.update(
+                                            items_processed=len(xstream_list) - total + done))
+    match_cache.save()
+    for i, match in zip(leftover, fuzzy):
+        if match:
+            found[i] = (match[0], 'fuzzy')
     
     matches = 0
-    threshold = 0.8
-    
-    # Auto-generate numbers starting from 1
-    next_number = 1
-    
-    for xstream_ch in xstream_channels:
-        best_match = None
-        best_score = 0.0
-        
-        for xml_ch in xml_channels:
-            score = SequenceMatcher(None, xstream_ch.get('name', '').lower(), xml_ch.get('name', '').lower()).ratio()
-            if score > best_score and score > threshold:
-                best_score = score
-                best_match = xml_ch
-        
-        if best_match:
-            # Find next available number
-            while any(entry['number'] == str(next_number) for entry in program_list):
+    updated = 0
+    by_method = {'epg_id': 0, 'name': 0, 'fuzzy': 0}
+    # Merged into a new list under the lock (entries added meanwhile by hand are kept), then swapped in
+    with state_lock:
+        entries = list(program_list)
+        # Position of the entry per XStream channel, to update instead of adding a second one
+        existing = {str(entry['xstream'].get('stream_id')): pos for pos, entry in enumerate(entries)
+                    if entry.get('xstream') and entry['xstream'].get('stream_id') is not None}
+        # Auto-generate numbers starting from 1, skipping numbers already in use
+        used_numbers = {entry['number'] for entry in entries}
+        next_number = 1
+
+        for xstream_ch, match in zip(xstream_list, found):
+            if not match:
+                continue
+            by_method[match[1]] += 1
+            xml_ch = xml_list[match[0]]
+            pos = existing.get(str(xstream_ch.get('stream_id'))) if xstream_ch.get('stream_id') is not None else None
+            if pos is not None:
+                entry = entries[pos]
+                if entry.get('auto'):
+                    if entry['xml'] != xml_ch:
+                        updated += 1
+                    entries[pos] = dict(entry, xstream=xstream_ch, xml=xml_ch, auto=match[1])
+                continue
+            while str(next_number) in used_numbers:
                 next_number += 1
-            
+
             entry = {
                 'id': next_entry_id,
                 'number': str(next_number),
                 'xstream': xstream_ch,
-                'xml': best_match
+                'xml': xml_ch,
+                'auto': match[1]
             }
-            program_list.append(entry)
+            entries.append(entry)
+            used_numbers.add(entry['number'])
             next_entry_id += 1
             matches += 1
             next_number += 1
-    
-    return jsonify({
+        program_list = entries
+
+    return {
         'success': True,
-        'matches': matches
-    })
+        'matches': matches,
+        'updated': updated,
+        'rescored': rescored,
+        'by_method': by_method
+    }
 
 @app.route('/api/list_cache', methods=['GET'])
 def list_cache():
-    """List all cached EPG files with metadata."""
-    metadata = load_cache_metadata()
-    files = metadata.get('files', {})
-    
-    cache_list = []
-    for filename, info in files.items():
-        cache_list.append({
-            'filename': filename,
-            'path': info.get('path'),
-            'size': info.get('size', 0),
-            'created': info.get('created', '')
-        })
-    
-    # Sort by creation date (newest first)
-    cache_list.sort(key=lambda x: x['created'], reverse=True)
+    """List all cached EPG files with metadata (newest first), straight from the catalog."""
+    cache_list = [{
+        'filename': entry['filename'],
+        'path': entry['path'],
+        'size': entry['size'],
+        'created': entry['created'],
+        'last_access': entry['last_access'],
+        'source_url': entry['source_url'],
+        'sha256': entry['sha256'],
+        'stats': entry['stats']
+    } for entry in cache_catalog.list()]
     
     return jsonify({
         'success': True,
@@ -1537,55 +2386,38 @@ def list_cache():
 @app.route('/api/load_from_cache', methods=['POST'])
 def load_from_cache():
     """Load EPG XML from cache file."""
-    global last_xml_raw, last_xml_content, last_xml_is_gz, last_xml_source_name, epg_program_counts, xml_channels
-    
     data = request.get_json() or {}
     filename = data.get('filename', '').strip()
     
     if not filename:
         return jsonify({'success': False, 'error': 'Filename erforderlich'}), 400
     
-    metadata = load_cache_metadata()
-    files = metadata.get('files', {})
-    
-    if filename not in files:
+    file_info = cache_catalog.get(filename)
+    if file_info is None:
         return jsonify({'success': False, 'error': 'Datei nicht gefunden'}), 404
     
-    file_info = files[filename]
-    file_path = file_info.get('path')
+    file_path = file_info['path']
     
     if not os.path.exists(file_path):
         return jsonify({'success': False, 'error': 'Datei wurde gelöscht'}), 404
     
     try:
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
-        
-        # Detect if gzipped
-        is_gz = filename.endswith('.gz') or file_content[:2] == b'\x1f\x8b'
-        
-        # Decompress if needed
-        if is_gz:
+        touch_cached(file_path)
+        # Reuse the parse snapshot if the file content is unchanged; parse only on a miss
+        result = load_snapshot(file_path)
+        if result is None:
             try:
-                content = gzip.decompress(file_content).decode('utf-8')
-            except Exception as e:
+                result = parse_xmltv(file_path)
+            except zlib.error as e:
                 return jsonify({'success': False, 'error': f'Dekomprimierung fehlgeschlagen: {str(e)}'}), 500
-        else:
-            content = file_content.decode('utf-8')
-        
-        # Store in globals
-        last_xml_raw = file_content
-        last_xml_content = content
-        last_xml_is_gz = is_gz
-        last_xml_source_name = filename
-        
-        # Parse channels via utils
-        xml_channels.clear()
-        xml_channels.extend(parse_xml_channels(content))
+            with open(file_path, 'rb') as f:
+                result['is_gz'] = detect_gzip_bytes(f.read(2))
+            if not result['error']:
+                write_snapshot(file_path, result, file_sha256(file_path))
+                cache_catalog.set_stats(filename, result['stats'])
         
-        # Build program counts
-        epg_program_counts.clear()
-        epg_program_counts.update(build_epg_program_counts_logged(content))
+        # The cache file itself is the loaded XML (readers gunzip on the fly)
+        publish_epg_ingest(result, filename, file_path, xml_path=file_path)
         
         return jsonify({
             'success': True,
@@ -1608,22 +2440,16 @@ def delete_cache_file():
     if not filename:
         return jsonify({'success': False, 'error': 'Filename erforderlich'}), 400
     
-    metadata = load_cache_metadata()
-    files = metadata.get('files', {})
-    
-    if filename not in files:
-        return jsonify({'success': False, 'error': 'Datei nicht gefunden'}), 404
-    
-    file_info = files[filename]
-    file_path = file_info.get('path')
-    
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # Remove from metadata
-        del metadata['files'][filename]
-        save_cache_metadata(metadata)
+        file_info, shared = cache_catalog.remove(filename)
+        if file_info is None:
+            return jsonify({'success': False, 'error': 'Datei nicht gefunden'}), 404
+        file_path = file_info['path']
+        # A store blob may also be cached under another name or be the loaded EPG
+        if not shared and file_path not in (last_xml_path, last_xml_raw_path):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            remove_snapshot(file_path)
         
         return jsonify({'success': True})
     
@@ -1636,4 +2462,10 @@ if __name__ == '__main__':
     startup_config = load_config()
     host = startup_config['server']['host']
     port = startup_config['server']['port']
-    app.run(host=host, port=port, debug=True)
+    app.logger.info(f"XMLTV parser backend: {PARSER_BACKEND}")
+    app.logger.info(f"JSON codec: {JSON_CODEC}")
+    debug = True
+    # With the debug reloader only the serving child process runs the scheduler
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduler(startup_config)
+    app.run(host=host, port=port, debug=debug)
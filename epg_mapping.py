@@ -0,0 +1,185 @@
+import json
+import os
+import re
+import threading
+
+
+# -----------------------------
+# EPG ID mapping rules
+# -----------------------------
+
+REGEX_PREFIX = 're:'
+TEMPLATE_GROUP = re.compile(r'\\(\d+)')
+
+
+def _compile_rule(source: str, target: str):
+    """(regex, template) of a pattern rule; `*` in a glob becomes a group, `*` in its target that group."""
+    if source.startswith(REGEX_PREFIX):
+        return source[len(REGEX_PREFIX):], target
+    parts = source.split('*')
+    pattern = '(.*)'.join(re.escape(part) for part in parts)
+    pieces = target.split('*')
+    template = pieces[0]
+    for i, piece in enumerate(pieces[1:], 1):
+        template += f'\\{i}' + piece.replace('\\', '\\\\')
+    return pattern, template
+
+
+def _group_reference(pattern: str):
+    """The first group reference or named group in `pattern` (`\\1`, `(?P=x)`, `(?(1)`, `(?P<x>`), or None.
+
+    Such rules cannot go into the combined alternation: the group numbers
+    and names there belong to the whole expression, not to the rule.
+    """
+    i = 0
+    in_class = False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if not in_class and escaped and escaped in '123456789':
+                return c + escaped
+            i += 2
+            continue
+        if in_class:
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+            i += 1
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            continue
+        elif pattern.startswith(('(?P=', '(?P<', '(?('), i):
+            return pattern[i:i + 4]
+        i += 1
+    return None
+
+
+class EpgIdMapper:
+    """Rewrites XStream epg_channel_ids to XMLTV channel ids, with rules from a JSON file.
+
+    The file holds one object `{"source": "target"}` (lowercased on load,
+    except regular expressions).
+    Sources without wildcards are exact rules, looked up in a dict; sources
+    with `*` are globs (`"*.de": "*.de.hd"`) and `re:`-prefixed ones
+    regular expressions (target with `\\1`...). All pattern rules are
+    compiled into one alternation, the first matching rule in file order
+    wins; exact rules go first. Regular expressions with backreferences or
+    named groups are rejected (warning in the log). `defaults` apply where the file has no
+    exact rule. The file is reloaded by `refresh()` when its mtime or size
+    changed; `version` counts the loads.
+    """
+
+    def __init__(self, path: str, defaults=None, logger=None):
+        self.path = path
+        self.defaults = {k.lower(): v.lower() for k, v in (defaults or {}).items()}
+        self.logger = logger
+        self.version = 0
+        self.rule_count = len(self.defaults)
+        # (exact dict, combined pattern, {group name: (first group, group count, template)}, resolved keys),
+        # swapped as a whole on reload
+        self._rules = (dict(self.defaults), None, {}, {})
+        self._stamp = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Reload the rules if the file changed since the last load. Returns True if reloaded."""
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return False
+        with self._lock:
+            if stamp == self._stamp:
+                return False
+            rules = {}
+            if stamp is not None:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        rules = json.load(f) or {}
+                    if not isinstance(rules, dict):
+                        raise ValueError('expected a JSON object')
+                except (OSError, ValueError) as e:
+                    # Keep the previous rules until the file is fixed
+                    if self.logger:
+                        self.logger.warning(f"EPG ID mapping {self.path} not loaded: {e}")
+                    self._stamp = stamp
+                    return False
+            self._compile(rules)
+            self._stamp = stamp
+            self.version += 1
+            if self.logger and stamp is not None:
+                self.logger.info(f"EPG ID mapping loaded: {self.rule_count} rules from {self.path}")
+            return True
+
+    def _compile(self, rules: dict):
+        exact = dict(self.defaults)
+        alternatives = []
+        templates = {}
+        group = 1
+        for source, target in rules.items():
+            if not isinstance(source, str) or not isinstance(target, str):
+                continue
+            source = source.strip()
+            target = target.strip().lower()
+            if not source.startswith(REGEX_PREFIX):
+                # Regular expressions keep their case (\W vs \w); they are matched against lowercased ids
+                source = source.lower()
+            if not source:
+                continue
+            if '*' not in source and not source.startswith(REGEX_PREFIX):
+                exact[source] = target
+                continue
+            pattern, template = _compile_rule(source, target)
+            reference = _group_reference(pattern)
+            if reference:
+                if self.logger:
+                    self.logger.warning(f"EPG ID mapping: rule {source!r} rejected, "
+                                        f"backreferences and named groups are not supported ({reference!r})")
+                continue
+            try:
+                groups = re.compile(pattern).groups
+            except re.error as e:
+                if self.logger:
+                    self.logger.warning(f"EPG ID mapping: invalid rule {source!r}: {e}")
+                continue
+            name = f'r{len(templates)}'
+            alternatives.append(f'(?P<{name}>{pattern})')
+            templates[name] = (group + 1, groups, template)
+            group += 1 + groups
+        patterns = re.compile('|'.join(alternatives)) if alternatives else None
+        self._rules = (exact, patterns, templates, {})
+        self.rule_count = len(exact) + len(templates)
+
+    def resolve(self, key: str, memo: bool = True) -> str:
+        """The mapped id of a lowercased epg_channel_id, or `key` itself if no rule applies.
+
+        Pattern results are memoized per key; pass memo=False for ids from
+        client requests so the memo stays bounded by the XStream ids.
+        """
+        exact, patterns, templates, resolved = self._rules
+        mapped = exact.get(key)
+        if mapped is not None:
+            return mapped
+        mapped = resolved.get(key)
+        if mapped is None:
+            mapped = key
+            m = patterns.fullmatch(key) if patterns is not None and key else None
+            if m:
+                first, count, template = templates[m.lastgroup]
+                groups = m.groups()[first - 1:first - 1 + count]
+                mapped = TEMPLATE_GROUP.sub(lambda g: groups[int(g.group(1)) - 1] or ''
+                                            if 0 < int(g.group(1)) <= count else '', template)
+            if memo:
+                resolved[key] = mapped
+        return mapped
+
+    def get(self, key: str, default=None, memo: bool = True):
+        """Dict-style lookup: the mapped id if a rule applies to `key`, else `default`."""
+        mapped = self.resolve(key, memo)
+        return mapped if mapped != key or key in self._rules[0] else default
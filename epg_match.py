@@ -0,0 +1,345 @@
+import json
+import os
+import re
+import unicodedata
+import zlib
+from collections import Counter
+from functools import lru_cache
+from concurrent.futures import wait, FIRST_COMPLETED
+from difflib import SequenceMatcher
+
+from epg_parallel import worker_pool
+
+
+# -----------------------------
+# Channel name matching (auto_match)
+# -----------------------------
+
+MATCH_THRESHOLD = 0.8
+MATCH_WORKERS = int(os.environ.get('EPG_MATCH_WORKERS', '0')) or (os.cpu_count() or 1)
+MATCH_CHUNK = 500  # XStream names per task; progress and cancellation happen between chunks
+
+UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue'})  # ß is already 'ss' after casefold()
+# Country/language prefix as IPTV lists write it: "DE: ", "DE| ", "|DE| ", "[DE] ", "(AT) "
+COUNTRY_PREFIX = re.compile(r'^\W*[a-z]{2}\s*[:|\])]\W*')
+QUALITY_TOKENS = frozenset(('hd', 'fhd', 'uhd', '4k'))
+NAME_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(name: str) -> str:
+    """Comparison key of a channel name: "DE: Das Erste HD" and "Das Erste" both give 'daserste'.
+
+    Case folded, umlauts transliterated and other diacritics dropped,
+    country prefix and HD/FHD/UHD/4K tokens removed, punctuation and
+    spaces ignored. Cached, as the same names come up on every run.
+    """
+    text = unicodedata.normalize('NFKD', (name or '').casefold().translate(UMLAUTS))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = COUNTRY_PREFIX.sub('', text)
+    return ''.join(token for token in NAME_TOKEN.findall(text) if token not in QUALITY_TOKENS)
+
+
+def match_exact(xstream_channels, xml_channels, id_mapping=None):
+    """Exact matches before fuzzy scoring: list of (xml index, method) or None per XStream channel.
+
+    First the (mapped, lowercased) `epg_channel_id` is looked up among the
+    XML channel ids ('epg_id'), then the normalized name among the
+    normalized XML names ('name'); the first XML channel wins on duplicates.
+    """
+    id_mapping = id_mapping or {}
+    by_id = {}
+    by_name = {}
+    for idx, xml_ch in enumerate(xml_channels):
+        by_id.setdefault((xml_ch.get('id') or '').strip().lower(), idx)
+        by_name.setdefault(normalize_name(xml_ch.get('name')), idx)
+    by_id.pop('', None)
+    by_name.pop('', None)
+    results = []
+    for xstream_ch in xstream_channels:
+        epg_key = (xstream_ch.get('epg_channel_id') or '').strip().lower()
+        epg_key = id_mapping.get(epg_key, epg_key)
+        if epg_key in by_id:
+            results.append((by_id[epg_key], 'epg_id'))
+            continue
+        key = normalize_name(xstream_ch.get('name'))
+        results.append((by_name[key], 'name') if key in by_name else None)
+    return results
+
+
+def _bigram_tokens(name: str):
+    """Bigram occurrences of `name` as (bigram, n-th occurrence), so sets behave like multisets."""
+    seen = Counter()
+    tokens = []
+    for i in range(len(name) - 1):
+        bigram = name[i:i + 2]
+        tokens.append((bigram, seen[bigram]))
+        seen[bigram] += 1
+    return tokens
+
+
+class ChannelMatcher:
+    """Finds the best `SequenceMatcher(None, a, b).ratio()` match of a name among fixed names.
+
+    Gives exactly the result of scoring every pair, but only scores a few
+    candidates, found through an inverted index of bigram occurrences:
+
+    A ratio above `threshold` needs M matched characters with 2M/T above
+    it (T = both lengths). The matching blocks are common substrings, one
+    fewer than there are unmatched characters at most, so both names share
+    at least 3M - T - 1 bigram occurrences. Only names sharing that many
+    (and long enough for M) can match; by the prefix filter principle they
+    share one of the query's rarest n - tau + 1 bigrams, so just those
+    posting lists are read. Only very short names (nothing to share) are
+    compared by length alone. Two empty names score 1.0, as in
+    SequenceMatcher, so a nameless channel matches the first nameless one.
+    """
+
+    def __init__(self, names, threshold: float = MATCH_THRESHOLD):
+        self.threshold = threshold
+        self.names = [(name or '').lower() for name in names]
+        self.lengths = [len(name) for name in self.names]
+        self.bigrams = [Counter(name[i:i + 2] for i in range(len(name) - 1)) for name in self.names]
+        self.postings = {}
+        self.by_length = {}
+        for idx, name in enumerate(self.names):
+            self.by_length.setdefault(len(name), []).append(idx)
+            for token in _bigram_tokens(name):
+                self.postings.setdefault(token, []).append(idx)
+        self._scorers = {}
+        self._min_matches = {}
+
+    def _min_match(self, total: int) -> int:
+        """Smallest number of matched characters M with 2M/total above the threshold."""
+        m = self._min_matches.get(total)
+        if m is None:
+            m = max(0, int(self.threshold * total / 2) - 1)
+            # Same float expression as SequenceMatcher.ratio()
+            while total and 2.0 * m / total <= self.threshold:
+                m += 1
+            self._min_matches[total] = m
+        return m
+
+    def _scorer(self, idx: int) -> SequenceMatcher:
+        # SequenceMatcher caches its analysis of the second sequence; keep one per name
+        scorer = self._scorers.get(idx)
+        if scorer is None:
+            scorer = self._scorers[idx] = SequenceMatcher(None, '', self.names[idx])
+        return scorer
+
+    def candidates(self, name: str):
+        """Indexes of all names that can score above the threshold against `name`, ascending."""
+        name = (name or '').lower()
+        la = len(name)
+        # Lengths lb for which min(la, lb) can hold enough matches, and their bigram bound
+        window = {}
+        for lb in self.by_length:
+            total = la + lb
+            if not total:
+                # SequenceMatcher('', '').ratio() is 1.0
+                if self.threshold < 1.0:
+                    window[lb] = 0
+                continue
+            m = self._min_match(total)
+            if m <= min(la, lb):
+                window[lb] = 3 * m - total - 1
+        if not window:
+            return []
+        tau = min(window.values())
+        if tau <= 0:
+            found = {idx for lb in window for idx in self.by_length[lb]}
+        else:
+            tokens = _bigram_tokens(name)
+            prefix = len(tokens) - tau + 1
+            if prefix <= 0:
+                return []
+            tokens.sort(key=lambda t: (len(self.postings.get(t, ())), t))
+            found = set()
+            for token in tokens[:prefix]:
+                found.update(self.postings.get(token, ()))
+        query = None
+        result = []
+        for idx in sorted(found):
+            need = window.get(self.lengths[idx])
+            if need is None:
+                continue
+            if need > 0:
+                if query is None:
+                    query = Counter(name[i:i + 2] for i in range(la - 1))
+                other = self.bigrams[idx]
+                if sum(min(count, other[b]) for b, count in query.items()) < need:
+                    continue
+            result.append(idx)
+        return result
+
+    def scores(self, name: str):
+        """Return [(index, score)] of all names scoring above the threshold, ascending by index."""
+        lowered = (name or '').lower()
+        found = []
+        for idx in self.candidates(lowered):
+            scorer = self._scorer(idx)
+            scorer.set_seq1(lowered)
+            score = scorer.ratio()
+            if score > self.threshold:
+                found.append((idx, score))
+        return found
+
+    def best(self, name: str):
+        """Return (index, score) of the first name with the highest score above the threshold, or None."""
+        return best_score(self.scores(name))
+
+
+def best_score(scores):
+    """The first (index, score) with the highest score of an index-ordered list, or None."""
+    best = None
+    for idx, score in scores:
+        if best is None or score > best[1]:
+            best = (idx, score)
+    return best
+
+
+# Matcher of a pool worker, built once per process by _init_worker
+_worker_matcher = None
+
+
+def _init_worker(xml_names, threshold):
+    global _worker_matcher
+    _worker_matcher = ChannelMatcher(xml_names, threshold)
+
+
+def _match_chunk(start, names, all_scores=False):
+    score = _worker_matcher.scores if all_scores else _worker_matcher.best
+    return start, [score(name) for name in names]
+
+
+def match_channels(names, xml_names, threshold: float = MATCH_THRESHOLD, workers: int = None,
+                   chunk_size: int = MATCH_CHUNK, progress=None, all_scores: bool = False):
+    """`ChannelMatcher(xml_names).best(name)` (`scores(name)` with `all_scores`) for every name, in order.
+
+    The names are scored in chunks of `chunk_size`, on a process pool of
+    `workers` (each worker indexes `xml_names` once) when there is more
+    than one chunk. `progress(done, total)` is called after each chunk; an
+    exception from it (e.g. JobCancelled) drops the chunks not started yet
+    and is re-raised.
+    """
+    names = list(names)
+    total = len(names)
+    results = [None] * total
+    if not total:
+        return results
+    chunks = [(start, names[start:start + chunk_size]) for start in range(0, total, chunk_size)]
+    workers = min(workers or MATCH_WORKERS, len(chunks))
+    if workers <= 1:
+        matcher = ChannelMatcher(xml_names, threshold)
+        score = matcher.scores if all_scores else matcher.best
+        for start, chunk in chunks:
+            results[start:start + len(chunk)] = [score(name) for name in chunk]
+            if progress:
+                progress(start + len(chunk), total)
+        return results
+
+    pool = worker_pool(workers, initializer=_init_worker, initargs=(list(xml_names), threshold))
+    try:
+        pending = {pool.submit(_match_chunk, start, chunk, all_scores) for start, chunk in chunks}
+        done_count = 0
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                start, chunk_results = future.result()
+                results[start:start + len(chunk_results)] = chunk_results
+                done_count += len(chunk_results)
+            if progress:
+                progress(done_count, total)
+    finally:
+        # On cancellation or error, queued chunks are dropped; running ones finish
+        pool.shutdown(wait=True, cancel_futures=True)
+    return results
+
+
+class MatchCache:
+    """Memo of fuzzy match scores for re-running auto-match, stored in `path`.
+
+    Keeps every above-threshold score of (XStream name, XML name) pairs,
+    keyed by the lowercased names SequenceMatcher compares, together with
+    the XML names they were scored against. A run then scores only new
+    XStream names against all XML names and the known ones against the XML
+    names added since; names no longer present are dropped. The results
+    are the same as `match_channels` on the full lists.
+    """
+
+    VERSION = 2  # 2: empty names score 1.0 against each other again
+
+    def __init__(self, path: str, threshold: float = MATCH_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.xml_names = set()
+        self.pairs = {}  # xstream name -> {xml name: score}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                payload = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        except Exception:
+            return
+        if payload.get('version') != self.VERSION or payload.get('threshold') != self.threshold:
+            return
+        self.xml_names = set(payload.get('xml_names') or ())
+        self.pairs = payload.get('pairs') or {}
+
+    def save(self):
+        """Write the memo (errors are swallowed; a lost memo only means a full rescore)."""
+        try:
+            payload = {
+                'version': self.VERSION,
+                'threshold': self.threshold,
+                'xml_names': sorted(self.xml_names),
+                'pairs': self.pairs,
+            }
+            data = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6)
+            tmp = self.path + '.part'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+    def match(self, names, xml_names, workers: int = None, progress=None):
+        """`match_channels(names, xml_names)`, scoring only what the memo does not cover.
+
+        Returns (results, rescored): rescored is the number of distinct
+        names that were scored against some XML names.
+        """
+        names = [(name or '').lower() for name in names]
+        xml_list = [(name or '').lower() for name in xml_names]
+        first_index = {}
+        for idx, name in enumerate(xml_list):
+            first_index.setdefault(name, idx)
+        added_xml = [name for name in first_index if name not in self.xml_names]
+        unique = list(dict.fromkeys(names))
+        new_names = [name for name in unique if name not in self.pairs]
+        known_names = [name for name in unique if name in self.pairs] if added_xml else []
+        total = len(new_names) + len(known_names)
+
+        pairs = {}
+        for name in unique:
+            if name in self.pairs:
+                # Scores against XML names still present
+                pairs[name] = {xml: score for xml, score in self.pairs[name].items() if xml in first_index}
+        offset = 0
+        for batch, targets in ((new_names, list(first_index)), (known_names, added_xml)):
+            if not batch:
+                continue
+            report = (lambda done, _, base=offset: progress(base + done, total)) if progress else None
+            scored = match_channels(batch, targets, self.threshold, workers, progress=report, all_scores=True)
+            for name, found in zip(batch, scored):
+                pairs.setdefault(name, {}).update((targets[idx], score) for idx, score in found)
+            offset += len(batch)
+        self.pairs = pairs
+        self.xml_names = set(first_index)
+
+        results = []
+        for name in names:
+            scores = sorted((first_index[xml], score) for xml, score in pairs[name].items())
+            results.append(best_score(scores))
+        return results, total
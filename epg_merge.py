@@ -0,0 +1,110 @@
+import os
+import zlib
+import xml.etree.ElementTree as ET
+
+from epg_utils import XmltvStreamParser, open_xml_file, iter_file_chunks, CHUNK_SIZE
+
+
+# -----------------------------
+# Multi-source XMLTV merge
+# -----------------------------
+
+MERGE_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="EpgChecker merge">\n'
+MERGE_FOOTER = b'</tv>\n'
+
+
+def _channel_key(value) -> str:
+    return (value or '').strip().lower()
+
+
+def assign_channel_owners(sources):
+    """Map channel id (lower) -> index of the first source (priority order) declaring or scheduling it."""
+    owners = {}
+    for idx, source in enumerate(sources):
+        result = source['result']
+        for ch in result['channels']:
+            owners.setdefault(_channel_key(ch.get('id')), idx)
+        for key in result['counts']:
+            owners.setdefault(key, idx)
+    owners.pop('', None)
+    return owners
+
+
+def iter_top_level(path):
+    """Yield the direct children of <tv> of an XMLTV file (plain or gzip), clearing them afterwards.
+
+    A broken or truncated file ends the iteration at the last complete
+    element, like the partial result of its parse.
+    """
+    depth = 0
+    root = None
+    with open_xml_file(path) as f:
+        try:
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if depth == 1:
+                        root = elem
+                    continue
+                depth -= 1
+                if depth == 1:
+                    yield elem
+                    root.clear()
+        except (ET.ParseError, EOFError, zlib.error):
+            return
+
+
+def serialize_element(elem) -> bytes:
+    elem.tail = '\n'
+    return b'  ' + ET.tostring(elem, encoding='utf-8')
+
+
+def merge_xmltv(sources, out_path: str):
+    """Merge several parsed XMLTV files into one, resolving channel id collisions by priority.
+
+    `sources` is a list of {'name', 'path', 'result'} in priority order (first
+    wins); 'result' is the parse result (channels/counts) of 'path'. Each
+    channel id is owned by exactly one source: its <channel> element and all
+    its programmes come from that source only, so schedules are never mixed.
+    Channels are written first, then programmes (spooled to a side file while
+    reading each source once). The output is parsed while it is written;
+    returns that parse result plus 'sources' with the owned channel and
+    programme counts per source.
+    """
+    owners = assign_channel_owners(sources)
+    parser = XmltvStreamParser()
+    tmp_path = out_path + '.part'
+    spool_path = out_path + '.programmes.part'
+    summary = []
+    try:
+        with open(tmp_path, 'wb') as out, open(spool_path, 'w+b') as spool:
+            def emit(data):
+                out.write(data)
+                parser.feed(data)
+
+            emit(MERGE_HEADER)
+            for idx, source in enumerate(sources):
+                channels = programmes = 0
+                for elem in iter_top_level(source['path']):
+                    if elem.tag == 'channel':
+                        if owners.get(_channel_key(elem.get('id'))) == idx:
+                            emit(serialize_element(elem))
+                            channels += 1
+                    elif elem.tag == 'programme':
+                        if owners.get(_channel_key(elem.get('channel'))) == idx:
+                            spool.write(serialize_element(elem))
+                            programmes += 1
+                summary.append({'name': source['name'], 'channels': channels, 'programmes': programmes})
+            spool.seek(0)
+            for chunk in iter_file_chunks(spool, CHUNK_SIZE):
+                emit(chunk)
+            emit(MERGE_FOOTER)
+            parser.close()
+        os.replace(tmp_path, out_path)
+    finally:
+        for path in (tmp_path, spool_path):
+            if os.path.exists(path):
+                os.remove(path)
+    result = parser.result()
+    result['sources'] = summary
+    return result
@@ -0,0 +1,200 @@
+import hashlib
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from epg_utils import XmltvStreamParser, detect_gzip_bytes, CHUNK_SIZE, DAY_SECONDS
+
+
+# -----------------------------
+# Multi-core parsing of large plain XMLTV files
+# -----------------------------
+
+# Files at or above this size (decompressed, on disk) are parsed in parallel
+PARALLEL_PARSE_THRESHOLD = int(os.environ.get('EPG_PARALLEL_PARSE_MB', '256')) * 1024 * 1024
+PARSE_WORKERS = int(os.environ.get('EPG_PARSE_WORKERS', '0')) or (os.cpu_count() or 1)
+
+# Pools are created from request and job threads; a forked child would inherit
+# locks other threads hold at that moment (logging, app state, jobs) and could
+# deadlock. Workers are started by a fork server (spawn where unavailable).
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+PROGRAMME_TAG = re.compile(rb'<programme[\s>/]')
+XML_DECLARATION = re.compile(rb'^\s*(<\?xml[^>]*\?>)')
+
+
+def worker_pool(max_workers: int, **kwargs) -> ProcessPoolExecutor:
+    """Process pool whose workers do not fork the calling (threaded) process, see POOL_START_METHOD."""
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(POOL_START_METHOD),
+                               **kwargs)
+
+
+def use_parallel(path: str, workers: int = None) -> bool:
+    """True if `path` is a plain (not gzip) file big enough to be worth splitting."""
+    workers = workers or PARSE_WORKERS
+    try:
+        if workers < 2 or os.path.getsize(path) < PARALLEL_PARSE_THRESHOLD:
+            return False
+        with open(path, 'rb') as f:
+            return not detect_gzip_bytes(f.read(2))
+    except OSError:
+        return False
+
+
+def _find_programme(f, pos: int):
+    """Offset of the first '<programme' tag at or after `pos`, or None."""
+    f.seek(pos)
+    overlap = b''
+    base = pos
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return None
+        data = overlap + chunk
+        match = PROGRAMME_TAG.search(data)
+        if match:
+            return base - len(overlap) + match.start()
+        overlap = data[-11:]
+        base += len(chunk)
+
+
+def plan_ranges(path: str, parts: int):
+    """Split a plain XMLTV file into byte ranges that start on '<programme' tags.
+
+    Returns [(start, end, head, tail)]: every range parses as a document of
+    its own once `head` is put before and `tail` after it. The first range
+    carries the XML header and all channels before the first split point.
+    Returns None if the file cannot be split safely (e.g. UTF-16).
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+        if head.startswith((b'\xff\xfe', b'\xfe\xff')) or b'\x00' in head:
+            return None
+        match = XML_DECLARATION.match(head)
+        declaration = match.group(1) if match else b''
+        bounds = [0]
+        for k in range(1, parts):
+            pos = max(size * k // parts, bounds[-1] + 1)
+            found = _find_programme(f, pos)
+            if found is None:
+                break
+            if found > bounds[-1]:
+                bounds.append(found)
+    bounds.append(size)
+    if len(bounds) < 3:
+        return None
+    ranges = []
+    last = len(bounds) - 2
+    for i in range(len(bounds) - 1):
+        ranges.append((bounds[i], bounds[i + 1],
+                       declaration + b'<tv>' if i > 0 else b'',
+                       b'</tv>' if i < last else b''))
+    return ranges
+
+
+def iter_range(path: str, start: int, end: int, head: bytes = b'', tail: bytes = b'', chunk_size: int = CHUNK_SIZE):
+    """Yield `head`, the bytes [start, end) of `path` and `tail` in chunks."""
+    if head:
+        yield head
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    if tail:
+        yield tail
+
+
+def run_ranges(fn, path: str, ranges, *args, workers: int = None):
+    """Run `fn(path, start, end, head, tail, index, *args)` for every range on a process pool.
+
+    Results come back in range order.
+    """
+    workers = min(workers or PARSE_WORKERS, len(ranges))
+    with worker_pool(workers) as pool:
+        futures = [pool.submit(fn, path, start, end, head, tail, index, *args)
+                   for index, (start, end, head, tail) in enumerate(ranges)]
+        return [future.result() for future in futures]
+
+
+def _count_range(path, start, end, head, tail, index, backend):
+    parser = XmltvStreamParser(backend)
+    for chunk in iter_range(path, start, end, head, tail):
+        parser.feed(chunk)
+    parser.close()
+    return {
+        'channels': parser.channels,
+        'counts': parser.counts,
+        'fingerprints': parser.fingerprints,
+        'coverage': parser.coverage,
+        'programmes': parser.programmes,
+        'first_start': parser.first_start,
+        'last_stop': parser.last_stop,
+        'error': parser.error,
+    }
+
+
+def parse_xmltv_parallel(path: str, backend: str = None, workers: int = None):
+    """`parse_xmltv` for a plain file, split into ranges parsed on all cores.
+
+    The partial results are merged into exactly what a sequential parse
+    returns; the content hash is computed in this process meanwhile.
+    Returns None if the file cannot be split or a range fails to parse;
+    callers then parse sequentially (which also reports the error properly).
+    """
+    workers = workers or PARSE_WORKERS
+    ranges = plan_ranges(path, workers)
+    if not ranges:
+        return None
+    with worker_pool(min(workers, len(ranges))) as pool:
+        futures = [pool.submit(_count_range, path, start, end, head, tail, index, backend)
+                   for index, (start, end, head, tail) in enumerate(ranges)]
+        sha256 = hashlib.sha256()
+        for chunk in iter_range(path, 0, os.path.getsize(path)):
+            sha256.update(chunk)
+        parts = [future.result() for future in futures]
+    if any(part['error'] for part in parts):
+        return None
+
+    merged = XmltvStreamParser(backend)
+    for part in parts:
+        merged.channels.extend(part['channels'])
+        for key, count in part['counts'].items():
+            merged.counts[key] = merged.counts.get(key, 0) + count
+        for key, days in part['coverage'].items():
+            target = merged.coverage.setdefault(key, {})
+            # Gap between the channel's last programme in earlier ranges and its first one here
+            before = merged.fingerprints.get(key)
+            first = part['fingerprints'][key][1]
+            if before and before[2] is not None and first is not None and first > before[2]:
+                entry = target.setdefault(before[2] // DAY_SECONDS, [0, 0])
+                entry[1] = max(entry[1], first - before[2])
+            for day, (covered, gap) in days.items():
+                entry = target.setdefault(day, [0, 0])
+                entry[0] += covered
+                entry[1] = max(entry[1], gap)
+        for key, fp in part['fingerprints'].items():
+            current = merged.fingerprints.get(key)
+            if current is None:
+                merged.fingerprints[key] = fp
+                continue
+            current[0] += fp[0]
+            if fp[1] is not None and (current[1] is None or fp[1] < current[1]):
+                current[1] = fp[1]
+            if fp[2] is not None and (current[2] is None or fp[2] > current[2]):
+                current[2] = fp[2]
+            current[3] += fp[3]
+        merged.programmes += part['programmes']
+        if part['first_start'] and (not merged.first_start or part['first_start'] < merged.first_start):
+            merged.first_start = part['first_start']
+        if part['last_stop'] > merged.last_stop:
+            merged.last_stop = part['last_stop']
+    result = merged.result()
+    result['sha256'] = sha256.hexdigest()
+    return result
@@ -0,0 +1,201 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+# -----------------------------
+# Periodic refresh scheduler
+# -----------------------------
+
+def parse_window(value: str):
+    """Parse an off-peak window 'HH:MM-HH:MM' into (start_minute, end_minute), or None if empty."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        start, end = value.split('-')
+        start_h, start_m = (int(x) for x in start.strip().split(':'))
+        end_h, end_m = (int(x) for x in end.strip().split(':'))
+    except ValueError:
+        raise ValueError(f'Ungültiges Zeitfenster: {value} (erwartet HH:MM-HH:MM)')
+    return start_h * 60 + start_m, end_h * 60 + end_m
+
+
+def format_window(window) -> str:
+    """Inverse of parse_window ('' for no window)."""
+    if not window:
+        return ''
+    start, end = window
+    return f'{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}'
+
+
+def align_to_window(ts: float, window):
+    """Return the first time >= ts that lies inside `window` (local time); ts if window is None."""
+    if not window:
+        return ts
+    start, end = window
+    local = datetime.fromtimestamp(ts)
+    minute = local.hour * 60 + local.minute
+    if start <= end:
+        inside = start <= minute < end
+    else:  # window spans midnight
+        inside = minute >= start or minute < end
+    if inside:
+        return ts
+    candidate = local.replace(hour=start // 60, minute=start % 60, second=0, microsecond=0)
+    if candidate <= local:
+        candidate += timedelta(days=1)
+    return candidate.timestamp()
+
+
+class ScheduledSource:
+    """One periodically refreshed source; `submit()` starts a refresh job and returns it."""
+
+    def __init__(self, name: str, submit, interval: float, enabled: bool = True):
+        self.name = name
+        self.submit = submit
+        self.interval = interval
+        self.enabled = enabled
+        self.job = None
+        self.last_run = None
+        self.last_status = None
+        self.last_error = None
+        self.last_success = None
+        self.next_run = None
+        self.failures = 0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'enabled': self.enabled,
+            'interval_minutes': round(self.interval / 60, 1),
+            'running': self.job is not None,
+            'job_id': self.job.id if self.job else None,
+            'last_run': self.last_run,
+            'last_status': self.last_status,
+            'last_error': self.last_error,
+            'last_success': self.last_success,
+            'next_run': self.next_run if self.enabled else None,
+            'failures': self.failures,
+        }
+
+
+class Scheduler:
+    """Runs source refresh jobs at their interval, with jitter, failure backoff and an off-peak window.
+
+    Refreshes are submitted as jobs (see epg_jobs); the scheduler only decides
+    when and records the outcome once the job has finished.
+    """
+
+    def __init__(self, jitter: float = 300, retry: float = 300, max_backoff: float = 4 * 3600,
+                 window=None, poll_seconds: float = 30, logger=None):
+        self.jitter = jitter
+        self.retry = retry
+        self.max_backoff = max_backoff
+        self.window = window
+        self.poll_seconds = poll_seconds
+        self._logger = logger
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+    def add_source(self, name: str, submit, interval: float, enabled: bool = True):
+        source = ScheduledSource(name, submit, interval, enabled)
+        # First run right after start (inside the window), spread by jitter
+        source.next_run = self._schedule(time.time())
+        with self._lock:
+            self._sources[name] = source
+        return source
+
+    def _schedule(self, base: float) -> float:
+        return align_to_window(base, self.window) + random.uniform(0, self.jitter)
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, name='epg-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stopped:
+            try:
+                self.tick()
+            except Exception as e:
+                if self._logger:
+                    self._logger.error(f"Scheduler tick failed: {str(e)}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def tick(self, now: float = None):
+        """Collect finished refresh jobs and start due ones."""
+        now = now or time.time()
+        with self._lock:
+            for source in self._sources.values():
+                if source.job is not None:
+                    if source.job.finished:
+                        self._finish(source)
+                    continue
+                if source.enabled and source.next_run is not None and now >= source.next_run:
+                    self._run(source, now)
+
+    def _run(self, source: ScheduledSource, now: float):
+        try:
+            source.job = source.submit()
+        except Exception as e:
+            source.job = None
+            source.last_run = now
+            self._record_failure(source, str(e), now)
+            return
+        source.last_run = now
+        source.last_status = 'running'
+        if self._logger:
+            self._logger.info(f"Scheduler: refresh of '{source.name}' started (job {source.job.id})")
+
+    def _finish(self, source: ScheduledSource):
+        job = source.job
+        source.job = None
+        if job.status == 'error':
+            self._record_failure(source, job.error, job.finished)
+            return
+        source.last_status = job.status
+        source.last_error = None
+        if job.status == 'done':
+            source.last_success = job.finished
+            source.failures = 0
+        source.next_run = self._schedule(job.finished + source.interval)
+
+    def _record_failure(self, source: ScheduledSource, error: str, finished: float):
+        source.last_status = 'error'
+        source.last_error = error
+        source.failures += 1
+        delay = min(self.retry * 2 ** (source.failures - 1), self.max_backoff, source.interval)
+        # Retries ignore the window: the data is stale until one succeeds
+        source.next_run = finished + delay + random.uniform(0, min(self.jitter, delay / 2))
+        if self._logger:
+            self._logger.warning(f"Scheduler: refresh of '{source.name}' failed ({source.failures}x), "
+                                 f"retry in {delay / 60:.0f} min: {error}")
+
+    def run_now(self, name: str):
+        """Start a refresh of `name` immediately (or return the running job).
+
+        Raises KeyError for unknown sources; returns None if the job could not be started.
+        """
+        with self._lock:
+            source = self._sources[name]
+            if source.job is not None and not source.job.finished:
+                return source.job
+            if source.job is not None:
+                self._finish(source)
+            self._run(source, time.time())
+            return source.job
+
+    def status(self):
+        with self._lock:
+            return [source.to_dict() for source in self._sources.values()]
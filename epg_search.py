@@ -0,0 +1,97 @@
+import operator
+from array import array
+
+
+# -----------------------------
+# Channel list search (get_channels)
+# -----------------------------
+
+NGRAM = 3  # Queries of at least this length are answered from the n-gram index
+SHORT_QUERY_CACHE = 256  # Results kept for shorter queries (answered by a scan)
+
+
+class ChannelSearchIndex:
+    """Substring search, sorting and paging over one channel list.
+
+    Built once per list: lowercased names and an inverted index of name
+    trigrams. A query intersects the posting lists of its trigrams (rarest
+    first) and confirms the few survivors with `in`, so results are the
+    same as `query in name.lower()` over the whole list. Sort orders are
+    computed on first use.
+    """
+
+    def __init__(self, channels, key: str = 'name'):
+        self.channels = list(channels)
+        self.names = [str(ch.get(key) or '').lower() for ch in self.channels]
+        postings = {}
+        for idx, name in enumerate(self.names):
+            for gram in {name[i:i + NGRAM] for i in range(len(name) - NGRAM + 1)}:
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array('I')
+                posting.append(idx)
+        self.postings = postings
+        self._short = {}
+        self._orders = {}
+
+    def is_for(self, channels) -> bool:
+        """True if the index was built from exactly these channel objects."""
+        return len(channels) == len(self.channels) and all(map(operator.is_, channels, self.channels))
+
+    def search(self, query: str):
+        """Indexes of the channels whose name contains `query` (case-insensitive), ascending."""
+        query = (query or '').lower()
+        if not query:
+            return range(len(self.names))
+        if len(query) < NGRAM:
+            found = self._short.get(query)
+            if found is None:
+                found = [idx for idx, name in enumerate(self.names) if query in name]
+                if len(self._short) >= SHORT_QUERY_CACHE:
+                    self._short.clear()
+                self._short[query] = found
+            return found
+        grams = {query[i:i + NGRAM] for i in range(len(query) - NGRAM + 1)}
+        lists = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        if not lists[0]:
+            return []
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        names = self.names
+        return sorted(idx for idx in candidates if query in names[idx])
+
+    def order(self, sort: str, value=None, version=None):
+        """(positions, ranks) of the channels in a sort order, or None for list order.
+
+        `sort` is 'name' or 'value' (sorted by `value(channel)`, e.g. the
+        programme count; cached per `version` of the values); a leading '-'
+        reverses it. Ties keep the list order.
+        """
+        field = sort.lstrip('-')
+        if field == 'value' and value is None or field not in ('name', 'value'):
+            return None
+        cache_key = (sort, version if field == 'value' else None)
+        cached = self._orders.get(cache_key)
+        if cached is None:
+            keys = self.names if field == 'name' else [value(ch) for ch in self.channels]
+            positions = sorted(range(len(keys)), key=keys.__getitem__, reverse=sort.startswith('-'))
+            ranks = [0] * len(keys)
+            for rank, idx in enumerate(positions):
+                ranks[idx] = rank
+            if field == 'value':
+                # Orders of older value versions are stale
+                self._orders = {k: v for k, v in self._orders.items() if k[1] is None or k[1] == version}
+            cached = self._orders[cache_key] = (positions, ranks)
+        return cached
+
+    def page(self, query: str = '', offset: int = 0, limit: int = None, sort: str = '', value=None, version=None):
+        """Return (total, channels) of one page of the search result."""
+        found = self.search(query)
+        order = self.order(sort, value, version) if sort else None
+        if order is not None:
+            found = order[0] if not query else sorted(found, key=order[1].__getitem__)
+        end = None if limit is None else offset + limit
+        return len(found), [self.channels[idx] for idx in found[offset:end]]
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+from epg_utils import write_snapshot, remove_snapshot
+
+
+# -----------------------------
+# Content-addressed EPG cache store
+# -----------------------------
+
+BLOB_SUFFIX = '.xml.gz'
+STORE_COMPRESS_LEVEL = 3  # zlib level of stored blobs; ~8x faster than 9 at a few % more size
+
+
+def _umask_file_mode() -> int:
+    # Mode a plain open() would create files with; os.umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+BLOB_FILE_MODE = _umask_file_mode()  # mkstemp creates 0600; blobs stay readable like other cache files
+
+
+class BlobSink:
+    """Ingest sink (see epg_utils.ingest_epg_stream) compressing the XML into a store blob.
+
+    The blob is named by the SHA-256 of the decompressed XML, known only once
+    the stream is parsed; data goes to a temp file in the blob directory
+    until then. If a blob with that content exists already the temp file is
+    dropped. A sink that is never opened (stream equal to the ingest
+    reference) writes nothing. After commit, `path` is the blob.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.path = None
+        self._tmp = None
+        self._f = None
+        self._compressor = None
+        self._digest = None
+
+    def open(self):
+        fd, self._tmp = tempfile.mkstemp(suffix='.part', dir=self.store.blob_dir)
+        os.chmod(self._tmp, BLOB_FILE_MODE)
+        self._f = os.fdopen(fd, 'wb')
+        self._compressor = zlib.compressobj(self.store.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._digest = hashlib.sha256()
+
+    def _out(self, data: bytes):
+        if data:
+            self._f.write(data)
+            self._digest.update(data)
+
+    def write(self, data: bytes):
+        self._out(self._compressor.compress(data))
+
+    def commit(self, result: dict):
+        self.path = self.store.blob_path(result['sha256'])
+        if self._f is None:
+            self.store.touch(self.path)
+            return
+        self._out(self._compressor.flush())
+        self._f.close()
+        self._f = None
+        with self.store.lock:
+            if os.path.exists(self.path):
+                os.remove(self._tmp)
+                self.store.touch(self.path)
+                return
+            os.replace(self._tmp, self.path)
+        if not result.get('error'):
+            write_snapshot(self.path, result, self._digest.hexdigest())
+
+    def abort(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+        if self._tmp and os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+
+class EpgStore:
+    """Deduplicated store of EPG files: one gzip blob per distinct XML content.
+
+    Blobs live in `<root>/blobs/<sha256>.xml.gz` with their parse snapshot
+    next to them; named cache entries and the "last" pointers refer to
+    them instead of holding copies. The last access time (atime, set
+    explicitly by `touch`; mtime stays put so snapshots stay valid) drives
+    LRU eviction in `evict`.
+    """
+
+    def __init__(self, root: str, level: int = STORE_COMPRESS_LEVEL):
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.level = level
+        self.lock = threading.RLock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, sha256 + BLOB_SUFFIX)
+
+    def contains(self, path: str) -> bool:
+        """True if `path` is a blob of this store."""
+        return bool(path) and os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.blob_dir)
+
+    def sink(self) -> BlobSink:
+        return BlobSink(self)
+
+    def touch(self, path: str):
+        """Mark a blob (or any cached file) as used now, for LRU eviction."""
+        try:
+            st = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+        except OSError:
+            pass
+
+    def link(self, path: str, link_path: str):
+        """Make `link_path` refer to the blob `path`: a hardlink, a copy where links are unsupported.
+
+        Nothing is written if `link_path` already is that blob.
+        """
+        try:
+            if os.path.samefile(path, link_path):
+                return
+        except OSError:
+            pass
+        tmp = link_path + '.part'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(path, tmp)
+        except OSError:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, link_path)
+
+    def usage(self, extra=()):
+        """Return [(path, size, last_access)] of all blobs plus the existing files in `extra`."""
+        entries = []
+        with os.scandir(self.blob_dir) as it:
+            paths = [e.path for e in it if e.name.endswith(BLOB_SUFFIX)]
+        for path in list(paths) + [p for p in extra if p and not self.contains(p)]:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_atime))
+        return entries
+
+    def evict(self, max_bytes: int = 0, max_age_days: float = 0, protect=(), extra=()):
+        """Remove blobs not used for `max_age_days`, then least recently used ones above `max_bytes`.
+
+        0 disables a limit. Paths in `protect` (e.g. the loaded EPG) are kept;
+        `extra` are further cached files (outside the blob dir) to treat the
+        same way. Returns the removed paths.
+        """
+        protect = {os.path.abspath(p) for p in protect if p}
+        removed = []
+        with self.lock:
+            entries = sorted(self.usage(extra), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+            for path, size, accessed in entries:
+                expired = cutoff is not None and accessed < cutoff
+                if not expired and (not max_bytes or total <= max_bytes):
+                    continue
+                if os.path.abspath(path) in protect:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                remove_snapshot(path)
+                total -= size
+                removed.append(path)
+        return removed
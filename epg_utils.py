@@ -1,9 +1,25 @@
 import os
 import json
 import gzip
-import io
+import zlib
+import re
+import mmap
+import html
+import hashlib
+import calendar
+from collections import Counter
 import xml.etree.ElementTree as ET
-from datetime import datetime
+from types import SimpleNamespace
+
+try:
+    import xml.parsers.expat as expat
+except ImportError:  # Python builds without pyexpat
+    expat = None
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 
 # -----------------------------
@@ -23,82 +39,864 @@ def detect_gzip_bytes(content: bytes) -> bool:
     return bool(content) and content[:2] == b'\x1f\x8b'
 
 
+def parse_xmltv_time(value: str):
+    """Convert an XMLTV timestamp ('YYYYmmddHHMMSS +zzzz') to UTC epoch seconds.
+
+    Truncated forms (e.g. 'YYYYmmddHHMM') are padded with zeros; a missing
+    offset means UTC. Returns None if the value cannot be parsed.
+    """
+    parts = (value or '').split()
+    if not parts:
+        return None
+    digits = parts[0][:14]
+    if len(digits) < 8 or not digits.isdigit():
+        return None
+    digits = digits.ljust(14, '0')
+    try:
+        ts = calendar.timegm((int(digits[0:4]), int(digits[4:6]), int(digits[6:8]),
+                              int(digits[8:10]), int(digits[10:12]), int(digits[12:14])))
+    except (ValueError, OverflowError):
+        return None
+    tz = parts[1] if len(parts) > 1 else ''
+    if len(tz) == 5 and tz[0] in '+-' and tz[1:].isdigit():
+        offset = int(tz[1:3]) * 3600 + int(tz[3:5]) * 60
+        ts -= offset if tz[0] == '+' else -offset
+    return ts
+
+
 # -----------------------------
 # XML parsing / EPG helpers
 # -----------------------------
 
-def parse_xml_channels(xml_text: str):
-    """Parse XMLTV text and extract channels as list of dicts {'id','name'}."""
-    channels = []
+CHUNK_SIZE = 1024 * 1024
+
+# Preference order of the XMLTV parser backends (see XmltvStreamParser). The
+# tuned expat handlers beat lxml here (lxml still builds every element);
+# benchmarks/parser_backends.py compares them on real data.
+PARSER_BACKENDS = ('expat', 'lxml', 'etree')
+
+
+def available_parser_backends():
+    """Return the parser backends usable in this environment, in preference order."""
+    usable = {'expat': expat is not None, 'lxml': lxml_etree is not None, 'etree': True}
+    return [name for name in PARSER_BACKENDS if usable[name]]
+
+
+def select_parser_backend(name: str = None) -> str:
+    """Pick the parser backend: `name` or $EPG_PARSER_BACKEND if usable, else the best available one."""
+    available = available_parser_backends()
+    name = (name or os.environ.get('EPG_PARSER_BACKEND') or 'auto').strip().lower()
+    return name if name in available else available[0]
+
+
+PARSER_BACKEND = select_parser_backend()
+
+# Fingerprint of a channel without programmes: [programmes, first_start, last_stop, hash]
+EMPTY_FINGERPRINT = [0, None, None, '0' * 16]
+
+
+def programme_digest(start: str, stop: str, text: str) -> int:
+    """64-bit checksum of one programme: start/stop attributes and its text content.
+
+    Trailing whitespace is ignored (expat also sees the whitespace up to the
+    next tag). Channel hashes are sums of these, so they do not depend on
+    programme order and partial results (e.g. byte ranges) simply add up.
+    """
+    data = f"{start}\x00{stop}\x00{text.rstrip()}".encode('utf-8', 'surrogatepass')
+    return zlib.crc32(data) << 32 | zlib.adler32(data)
+
+
+DAY_SECONDS = 86400
+
+
+def add_coverage(days: dict, start_ts: int, stop_ts: int, prev_stop):
+    """Account the programme [start_ts, stop_ts) in a channel's per-day coverage.
+
+    `days` maps UTC day number (epoch // 86400) -> [covered seconds, largest
+    gap starting that day]. `prev_stop` is the channel's latest stop before
+    this programme (XMLTV lists a channel's programmes in time order); a later
+    start opens a gap. Memory is bounded by the days the schedule spans.
+    """
+    if prev_stop is not None and start_ts > prev_stop:
+        day = days.setdefault(prev_stop // DAY_SECONDS, [0, 0])
+        if start_ts - prev_stop > day[1]:
+            day[1] = start_ts - prev_stop
+    pos = start_ts
+    while pos < stop_ts:
+        number = pos // DAY_SECONDS
+        end = min(stop_ts, (number + 1) * DAY_SECONDS)
+        days.setdefault(number, [0, 0])[0] += end - pos
+        pos = end
+
+
+class XmltvStreamParser:
+    """Incremental XMLTV parser fed with raw byte chunks.
+
+    Collects channels ({'id','name'}), programme counts (channel_id lower ->
+    count), per-channel fingerprints (see `result`) and basic stats while
+    data arrives. The actual parsing is done by
+    a backend ('expat', 'lxml' or 'etree', default `PARSER_BACKEND`); none of
+    them keeps an element tree around. Input stays bytes, so the encoding
+    declared in the XML header is honoured. Parse errors are recorded in
+    `error` instead of raised; whatever was collected up to that point is kept.
+    """
+
+    def __init__(self, backend: str = None):
+        self.channels = []
+        self.counts = {}
+        self.error = None
+        self.programmes = 0
+        self.first_start = ''
+        self.last_stop = ''
+        self.fingerprints = {}  # channel_id lower -> [programmes, first_start_ts, last_stop_ts, hash sum]
+        self.coverage = {}  # channel_id lower -> {day: [covered seconds, largest gap]}, see add_coverage
+        self._times = {}  # XMLTV timestamp -> epoch (schedules repeat the same slots)
+        self._sha256 = hashlib.sha256()
+        self._channel = None  # channel dict being parsed
+        self._name_parts = None  # text parts of the first display-name
+        self._programme = None  # (channel_id lower, start, stop) of the programme being parsed
+        self._programme_parts = None  # its text parts
+        self.backend = select_parser_backend(backend) if backend else PARSER_BACKEND
+        self._parser = _PARSER_BACKEND_CLASSES[self.backend](self)
+
+    def feed(self, data: bytes):
+        if not data:
+            return
+        # Content hash covers every byte, even after a parse error
+        self._sha256.update(data)
+        if self.error:
+            return
+        try:
+            self._parser.feed(data)
+        except self._parser.errors as e:
+            self.error = str(e)
+
+    def close(self):
+        if self.error:
+            return
+        try:
+            self._parser.close()
+        except self._parser.errors as e:
+            self.error = str(e)
+
+    @property
+    def stats(self):
+        return {
+            'channels': len(self.channels),
+            'programmes': self.programmes,
+            'channels_with_programs': len([k for k, v in self.counts.items() if v > 0]),
+            'first_start': self.first_start,
+            'last_stop': self.last_stop,
+        }
+
+    @property
+    def sha256(self):
+        """Hex SHA-256 of the (decompressed) XML bytes fed so far."""
+        return self._sha256.hexdigest()
+
+    def result(self):
+        """Return {'channels','counts','fingerprints','coverage','stats','sha256','error'} so far.
+
+        'fingerprints' maps every channel id (lower, declared or scheduled) to
+        [programmes, first_start, last_stop, hash]: epoch bounds of its
+        schedule and a hex checksum over all its programmes (`programme_digest`).
+        'coverage' maps channel ids with timed programmes to
+        [[day, covered seconds, largest gap], ...] sorted by day (see add_coverage).
+        """
+        fingerprints = {key: [fp[0], fp[1], fp[2], format(fp[3] & 0xFFFFFFFFFFFFFFFF, '016x')]
+                        for key, fp in self.fingerprints.items()}
+        for ch in self.channels:
+            key = (ch.get('id') or '').strip().lower()
+            if key and key not in fingerprints:
+                fingerprints[key] = list(EMPTY_FINGERPRINT)
+        return {
+            'channels': self.channels,
+            'counts': self.counts,
+            'fingerprints': fingerprints,
+            'coverage': {key: [[day] + entry for day, entry in sorted(days.items())]
+                         for key, days in self.coverage.items()},
+            'stats': self.stats,
+            'sha256': self.sha256,
+            'error': self.error,
+        }
+
+    def _epoch(self, value):
+        times = self._times
+        if value in times:
+            return times[value]
+        ts = times[value] = parse_xmltv_time(value)
+        return ts
+
+    def _add_fingerprint(self, key, start, stop, text):
+        """Account one finished programme in the fingerprint of channel `key`."""
+        if not key:
+            return
+        start_ts = self._epoch(start)
+        stop_ts = self._epoch(stop)
+        digest = programme_digest(start, stop, text)
+        fp = self.fingerprints.get(key)
+        if start_ts is not None and stop_ts is not None:
+            add_coverage(self.coverage.setdefault(key, {}), start_ts, stop_ts, fp[2] if fp else None)
+        if fp is None:
+            self.fingerprints[key] = [1, start_ts, stop_ts, digest]
+            return
+        fp[0] += 1
+        if start_ts is not None and (fp[1] is None or start_ts < fp[1]):
+            fp[1] = start_ts
+        if stop_ts is not None and (fp[2] is None or stop_ts > fp[2]):
+            fp[2] = stop_ts
+        fp[3] += digest
+
+    # Element callbacks ('etree' target; 'lxml' reuses _start for programmes)
+
+    def _start(self, tag, attrib):
+        if tag == 'programme':
+            self.programmes += 1
+            key = (attrib.get('channel', '') or '').strip().lower()
+            if key:
+                self.counts[key] = self.counts.get(key, 0) + 1
+            start = attrib.get('start', '')
+            stop = attrib.get('stop', '')
+            if start and (not self.first_start or start < self.first_start):
+                self.first_start = start
+            if stop > self.last_stop:
+                self.last_stop = stop
+            self._programme = (key, start, stop)
+            self._programme_parts = []
+        elif tag == 'channel':
+            self._channel = {'id': attrib.get('id', ''), 'name': ''}
+        elif tag == 'display-name' and self._channel is not None and not self._channel['name']:
+            self._name_parts = []
+
+    def _data(self, text):
+        if self._programme_parts is not None:
+            self._programme_parts.append(text)
+        elif self._name_parts is not None:
+            self._name_parts.append(text)
+
+    def _end(self, tag):
+        if tag == 'programme' and self._programme is not None:
+            self._add_fingerprint(*self._programme, ''.join(self._programme_parts))
+            self._programme = None
+            self._programme_parts = None
+        elif tag == 'display-name' and self._name_parts is not None:
+            self._channel['name'] = ''.join(self._name_parts)
+            self._name_parts = None
+        elif tag == 'channel' and self._channel is not None:
+            self.channels.append(self._channel)
+            self._channel = None
+
+
+class _EtreeBackend:
+    """ET.XMLParser driving the XmltvStreamParser callbacks (always available)."""
+
+    errors = (ET.ParseError,)
+
+    def __init__(self, owner):
+        # Plain namespace target: ET.XMLParser would call a target's close()
+        self._parser = ET.XMLParser(target=SimpleNamespace(start=owner._start, data=owner._data, end=owner._end))
+        self.feed = self._parser.feed
+
+    def close(self):
+        self._parser.close()
+
+
+class _ExpatBackend:
+    """pyexpat handlers tuned for XMLTV.
+
+    Only start tags are handled in general; end tags only while inside a
+    <channel> and character data only inside its first display-name or after
+    a <programme> start. A programme's text is collected up to the next
+    <programme>/<channel> start (or the end), so programmes need no end
+    callbacks at all; the whitespace picked up after them is ignored.
+    """
+
+    errors = (expat.ExpatError,) if expat else ()
+
+    def __init__(self, owner):
+        self._owner = owner
+        self._channel = None
+        self._parts = []
+        self._programme = None
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+
+    def feed(self, data: bytes):
+        try:
+            self._parser.Parse(data, False)
+        except self.errors:
+            # The pending programme is complete as far as read; record it as the other backends do
+            self._finish_programme()
+            raise
+
+    def close(self):
+        try:
+            self._parser.Parse(b'', True)
+        finally:
+            self._finish_programme()
+
+    def _finish_programme(self):
+        if self._programme is not None:
+            self._add_fingerprint()
+            self._programme = None
+            self._parser.CharacterDataHandler = None
+
+    def _add_fingerprint(self):
+        # Inlined XmltvStreamParser._add_fingerprint (hot path, once per programme)
+        key, start, stop = self._programme
+        if not key:
+            return
+        owner = self._owner
+        times = owner._times
+        start_ts = times[start] if start in times else owner._epoch(start)
+        stop_ts = times[stop] if stop in times else owner._epoch(stop)
+        data = f"{start}\x00{stop}\x00{''.join(self._parts).rstrip()}".encode('utf-8', 'surrogatepass')
+        digest = zlib.crc32(data) << 32 | zlib.adler32(data)
+        fp = owner.fingerprints.get(key)
+        if start_ts is not None and stop_ts is not None:
+            coverage = owner.coverage.get(key)
+            if coverage is None:
+                coverage = owner.coverage[key] = {}
+            add_coverage(coverage, start_ts, stop_ts, fp[2] if fp else None)
+        if fp is None:
+            owner.fingerprints[key] = [1, start_ts, stop_ts, digest]
+            return
+        fp[0] += 1
+        if start_ts is not None and (fp[1] is None or start_ts < fp[1]):
+            fp[1] = start_ts
+        if stop_ts is not None and (fp[2] is None or stop_ts > fp[2]):
+            fp[2] = stop_ts
+        fp[3] += digest
+
+    def _start(self, tag, attrib):
+        if tag == 'programme':
+            if self._programme is not None:
+                self._add_fingerprint()
+            owner = self._owner
+            owner.programmes += 1
+            key = (attrib.get('channel') or '').strip().lower()
+            if key:
+                counts = owner.counts
+                counts[key] = counts.get(key, 0) + 1
+            start = attrib.get('start', '')
+            stop = attrib.get('stop', '')
+            if start and (not owner.first_start or start < owner.first_start):
+                owner.first_start = start
+            if stop > owner.last_stop:
+                owner.last_stop = stop
+            self._programme = (key, start, stop)
+            self._parts = []
+            self._parser.CharacterDataHandler = self._parts.append
+        elif tag == 'channel':
+            self._finish_programme()
+            self._channel = {'id': attrib.get('id', ''), 'name': ''}
+            self._parser.EndElementHandler = self._end
+        elif (tag == 'display-name' and self._channel is not None and not self._channel['name']
+                and self._parser.CharacterDataHandler is None):
+            self._parts = []
+            self._parser.CharacterDataHandler = self._parts.append
+
+    def _end(self, tag):
+        if tag == 'display-name' and self._parser.CharacterDataHandler is not None:
+            self._channel['name'] = ''.join(self._parts)
+            self._parser.CharacterDataHandler = None
+        elif tag == 'channel':
+            self._owner.channels.append(self._channel)
+            self._channel = None
+            self._parser.EndElementHandler = None
+
+
+class _LxmlBackend:
+    """lxml pull parser filtered to <channel>/<programme>; parsed elements are dropped right away."""
+
+    errors = (lxml_etree.XMLSyntaxError,) if lxml_etree else ()
+
+    def __init__(self, owner):
+        self._owner = owner
+        self._parser = lxml_etree.XMLPullParser(events=('start', 'end'), tag=('channel', 'programme'),
+                                                resolve_entities=False, no_network=True)
+
+    def feed(self, data: bytes):
+        try:
+            self._parser.feed(data)
+        finally:
+            # Keep what was parsed before a syntax error
+            self._drain()
+
+    def close(self):
+        try:
+            self._parser.close()
+        finally:
+            self._drain()
+
+    def _drain(self):
+        owner = self._owner
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                if elem.tag == 'programme':
+                    owner._start('programme', elem.attrib)
+                continue
+            if elem.tag == 'programme':
+                # Text of the programme subtree without its own tail, as the other backends see it
+                owner._programme_parts.extend(elem.itertext())
+                owner._end('programme')
+            elif elem.tag == 'channel':
+                name = next((dn.text for dn in elem.iter('display-name') if dn.text), '')
+                owner.channels.append({'id': elem.get('id', ''), 'name': name})
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                del parent[:]
+
+
+_PARSER_BACKEND_CLASSES = {'lxml': _LxmlBackend, 'expat': _ExpatBackend, 'etree': _EtreeBackend}
+
+
+class _GzipStreamDecompressor:
+    """Incremental gzip decompressor that also handles multi-member files."""
+
+    def __init__(self):
+        self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> bytes:
+        out = []
+        while data:
+            out.append(self._d.decompress(data))
+            if self._d.eof:
+                data = self._d.unused_data
+                self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                data = b''
+        return b''.join(out)
+
+    def flush(self) -> bytes:
+        return self._d.flush()
+
+
+def open_xml_file(path: str):
+    """Open an XML file for binary reading, transparently gunzipping .gz content."""
+    with open(path, 'rb') as f:
+        is_gz = detect_gzip_bytes(f.read(2))
+    return gzip.open(path, 'rb') if is_gz else open(path, 'rb')
+
+
+def iter_file_chunks(fileobj, chunk_size: int = CHUNK_SIZE):
+    """Yield byte chunks from a binary file object until EOF."""
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        yield chunk
+
+
+def parse_xmltv(source, backend: str = None):
+    """Single-pass XMLTV parse of bytes, a file path or a binary file object.
+
+    gzip input is detected by magic bytes and decompressed on the fly.
+    Large plain files are parsed on all cores (see epg_parallel).
+    Returns {'channels','counts','stats','sha256','error'} (see `XmltvStreamParser`).
+    """
+    if isinstance(source, str):
+        from epg_parallel import use_parallel, parse_xmltv_parallel
+        if use_parallel(source):
+            result = parse_xmltv_parallel(source, backend)
+            if result is not None:
+                return result
+    parser = XmltvStreamParser(backend)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+        if detect_gzip_bytes(data):
+            data = _GzipStreamDecompressor().decompress(data)
+        parser.feed(data)
+    elif isinstance(source, str):
+        with open(source, 'rb') as f:
+            _feed_file(parser, f)
+    else:
+        _feed_file(parser, source)
+    parser.close()
+    return parser.result()
+
+
+# Fast-count mode: channel attribute of <programme> start tags, straight from the bytes
+PROGRAMME_CHANNEL_ATTR = re.compile(rb'<programme\s[^>]*?\bchannel\s*=\s*["\']([^"\']*)')
+XML_ENCODING_DECL = re.compile(rb'<\?xml[^>]*\bencoding\s*=\s*["\']([A-Za-z0-9._-]+)')
+FAST_COUNT_WINDOW = 64 * 1024 * 1024
+
+
+def fast_count_programmes(path: str) -> dict:
+    """Programme counts per channel id (lower) by a byte-regex scan, without parsing XML.
+
+    Plain files are scanned through mmap, gzip files window by window while
+    decompressing. Only `<programme ... channel="...">` start tags are
+    looked at, so this is several times faster than `parse_xmltv` but does
+    not validate the document; use `cross_check_counts` to compare. Tags
+    inside comments or CDATA sections are counted too. UTF-16 files (BOM
+    or NUL bytes in the head) do not fit the byte regex and are counted by
+    `parse_xmltv`.
+    """
+    raw = Counter()
+    with open_xml_file(path) as f:
+        head = f.read(256)
+        if head.startswith((b'\xff\xfe', b'\xfe\xff')) or b'\x00' in head:
+            return parse_xmltv(path)['counts']
+        match = XML_ENCODING_DECL.search(head)
+        encoding = match.group(1).decode('ascii') if match else 'utf-8'
+        if isinstance(f, gzip.GzipFile):
+            buffer = head
+            for chunk in iter_file_chunks(f, FAST_COUNT_WINDOW):
+                buffer += chunk
+                # Keep a possibly incomplete last tag for the next window
+                cut = buffer.rfind(b'<programme')
+                if cut <= 0:
+                    continue
+                raw.update(PROGRAMME_CHANNEL_ATTR.findall(buffer, 0, cut))
+                buffer = buffer[cut:]
+            raw.update(PROGRAMME_CHANNEL_ATTR.findall(buffer))
+        elif os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                size = len(mm)
+                pos = 0
+                while pos < size:
+                    end = pos + FAST_COUNT_WINDOW
+                    if end >= size:
+                        cut = size
+                    else:
+                        # Window ends before the last tag start, so no tag is split
+                        cut = mm.rfind(b'<programme', pos + 1, end)
+                        if cut < 0:
+                            cut = mm.find(b'<programme', end)
+                            cut = size if cut < 0 else cut
+                    raw.update(PROGRAMME_CHANNEL_ATTR.findall(mm, pos, cut))
+                    pos = cut
+    counts = {}
+    for value, count in raw.items():
+        key = value.decode(encoding, errors='replace')
+        if '&' in key:
+            key = html.unescape(key)
+        key = key.strip().lower()
+        if key:
+            counts[key] = counts.get(key, 0) + count
+    return counts
+
+
+def cross_check_counts(path: str, counts: dict) -> dict:
+    """Compare programme counts (e.g. from `fast_count_programmes`) with a full parse of `path`.
+
+    Returns {channel_id: (given, parsed)} for every id where both differ; empty if they agree.
+    """
+    parsed = parse_xmltv(path)['counts']
+    return {key: (counts.get(key, 0), parsed.get(key, 0))
+            for key in set(counts) | set(parsed)
+            if counts.get(key, 0) != parsed.get(key, 0)}
+
+
+def _feed_file(parser, fileobj):
+    decompressor = None
+    first = True
+    for chunk in iter_file_chunks(fileobj):
+        if first:
+            first = False
+            if detect_gzip_bytes(chunk):
+                decompressor = _GzipStreamDecompressor()
+        parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+    if decompressor:
+        parser.feed(decompressor.flush())
+
+
+def _remove_quietly(path):
     try:
-        root = ET.fromstring(xml_text)
-        for channel in root.findall('channel'):
-            ch_id = channel.get('id', '')
-            display_name = channel.find('display-name')
-            name = display_name.text if display_name is not None else ''
-            channels.append({'id': ch_id, 'name': name})
-    except Exception:
-        # Return whatever collected, caller logs if needed
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError:
         pass
-    return channels
 
 
-def build_epg_program_counts(xml_text: str):
-    """Stream-parse XML EPG to build a map channel_id(lower) -> programme count."""
-    counts = {}
+class XmlFileSink:
+    """Ingest sink writing the decompressed XML to `path`.
+
+    Data goes to a `.part` sibling that replaces `path` only on commit, so a
+    failed download never leaves a truncated file behind.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp = path + '.part'
+        self._f = None
+
+    def open(self):
+        self._f = open(self._tmp, 'wb')
+
+    def write(self, data: bytes):
+        self._f.write(data)
+
+    def commit(self, result: dict):
+        if self._f:
+            self._f.close()
+            self._f = None
+            os.replace(self._tmp, self.path)
+
+    def abort(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+        _remove_quietly(self._tmp)
+
+
+def ingest_epg_stream(chunks, xml_path: str = None, progress=None, sinks=(), reference: str = None):
+    """Consume an EPG byte stream in one pass: detect gzip, decompress, parse and write it out.
+
+    - decompressed XML is written to `xml_path` (if given) and to every sink
+      in `sinks` (objects with open/write/commit(result)/abort, see XmlFileSink)
+    - decompressed chunks are fed to an `XmltvStreamParser`
+    - the SHA-256 of the raw bytes is computed on the way ('raw_sha256')
+    - `progress(raw_bytes, programmes)` is called after every chunk, if given
+
+    With `reference` (a plain or gzip file holding the content expected,
+    e.g. the previous download of the same URL) the stream is compared with
+    it and the sinks stay closed while both agree; at the first difference
+    they are opened and fed the matched part from `reference`. A stream equal
+    to `reference` writes nothing at all ('identical' in the result).
+    Returns the `parse_xmltv` result plus 'is_gz', 'raw_size', 'xml_size',
+    'raw_sha256' and 'identical'.
+    """
+    parser = XmltvStreamParser()
+    raw_sha256 = hashlib.sha256()
+    decompressor = None
+    is_gz = None
+    head = b''
+    raw_size = 0
+    xml_size = 0
+    sinks = list(sinks)
+    if xml_path:
+        sinks.insert(0, XmlFileSink(xml_path))
+    matcher = open_xml_file(reference) if reference and os.path.exists(reference) else None
+    matched = 0
+    opened = []
+
+    def open_sinks():
+        nonlocal matcher
+        if matcher:
+            matcher.close()
+            matcher = None
+        for sink in sinks:
+            sink.open()
+            opened.append(sink)
+        if matched:
+            # Replay the part that matched `reference`
+            with open_xml_file(reference) as f:
+                remaining = matched
+                while remaining:
+                    data = f.read(min(CHUNK_SIZE, remaining))
+                    if not data:
+                        raise OSError(f'{reference} changed during ingest')
+                    remaining -= len(data)
+                    for sink in opened:
+                        sink.write(data)
+
+    def emit(data):
+        nonlocal xml_size, matched
+        if not data:
+            return
+        xml_size += len(data)
+        parser.feed(data)
+        if matcher:
+            if matcher.read(len(data)) == data:
+                matched += len(data)
+                return
+            open_sinks()
+        for sink in opened:
+            sink.write(data)
+
     try:
-        for event, elem in ET.iterparse(io.StringIO(xml_text)):
-            if elem.tag == 'programme':
-                ch_id = (elem.get('channel', '') or '').strip()
-                if ch_id:
-                    key = ch_id.lower()
-                    counts[key] = counts.get(key, 0) + 1
-                elem.clear()
-        return counts
+        if not matcher:
+            open_sinks()
+        for chunk in chunks:
+            if not chunk:
+                continue
+            raw_size += len(chunk)
+            raw_sha256.update(chunk)
+            if is_gz is None:
+                # Need at least the two magic bytes before deciding
+                head += chunk
+                if len(head) < 2:
+                    continue
+                is_gz = detect_gzip_bytes(head)
+                decompressor = _GzipStreamDecompressor() if is_gz else None
+                chunk, head = head, b''
+            emit(decompressor.decompress(chunk) if decompressor else chunk)
+            if progress:
+                progress(raw_size, parser.programmes)
+        if is_gz is None:
+            # Stream shorter than two bytes
+            is_gz = False
+            emit(head)
+        if decompressor:
+            emit(decompressor.flush())
+        parser.close()
+        identical = bool(matcher) and matcher.read(1) == b''
+        if matcher and not identical:
+            # The stream is a prefix of `reference`
+            open_sinks()
+        result = parser.result()
+        result.update({'is_gz': bool(is_gz), 'raw_size': raw_size, 'xml_size': xml_size,
+                       'raw_sha256': raw_sha256.hexdigest(), 'identical': identical})
+        # Also sinks never opened: they learn the content hash of what they already hold
+        for sink in sinks:
+            sink.commit(result)
     except Exception:
-        return {}
+        for sink in opened:
+            sink.abort()
+        raise
+    finally:
+        if matcher:
+            matcher.close()
+    return result
 
 
 # -----------------------------
-# Cache metadata helpers
+# Parse snapshots (sidecar files)
 # -----------------------------
 
-def cache_metadata_path(epg_cache_dir: str) -> str:
-    return os.path.join(epg_cache_dir, 'metadata.json')
+SNAPSHOT_VERSION = 3
+SNAPSHOT_SUFFIX = '.snap'
 
 
-def load_cache_metadata(epg_cache_dir: str):
-    """Load cache metadata from JSON file in the given cache dir."""
-    metadata_file = cache_metadata_path(epg_cache_dir)
-    if os.path.exists(metadata_file):
-        try:
-            with open(metadata_file, 'r', encoding='utf-8') as f:
-                return json.load(f) or {}
-        except Exception:
-            return {}
-    return {}
+def snapshot_path(file_path: str) -> str:
+    return file_path + SNAPSHOT_SUFFIX
+
 
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter_file_chunks(f):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-def save_cache_metadata(epg_cache_dir: str, metadata: dict):
-    """Save cache metadata to JSON file in the given cache dir."""
-    metadata_file = cache_metadata_path(epg_cache_dir)
+
+def write_snapshot(file_path: str, result: dict, content_sha256: str):
+    """Store a parse result next to `file_path`, keyed by the file's content hash.
+
+    The sidecar is zlib-compressed JSON holding channels, programme counts,
+    channel fingerprints and coverage, stats and the hash of the decompressed
+    XML. Errors are swallowed; a missing snapshot only means the next load
+    parses again.
+    """
     try:
-        os.makedirs(epg_cache_dir, exist_ok=True)
-        with open(metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        st = os.stat(file_path)
+        payload = {
+            'version': SNAPSHOT_VERSION,
+            'sha256': content_sha256,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'is_gz': result.get('is_gz', False),
+            'xml_sha256': result.get('sha256'),
+            'stats': result.get('stats', {}),
+            'channels': result.get('channels', []),
+            'counts': result.get('counts', {}),
+            'fingerprints': result.get('fingerprints', {}),
+            'coverage': result.get('coverage', {}),
+        }
+        data = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6)
+        tmp = snapshot_path(file_path) + '.part'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, snapshot_path(file_path))
     except Exception:
-        # swallow errors; caller can log
         pass
 
 
-def add_to_cache(epg_cache_dir: str, filename: str, file_path: str):
-    """Register a file in cache metadata under the given cache dir."""
-    metadata = load_cache_metadata(epg_cache_dir)
-    if 'files' not in metadata:
-        metadata['files'] = {}
-    metadata['files'][filename] = {
-        'path': file_path,
-        'size': os.path.getsize(file_path) if os.path.exists(file_path) else 0,
-        'created': datetime.now().isoformat()
+def read_snapshot(file_path: str):
+    """Read the raw sidecar payload of `file_path` without verifying it, or None."""
+    try:
+        with open(snapshot_path(file_path), 'rb') as f:
+            payload = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        if payload.get('version') != SNAPSHOT_VERSION:
+            return None
+        return payload
+    except Exception:
+        return None
+
+
+def load_snapshot(file_path: str):
+    """Return the parse result stored for `file_path` if it still matches its content.
+
+    Size and mtime unchanged means the recorded hash is trusted; otherwise the
+    file is re-hashed and compared. Returns a dict shaped like the
+    `parse_xmltv` result (plus 'is_gz' and 'raw_sha256'), or None.
+    """
+    payload = read_snapshot(file_path)
+    if not payload:
+        return None
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    if (st.st_size, st.st_mtime_ns) != (payload.get('size'), payload.get('mtime_ns')):
+        if file_sha256(file_path) != payload.get('sha256'):
+            return None
+    return {
+        'channels': payload.get('channels', []),
+        'counts': payload.get('counts', {}),
+        'fingerprints': payload.get('fingerprints', {}),
+        'coverage': payload.get('coverage', {}),
+        'stats': payload.get('stats', {}),
+        'sha256': payload.get('xml_sha256'),
+        'raw_sha256': payload.get('sha256'),
+        'is_gz': payload.get('is_gz', False),
+        'error': None,
+    }
+
+
+def remove_snapshot(file_path: str):
+    _remove_quietly(snapshot_path(file_path))
+
+
+# -----------------------------
+# EPG deltas
+# -----------------------------
+
+def diff_fingerprints(old: dict, new: dict) -> dict:
+    """Compare the channel fingerprints of two EPG loads (see XmltvStreamParser.result).
+
+    Returns sorted channel id lists 'added', 'removed', 'changed' (programme
+    count or checksum differs) and 'shrunk' (changed channels whose schedule
+    now ends earlier or that lost all programmes), plus the 'unchanged' count.
+    Costs one dict lookup per channel, no parsing.
+    """
+    added = sorted(key for key in new if key not in old)
+    removed = sorted(key for key in old if key not in new)
+    changed = []
+    shrunk = []
+    unchanged = 0
+    for key, fp in new.items():
+        before = old.get(key)
+        if before is None:
+            continue
+        if before[0] == fp[0] and before[3] == fp[3]:
+            unchanged += 1
+            continue
+        changed.append(key)
+        if before[0] and (not fp[0] or (before[2] is not None and fp[2] is not None and fp[2] < before[2])):
+            shrunk.append(key)
+    changed.sort()
+    shrunk.sort()
+    return {'added': added, 'removed': removed, 'changed': changed, 'shrunk': shrunk, 'unchanged': unchanged}
+
+
+def coverage_summary(coverage, last_stop, now: int, days: int = 7) -> dict:
+    """Freshness of one channel at `now` from its parse-time coverage ([[day, covered, gap], ...]).
+
+    Returns 'horizon_hours' (how far ahead the schedule reaches),
+    'coverage_hours' (hours covered on each of the next `days` UTC days,
+    today first) and 'max_gap_minutes' (largest gap starting today or later).
+    """
+    today = now // DAY_SECONDS
+    by_day = {entry[0]: entry for entry in coverage}
+    hours = [round(min(by_day[day][1], DAY_SECONDS) / 3600, 1) if day in by_day else 0.0
+             for day in range(today, today + days)]
+    max_gap = max((entry[2] for entry in coverage if entry[0] >= today), default=0)
+    return {
+        'last_stop': last_stop,
+        'horizon_hours': round(max(0, last_stop - now) / 3600, 1) if last_stop is not None else None,
+        'coverage_hours': hours,
+        'max_gap_minutes': round(max_gap / 60),
     }
-    save_cache_metadata(epg_cache_dir, metadata)